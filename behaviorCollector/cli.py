@@ -0,0 +1,274 @@
+"""Headless batch commands: epoch extraction, format conversion, statistics and manifests.
+
+Runs without PyQt or a display, e.g. on compute nodes:
+
+    collect_behavior_batch extract data/mouse01 -o clips/mouse01 --workers 4
+    collect_behavior_batch convert data/mouse01 sessions/mouse01.bcs
+    collect_behavior_batch stats data/mouse* -o stats.csv
+    collect_behavior_batch run manifest.txt --jobs 8
+
+A session is an annotation directory, a .bcs session file or `store.sqlite#session`.
+"""
+import argparse
+import os
+import shlex
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from functools import partial
+from typing import List
+from tqdm import tqdm
+
+from .processing.behav_container import load_behav_set
+from .processing.behav_store import is_store_file, session_names, BehavStore
+from .processing.behav_session import is_session_file, save_session
+
+
+STORE_SEP = "#" # store.sqlite#session
+
+
+@dataclass
+class Session:
+    """Behaviors and videos of one saved session, stands in for BehavCollector outside the GUI."""
+    name: str
+    behav_set: List = field(default_factory=list)
+    video_path: List = field(default_factory=list)
+
+    @property
+    def num(self):
+        return len(self.behav_set)
+
+
+def _split_store(path: str):
+    if STORE_SEP in path and is_store_file(path.split(STORE_SEP)[0]):
+        return path.split(STORE_SEP, 1)
+    return path, None
+
+
+def name_sessions(paths):
+    """(path, name) of the sessions at paths, named apart when their names collide (see session_names)."""
+    locations = []
+    for path in paths:
+        path, session = _split_store(path)
+        location = os.path.splitext(os.path.normpath(path))[0]
+        locations.append(os.path.join(location, session) if session is not None else location)
+    return list(zip(paths, session_names(locations)))
+
+
+def open_session(path: str, video_dir: str = None, name: str = None):
+    """Session saved at path; with video_dir, videos are looked up there by file name."""
+    path, session = _split_store(path)
+    behav_set = load_behav_set(path, session=session)
+    if not behav_set:
+        raise ValueError(f"No behavior data found in {path}")
+
+    video_path = next((list(b.video_path) for b in behav_set if b.video_path), [])
+    if video_dir is not None:
+        video_path = [os.path.join(video_dir, os.path.basename(p)) if p else p for p in video_path]
+    for b in behav_set:
+        b.update_video_path(video_path)
+    name = name or session or os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+    return Session(name=name, behav_set=behav_set, video_path=video_path)
+
+
+def _progress(args):
+    return partial(tqdm, disable=True) if args.quiet else tqdm
+
+
+def _output_dir(args, session, num_sessions):
+    path_dir = os.path.join(args.output, session.name) if num_sessions > 1 else args.output
+    os.makedirs(path_dir, exist_ok=True)
+    return path_dir
+
+
+def _ensure_parent(file_name):
+    parent = os.path.dirname(file_name)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+
+
+def cmd_extract(args):
+    from .processing.behav_extractor import BehavExtractor
+    for path, name in name_sessions(args.sessions):
+        session = open_session(path, video_dir=args.video_dir, name=name)
+        selections = None
+        if args.behaviors:
+            names = [b.name for b in session.behav_set]
+            missing = [name for name in args.behaviors if name not in names]
+            if missing:
+                raise ValueError(f"Behaviors {missing} are not in {path}")
+            selections = {names.index(name): None for name in args.behaviors}
+
+        extractor = BehavExtractor(session, build_index=args.build_index)
+        extractor.extract_epochs(_output_dir(args, session, len(args.sessions)), tqdm_fn=_progress(args),
+                                 selections=selections, single_pass=not args.per_behavior,
+                                 num_workers=args.workers)
+        print(f"{session.name}: {extractor.stats}")
+    return 0
+
+
+def cmd_convert(args):
+    session = open_session(args.source)
+    target = args.target
+    if is_session_file(target):
+        _ensure_parent(target)
+        save_session(session, target)
+    elif is_store_file(target):
+        _ensure_parent(target)
+        with BehavStore(target) as store:
+            store.save(session, args.session or session.name, cohort=args.cohort)
+    else:
+        os.makedirs(target, exist_ok=True)
+        if any(os.scandir(target)):
+            raise ValueError(f"Directory {target} is not empty")
+        for b in session.behav_set:
+            b.save(target)
+    print(f"{args.source} -> {target} ({session.num} behaviors)")
+    return 0
+
+
+def cmd_stats(args):
+    from .processing.behav_analytics import behavior_stats, save_table
+    sessions = {}
+    for path, name in name_sessions(args.sessions):
+        session = open_session(path, name=name)
+        sessions[session.name] = session.behav_set
+    stats = behavior_stats(sessions)
+    if args.output:
+        _ensure_parent(args.output)
+        save_table(stats, args.output)
+        print(f"Wrote {len(stats)} rows to {args.output}")
+    else:
+        print(",".join(stats.dtype.names))
+        for row in stats.tolist():
+            print(",".join(f"{v:.1f}" if isinstance(v, float) else str(v) for v in row))
+    return 0
+
+
+def cmd_labels(args):
+    from .processing.behav_labels import export_labels
+    for path, name in name_sessions(args.sessions):
+        session = open_session(path, video_dir=args.video_dir, name=name)
+        written = export_labels(session, _output_dir(args, session, len(args.sessions)))
+        print(f"{session.name}: {len(written)} label files")
+    return 0
+
+
+def cmd_agreement(args):
+    from .processing.behav_agreement import find_video_sets, compare_sets, agreement_table
+    from .processing.behav_analytics import save_table
+    video_sets = find_video_sets(args.raters)
+    if not video_sets:
+        raise ValueError("The rater directories have no video set in common")
+    results = compare_sets(list(video_sets.values()), num_workers=args.workers,
+                           tolerance_ms=args.tolerance_ms, fps=args.fps, tqdm_fn=_progress(args))
+    table = agreement_table(results, names=list(video_sets))
+    _ensure_parent(args.output)
+    save_table(table, args.output)
+    print(f"Compared {sum(r is not None for r in results)}/{len(results)} video sets, wrote {args.output}")
+    return 0
+
+
+def read_manifest(file_name: str):
+    """Command lines of a manifest, one per line; blank lines and # comments are skipped."""
+    tasks = []
+    with open(file_name, "r") as f:
+        for line in f:
+            argv = shlex.split(line, comments=True)
+            if not argv:
+                continue
+            if argv[0] == "run":
+                raise ValueError("A manifest cannot run another manifest")
+            tasks.append(argv)
+    return tasks
+
+
+def _run_task(argv):
+    # runs in a worker process, returns (exit code, error message)
+    try:
+        return main(["--quiet"] + argv, raise_errors=True), ""
+    except SystemExit as e:
+        return (e.code if isinstance(e.code, int) else 1), "invalid arguments"
+    except Exception as e:
+        return 1, f"{type(e).__name__}: {e}"
+
+
+def cmd_run(args):
+    tasks = read_manifest(args.manifest)
+    parser = build_parser()
+    for argv in tasks:
+        parser.parse_args(argv) # fail before starting anything
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(_run_task, argv): argv for argv in tasks}
+        for f in tqdm(as_completed(futures), total=len(futures), desc="Manifest", disable=args.quiet):
+            code, message = f.result()
+            if code != 0:
+                failed += 1
+                print(f"Failed: {shlex.join(futures[f])}: {message}", file=sys.stderr)
+    print(f"{len(tasks) - failed}/{len(tasks)} tasks done")
+    return 1 if failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="collect_behavior_batch", description=__doc__.splitlines()[0])
+    parser.add_argument("--quiet", action="store_true", help="no progress bars")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("extract", help="export clips of States and snapshots of Events")
+    p.add_argument("sessions", nargs="+")
+    p.add_argument("-o", "--output", required=True, help="output directory, one sub-directory per session")
+    p.add_argument("--behaviors", nargs="+", help="names of the behaviors to export (default: all)")
+    p.add_argument("--workers", type=int, default=1, help="processes per session")
+    p.add_argument("--per-behavior", action="store_true", help="seek once per epoch instead of one pass per video")
+    p.add_argument("--build-index", action="store_true", help="index the frames of each video first")
+    p.add_argument("--video-dir", help="look the videos up by file name in this directory")
+    p.set_defaults(fn=cmd_extract)
+
+    p = commands.add_parser("convert", help="convert between directory, .bcs and .sqlite formats")
+    p.add_argument("source")
+    p.add_argument("target", help="directory, .bcs file or .sqlite store")
+    p.add_argument("--session", help="session name in a store (default: source name)")
+    p.add_argument("--cohort")
+    p.set_defaults(fn=cmd_convert)
+
+    p = commands.add_parser("stats", help="bout statistics per session and behavior")
+    p.add_argument("sessions", nargs="+")
+    p.add_argument("-o", "--output", help="CSV file (default: print)")
+    p.set_defaults(fn=cmd_stats)
+
+    p = commands.add_parser("labels", help="export frame label matrices")
+    p.add_argument("sessions", nargs="+")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--video-dir", help="look the videos up by file name in this directory")
+    p.set_defaults(fn=cmd_labels)
+
+    p = commands.add_parser("agreement", help="inter-rater agreement of rater directory trees")
+    p.add_argument("raters", nargs="+", help="one directory per rater, one sub-directory per video set")
+    p.add_argument("-o", "--output", required=True, help="CSV file")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--tolerance-ms", type=float, default=500)
+    p.add_argument("--fps", type=float, default=None, help="frame grid when the videos are not available")
+    p.set_defaults(fn=cmd_agreement)
+
+    p = commands.add_parser("run", help="run the commands of a manifest file concurrently")
+    p.add_argument("manifest", help="one command per line, e.g. `extract data/m01 -o clips/m01`")
+    p.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="commands run at the same time")
+    p.set_defaults(fn=cmd_run)
+    return parser
+
+
+def main(argv=None, raise_errors=False):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.fn(args)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        if raise_errors:
+            raise
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,12 +5,14 @@ from PyQt5.QtWidgets import (
     QFormLayout, QPushButton, QLineEdit, QLabel,
     QScrollArea, QGraphicsLineItem, QSizePolicy,
     QFileDialog, QGraphicsTextItem,
-    QMessageBox, QDialog, QCheckBox
+    QMessageBox, QDialog, QCheckBox, QSpinBox, QDoubleSpinBox, QProgressBar
 )
 
 from PyQt5.QtCore import Qt, pyqtSignal, QLineF, QRectF
 from PyQt5.QtGui import QPen, QColor, QKeySequence, QFont, QPainter
 from collections import OrderedDict
+import os
+import threading
 
 
 pyqt_KEY_MAP = OrderedDict({  
@@ -42,8 +44,10 @@ from .behav_viewer import BehavViewer
 from .utils_gui import ColorPicker, tqdm_qt, error2messagebox
 from .config_menu import MenuBuilder
 
-from ..processing.behav_container import BehavCollector, BEHAV_TYPES, EVENT, STATE
+from ..processing.behav_container import BehavCollector, BEHAV_TYPES, EVENT, STATE, load_behav_set
 from ..processing.behav_extractor import BehavExtractor
+from ..processing.behav_session import SESSION_SUFFIX
+from ..processing.behav_labels import export_labels, frame_times
 import re
 
 
@@ -51,6 +55,20 @@ CURRENT_KEY_ID = 0
 KEEP_TIME_MS = []
 LAST_ACTIVE_KEY = []        
         
+
+class _ExportBar:
+    # progress bar handed to the export thread, shown by a tqdm_qt dialog in the GUI thread
+    def __init__(self, panel, total=0, desc="", **kwargs):
+        self.panel = panel
+        panel.signal_export_bar.emit(total, desc)
+
+    def update(self, n=1):
+        self.panel.signal_export_progress.emit(n)
+
+    def close(self):
+        pass
+
+        
 class BehavItemRow(QPushButton):
     
     clicked_with_key = pyqtSignal(int)
@@ -126,6 +144,19 @@ class BehaviorSelectionDialog(QDialog):
         scroll_area.setWidget(scroll_content)
         layout.addWidget(scroll_area)
 
+        self.check_single_pass = QCheckBox("Decode each video in a single pass (faster for many epochs)")
+        self.check_single_pass.setChecked(True)
+        layout.addWidget(self.check_single_pass)
+
+        worker_row = QHBoxLayout()
+        self.spin_workers = QSpinBox()
+        self.spin_workers.setRange(1, os.cpu_count() or 1)
+        self.spin_workers.setValue(1)
+        worker_row.addWidget(QLabel("Worker processes"))
+        worker_row.addWidget(self.spin_workers)
+        worker_row.addStretch()
+        layout.addLayout(worker_row)
+
         button_row = QHBoxLayout()
         self.button_select_all = QPushButton("Select All")
         self.button_clear_all = QPushButton("Clear All")
@@ -173,11 +204,104 @@ class BehaviorSelectionDialog(QDialog):
                 selections[behav_idx] = None
         return selections
 
+    def use_single_pass(self):
+        return self.check_single_pass.isChecked()
+
+    def num_workers(self):
+        return self.spin_workers.value()
+
+
+class EpochTransformDialog(QDialog):
+    """Dialog for one bulk operation on the epochs of one or all behaviors."""
+
+    # op -> (label, [(parameter, caption, default, is_float)])
+    OPERATIONS = OrderedDict({
+        "shift": ("Shift", [("offset_ms", "Offset (ms)", 0, False)]),
+        "scale": ("Rescale", [("factor", "Factor", 1, True), ("origin_ms", "Around (ms)", 0, False)]),
+        "clip": ("Clip", [("start_ms", "From (ms)", 0, False), ("end_ms", "To (ms)", 0, False)]),
+        "snap": ("Snap to video frames", []),
+        "merge_gaps": ("Merge State bouts closer than", [("max_gap_ms", "Gap (ms)", 500, False)]),
+        "drop_short": ("Drop State bouts shorter than", [("min_ms", "Duration (ms)", 200, False)])
+    })
+
+    def __init__(self, bcollector: BehavCollector, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Transform Epochs")
+        self.setMinimumWidth(350)
+
+        layout = QFormLayout()
+        self.combo_behav = QComboBox()
+        self.combo_behav.addItem("All behaviors")
+        for b in bcollector.behav_set:
+            self.combo_behav.addItem(f"{b.name} ({b.type})")
+        layout.addRow("Behavior", self.combo_behav)
+
+        self.combo_op = QComboBox()
+        for op, (label, _) in self.OPERATIONS.items():
+            self.combo_op.addItem(label, op)
+        layout.addRow("Operation", self.combo_op)
+
+        self.labels, self.spins = [], []
+        for _ in range(2):
+            label, spin = QLabel(), QDoubleSpinBox()
+            spin.setRange(-1e9, 1e9)
+            layout.addRow(label, spin)
+            self.labels.append(label)
+            self.spins.append(spin)
+        self.combo_op.currentIndexChanged.connect(self._update_params)
+        self._update_params()
+
+        button_row = QHBoxLayout()
+        button_apply = QPushButton("Apply")
+        button_cancel = QPushButton("Cancel")
+        button_apply.clicked.connect(self.accept)
+        button_cancel.clicked.connect(self.reject)
+        button_row.addStretch()
+        button_row.addWidget(button_cancel)
+        button_row.addWidget(button_apply)
+        layout.addRow(button_row)
+        self.setLayout(layout)
+
+    def _update_params(self):
+        _, params = self.OPERATIONS[self.op]
+        for n, (label, spin) in enumerate(zip(self.labels, self.spins)):
+            visible = n < len(params)
+            label.setVisible(visible)
+            spin.setVisible(visible)
+            if visible:
+                _, caption, default, is_float = params[n]
+                label.setText(caption)
+                spin.setDecimals(4 if is_float else 0)
+                spin.setValue(default)
+
+    @property
+    def op(self):
+        return self.combo_op.currentData()
+
+    def behav_ids(self):
+        n = self.combo_behav.currentIndex()
+        return None if n == 0 else [n - 1]
+
+    def params(self):
+        _, params = self.OPERATIONS[self.op]
+        return {
+            name: spin.value() if is_float else int(spin.value())
+            for (name, _, _, is_float), spin in zip(params, self.spins)
+        }
+
 
 class BehavPanel(QWidget):
     
     signal_add_line = pyqtSignal(int, str, int, int) # key_id, color code, time_ms_start, time_ms_end
     signal_saved = pyqtSignal()
+    # behaviors read by the loading thread, delivered in the GUI thread
+    signal_headers_read = pyqtSignal(object) # behaviors without their epochs
+    signal_epochs_read = pyqtSignal(str, object, object) # behavior name, starts, ends
+    signal_load_done = pyqtSignal(str) # error message, empty on success
+    # progress of the export thread
+    signal_export_bar = pyqtSignal(int, str) # total, description of a new progress bar
+    signal_export_progress = pyqtSignal(int)
+    signal_export_done = pyqtSignal(str) # error message, empty on success
     
     def __init__(self):
         super().__init__()
@@ -188,6 +312,15 @@ class BehavPanel(QWidget):
         self.is_modifying = False
         self.current_selection = -1
         self.duration_ms = 0
+        self.loading = None # behaviors whose epochs are still being read, by the name they were saved with
+        self.signal_headers_read.connect(self._on_headers_read)
+        self.signal_epochs_read.connect(self._on_epochs_read)
+        self.signal_load_done.connect(self._on_load_done)
+        self.extractor = None # BehavExtractor while epochs are being exported
+        self.export_bar = None
+        self.signal_export_bar.connect(self._on_export_bar)
+        self.signal_export_progress.connect(self._on_export_progress)
+        self.signal_export_done.connect(self._on_export_done)
         # self._reset_keep()
         
     def _init_ui(self):
@@ -236,6 +369,10 @@ class BehavPanel(QWidget):
 
         self.scroll_area.setWidget(self.scroll_widget)
         layout_v2.addWidget(self.scroll_area, stretch=7)
+        self.load_progress = QProgressBar()
+        self.load_progress.setFormat("Loading epochs %v/%m")
+        self.load_progress.setVisible(False)
+        layout_v2.addWidget(self.load_progress)
         self.behav_rows = []
         
         layout.addLayout(layout_v2)
@@ -246,14 +383,21 @@ class BehavPanel(QWidget):
         menubar.load_behav_requested.connect(self.load_behavior)
         menubar.save_header_requested.connect(self.export_behavior_header)
         menubar.save_behav_requested.connect(self.export_behavior)
+        menubar.load_session_requested.connect(self.load_behavior_session)
+        menubar.save_session_requested.connect(self.export_behavior_session)
         menubar.export_epochs_requested.connect(self.export_epochs)
+        menubar.export_labels_requested.connect(self.export_frame_labels)
+        menubar.transform_epochs_requested.connect(self.transform_epochs)
+        menubar.undo_epochs_requested.connect(self.undo_epochs)
         
     def connect_controller(self, video_control_obj: Controller):
         self.video_controller = video_control_obj
         self.video_controller.duration_updated.connect(self._update_duration)
         
     def connect_behav_viewer(self, behave_viewer_obj: BehavViewer):
-        self.behav_viewer = behave_viewer_obj        
+        # the viewer draws the collector itself, the panel only changes the collector
+        self.behav_viewer = behave_viewer_obj
+        self.behav_viewer.bind(BehavCollector())
     
     @error2messagebox(to_warn=True)
     def add_behav(self, checked=False):
@@ -280,10 +424,11 @@ class BehavPanel(QWidget):
                 if row.isChecked():
                     break
                 
-            self.bcollector.set_value(bid, "name", name)
-            self.bcollector.set_value(bid, "type", type)
-            self.bcollector.set_value(bid, "note", note)
-            self.bcollector.set_value(bid, "color_code", color_hex)
+            with self.bcollector.notifier.batch():
+                self.bcollector.set_value(bid, "name", name)
+                self.bcollector.set_value(bid, "type", type)
+                self.bcollector.set_value(bid, "note", note)
+                self.bcollector.set_value(bid, "color_code", color_hex)
             row.modify_info(type, name, color_hex)
             
             self.button_add.setText("Add Behavior")
@@ -369,28 +514,85 @@ class BehavPanel(QWidget):
             # if self.bcollector is not None:
             #     raise ValueError("Behavior collector already loaded. Please create a new instance.")
             
-            if self.video_controller.num_video == 0:
-                raise ValueError("Please load the video first")
-
-            self.bcollector = BehavCollector.load(path_dir)
-            if self.bcollector.num == 0:
-                self.bcollector = None
+            self._load_behavior(path_dir)
+            
+    @error2messagebox(to_warn=True)
+    def load_behavior_session(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Behavior session", "", f"Behavior sessions (*{SESSION_SUFFIX})")
+        if file_path:
+            self._load_behavior(file_path)
+            
+    def _load_behavior(self, path):
+        if self.video_controller.num_video == 0:
+            raise ValueError("Please load the video first")
+        self._check_loaded()
+
+        # files are read in the background, the behavior list is usable once the headers are in
+        self.loading = {}
+        self.load_progress.setRange(0, 0)
+        self.load_progress.setVisible(True)
+        threading.Thread(target=self._read_behaviors, args=(path,), daemon=True).start()
+
+    def _read_behaviors(self, path):
+        # runs in the loading thread, the GUI only gets copies so lazy columns are never shared
+        try:
+            behav_set = load_behav_set(path)
+            if not behav_set:
                 raise ValueError("No behavior data found in the selected directory.")
-                
-            self._add_behav_set()
-            for n in range(self.bcollector.num):
-                for time_ms in self.bcollector.get_value(n, "time_ms"):
-                    self._add_behav_time(n, time_ms, add_to_collector=False)    
+            self.signal_headers_read.emit([b.header() for b in behav_set])
+            sent = set()
+            for b in behav_set:
+                if b.name in sent:
+                    continue
+                sent.add(b.name)
+                if b.num > 0:
+                    self.signal_epochs_read.emit(b.name, b.time_ms.starts.copy(), b.time_ms.ends.copy())
+                else:
+                    self.signal_epochs_read.emit(b.name, None, None)
+        except Exception as e:
+            self.signal_load_done.emit(str(e) or type(e).__name__)
+            return
+        self.signal_load_done.emit("")
+
+    def _on_headers_read(self, headers):
+        existing = {b.name for b in BehavCollector().behav_set}
+        for b in headers:
+            if b.name not in existing and b.name not in self.loading:
+                self.loading[b.name] = b # the object kept by the collector, still found once renamed
+        self.bcollector = BehavCollector.from_behav_set(headers)
+        self._add_behav_set()
+        self.load_progress.setRange(0, len(self.loading))
+        self.load_progress.setValue(0)
+
+    def _on_epochs_read(self, name, starts, ends):
+        if not self.loading or name not in self.loading:
+            return
+        behav = self.loading.pop(name)
+        self.load_progress.setValue(self.load_progress.value() + 1)
+        # the behavior may have been removed from the list in the meantime
+        key_id = next((n for n, b in enumerate(self.bcollector.behav_set) if b is behav), None)
+        if starts is not None and key_id is not None:
+            self.bcollector.attach_epochs(key_id, starts, ends)
 
-            self._compare_item_number()
-    
-    def _compare_item_number(self):
-        # double-check if the number of items in behav_viewer matches the bcollector
-        for n in range(self.bcollector.num):
-            if self.bcollector.behav_set[n].num != self.behav_viewer.num_items[n]:
-                raise ValueError(f"Behavior {n} is not loaded correctly (%d/%d). Please check the data."%(
-                    self.bcollector.behav_set[n].num, self.behav_viewer.num_items[n]
-                ))
+    @error2messagebox(to_warn=True)
+    def _on_load_done(self, error):
+        self.loading = None
+        self.load_progress.setVisible(False)
+        if self.bcollector is not None and self.bcollector.journal is not None:
+            # attached epochs are not journaled one by one, checkpoint them even after a failed load
+            self.bcollector.journal.compact()
+        if error:
+            raise ValueError(error)
+
+    def _check_loaded(self):
+        if self.loading is not None:
+            raise ValueError("Please wait until the behaviors being loaded are ready")
+        
+    @error2messagebox(to_warn=True)
+    def recover_journal(self, journal, sid):
+        self.bcollector = BehavCollector()
+        journal.recover(sid)
+        self._add_behav_set()
     
     @error2messagebox(to_warn=True)
     def load_behavior_header(self):
@@ -404,6 +606,7 @@ class BehavPanel(QWidget):
     
     @error2messagebox(to_warn=True)
     def export_behavior_header(self):
+        self._check_loaded()
         file_path, _ = QFileDialog.getSaveFileName(self, "Behavior header", "", "Behavior headers (*.json)")
         if file_path:
             if self.bcollector.save_header(file_path):
@@ -411,6 +614,7 @@ class BehavPanel(QWidget):
     
     @error2messagebox(to_warn=True)
     def export_behavior(self):
+        self._check_loaded()
         path_dir = QFileDialog.getExistingDirectory(self, "Select behavior directory")
         if path_dir:
             self.bcollector.update_video_path(self.video_controller.current_video_path)
@@ -418,8 +622,23 @@ class BehavPanel(QWidget):
                 self.signal_saved.emit()
                 QMessageBox.information(self, "Success", "Behavior data saved successfully.")
     
+    @error2messagebox(to_warn=True)
+    def export_behavior_session(self):
+        self._check_loaded()
+        file_path, _ = QFileDialog.getSaveFileName(self, "Behavior session", "", f"Behavior sessions (*{SESSION_SUFFIX})")
+        if file_path:
+            if not file_path.endswith(SESSION_SUFFIX):
+                file_path += SESSION_SUFFIX
+            self.bcollector.update_video_path(self.video_controller.current_video_path)
+            if self.bcollector.save(file_path):
+                self.signal_saved.emit()
+                QMessageBox.information(self, "Success", "Behavior session saved successfully.")
+    
     @error2messagebox(to_warn=True)
     def export_epochs(self):
+        self._check_loaded()
+        if self.extractor is not None:
+            raise ValueError("Please wait until the epochs being exported are written")
         if self.bcollector is None or self.bcollector.num == 0:
             raise ValueError("No behavior data to export. Please load or create behaviors first.")
 
@@ -437,10 +656,75 @@ class BehavPanel(QWidget):
         path_dir = QFileDialog.getExistingDirectory(self, "Select export directory")
         if path_dir:
             self.bcollector.update_video_path(self.video_controller.current_video_path)
-            extractor = BehavExtractor(self.bcollector)
-            if extractor.extract_epochs(path_dir, selections=selections, tqdm_fn=tqdm_qt):
-                QMessageBox.information(self, "Success", "Selected behavior epochs exported successfully.")
+            # decoded in the background, the progress dialog keeps the GUI responsive and blocks edits meanwhile
+            self.extractor = BehavExtractor(self.bcollector)
+            kwargs = dict(selections=selections, single_pass=dialog.use_single_pass(), num_workers=dialog.num_workers())
+            threading.Thread(target=self._export_epochs, args=(path_dir, kwargs), daemon=True).start()
+
+    def _export_epochs(self, path_dir, kwargs):
+        # runs in the export thread
+        try:
+            self.extractor.extract_epochs(path_dir, tqdm_fn=lambda **bar: _ExportBar(self, **bar), **kwargs)
+        except Exception as e:
+            self.signal_export_done.emit(str(e) or type(e).__name__)
+            return
+        self.signal_export_done.emit("")
+
+    def _close_export_bar(self):
+        if self.export_bar is not None:
+            self.export_bar.close()
+            self.export_bar.deleteLater()
+            self.export_bar = None
+
+    def _on_export_bar(self, total, desc):
+        self._close_export_bar()
+        self.export_bar = tqdm_qt(total=total, desc=desc)
+
+    def _on_export_progress(self, n):
+        if self.export_bar is not None:
+            self.export_bar.update(n)
+
+    @error2messagebox(to_warn=True)
+    def _on_export_done(self, error):
+        self._close_export_bar()
+        extractor, self.extractor = self.extractor, None
+        if error:
+            raise ValueError(error)
+        QMessageBox.information(self, "Success", f"Selected behavior epochs exported successfully.\n{extractor.stats}")
+
+    @error2messagebox(to_warn=True)
+    def export_frame_labels(self):
+        self._check_loaded()
+        if self.bcollector is None or self.bcollector.num == 0:
+            raise ValueError("No behavior data to export. Please load or create behaviors first.")
+
+        path_dir = QFileDialog.getExistingDirectory(self, "Select export directory")
+        if path_dir:
+            self.bcollector.update_video_path(self.video_controller.current_video_path)
+            written = export_labels(self.bcollector, path_dir)
+            QMessageBox.information(self, "Success", f"Frame labels of {len(written)} videos exported successfully.")
         
+    @error2messagebox(to_warn=True)
+    def transform_epochs(self):
+        if self.bcollector is None or self.bcollector.num == 0:
+            raise ValueError("No behavior data to transform. Please load or create behaviors first.")
+
+        dialog = EpochTransformDialog(self.bcollector, parent=self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        params = dialog.params()
+        if dialog.op == "snap":
+            if self.video_controller.num_video == 0:
+                raise ValueError("Please load the video first")
+            params["pts_ms"] = frame_times(self.video_controller.current_video_path[0])
+        self.bcollector.transform_epochs(dialog.op, behav_ids=dialog.behav_ids(), **params)
+
+    @error2messagebox(to_warn=True)
+    def undo_epochs(self):
+        if self.bcollector is None:
+            return
+        self.bcollector.undo_epochs()
+
     def _add_behav_set(self):
         existing_keys = [b.behav_key for b in self.behav_rows]
         for n in range(self.bcollector.num):
@@ -467,22 +751,9 @@ class BehavPanel(QWidget):
         self.text_note.clear()
         self.color_picker.setColor(QColor(255,255,255))
         
-    def _add_behav_time(self, key_id, time_ms, add_to_collector=True):
-        if add_to_collector:
-            # TODO: synchronize behavior time rather than updating each time
-            self.bcollector.add_behav_time(key_id, time_ms) 
-            
-        if not isinstance(time_ms, list):
-            _time_ms = [time_ms, time_ms+1]
-        else:
-            _time_ms = time_ms
-        
-        self.behav_viewer.add_item(key_id, 
-            self.bcollector.get_color(key_id),
-            _time_ms[0], _time_ms[1])
-        
-        if add_to_collector:
-            self._compare_item_number() # check
+    def _add_behav_time(self, key_id, time_ms):
+        # the timeline is notified by the collector
+        self.bcollector.add_behav_time(key_id, time_ms)
     
     def _keep_behav_time(self, key_id):
         if key_id >= CURRENT_KEY_ID:
@@ -538,9 +809,7 @@ class BehavPanel(QWidget):
         raise ValueError("Deprecated")
         
     def _delete_behav(self, time_ms):
-        # TODO: tracking both bcollector and behavior viewer is dangerous.
         self.bcollector.delete_behav_time(time_ms)
-        self.behav_viewer.delete_item(time_ms)
         
     def _update_duration(self, duration_ms):
         self.duration_ms = duration_ms
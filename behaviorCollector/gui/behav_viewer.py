@@ -1,16 +1,41 @@
 from PyQt5.QtWidgets import (
     QGraphicsLineItem, QGraphicsView, QGraphicsScene, QSizePolicy, QGraphicsTextItem,
-    QHBoxLayout, QPushButton, QLabel
+    QHBoxLayout, QPushButton, QLabel, QGraphicsItem, QWidget
 )
-from PyQt5.QtGui import QPen, QColor, QFont, QPainter
+from PyQt5.QtGui import QPen, QColor, QFont, QPainter, QPainterPath, QImage
 from PyQt5.QtCore import Qt, QRectF, QLineF, pyqtSignal
-from collections import defaultdict
+from collections import Counter
+import numpy as np
 
 from .behav_panel import pyqt_KEY_MAP
 from .video_controller import Controller
+from ..processing.epoch_index import EpochIndex
+from ..processing.epoch_ops import merge_gaps
+from ..processing.behav_analytics import occupancy
+from ..processing.behav_container import EVENT, EVENT_SPAN_MS
+from ..processing.behav_events import EPOCH_CHANGES, BEHAVIOR_REMOVED, BEHAVIORS_RESET
 
 NUM_TICKS = 5
 MAX_KEY = len(pyqt_KEY_MAP) - 2
+WINDOW_MARGIN = 1 # visible windows rendered ahead on each side, so small moves reuse the lines
+RENDER_LINES = "lines" # one line item per epoch
+RENDER_PATHS = "paths" # one cached path per behavior row and tile
+RENDER_MODES = (RENDER_LINES, RENDER_PATHS)
+HIT_TOLERANCE_PX = 3 # clicks this close to an epoch rewind to it
+MIN_SHOW_MS = 40 # narrowest window, about one frame
+DENSITY_SHOW_MS = 60e3 # wider windows show the density of each row instead of its epochs
+DENSITY_BINS = 512 # density bins per window, rounded to a power of two in ms
+DENSITY_MIN_ALPHA = 48 # bins with any epoch stay visible
+ZOOM_STEP = 1.25 # per wheel notch
+PAN_STEP = 0.1 # share of the window per wheel notch with Shift
+MINIMAP_HEIGHT = 24
+
+
+def _epoch_pen(color: str):
+    # width in pixels whatever the zoom
+    pen = QPen(QColor(color), 2)
+    pen.setCosmetic(True)
+    return pen
 
 
 class BehavLine(QGraphicsLineItem):
@@ -24,7 +49,16 @@ class BehavLine(QGraphicsLineItem):
 
         self.setAcceptHoverEvents(True)
         self.setFlag(QGraphicsLineItem.ItemIsSelectable)
-        self.setPen(QPen(QColor(color), 2))
+        self.setPen(_epoch_pen(color))
+
+    def reset(self, key_id, color: str, time_ms_start, time_ms_end):
+        # recycled for another epoch
+        self.key_id = key_id
+        self.time_ms_start = time_ms_start
+        self.time_ms_end = time_ms_end
+        if color != self.color:
+            self.color = color
+            self.setPen(_epoch_pen(color))
     
     def update_position(self, scene_width, scene_height, duration_ms):
         x1 = (self.time_ms_start / duration_ms) * scene_width
@@ -38,10 +72,88 @@ class BehavLine(QGraphicsLineItem):
     def mousePressEvent(self, event):
         if self.rewind is not None:
             self.rewind(self.time_ms_start)
-            
-            
+
+
+
+class BehavTile(QGraphicsItem):
+    """Every behavior row of the time range [time_ms_start, time_ms_end), one path per row.
+
+    Paths are built on the first paint after a row changed and the painted tile is cached
+    as a pixmap, so scrolling over it only copies pixels. At coarse zoom the tile shows
+    the binned density of the rows as a single image instead.
+    """
+    def __init__(self, viewer, time_ms_start, time_ms_end):
+        super().__init__()
+        self.viewer = viewer
+        self.time_ms_start = time_ms_start
+        self.time_ms_end = time_ms_end
+        self.paths = {} # key_id -> QPainterPath, dropped when the row changes
+        self.image = None
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+
+    def boundingRect(self):
+        v = self.viewer
+        x0 = self.time_ms_start / v.duration_ms * v.width
+        x1 = self.time_ms_end / v.duration_ms * v.width
+        return QRectF(x0, -1, x1 - x0, v.height + 2)
+
+    def invalidate(self, key_id=None):
+        if key_id is None:
+            self.paths.clear()
+        else:
+            self.paths.pop(key_id, None)
+        self.image = None
+        self.update()
+
+    def _build_path(self, key_id, ms_per_px):
+        v = self.viewer
+        path = QPainterPath()
+        if key_id not in v.epochs:
+            return path
+        positions = v.overlapping(key_id, self.time_ms_start, self.time_ms_end)
+        if not positions:
+            return path
+        # epochs less than a pixel apart are drawn as one segment
+        starts, ends = merge_gaps(*v.columns(key_id, positions), ms_per_px)
+        scale = v.width / v.duration_ms
+        # cut to the tile, the neighbor tiles draw the rest
+        x0 = np.maximum(starts, self.time_ms_start - 1) * scale
+        x1 = np.minimum(ends, self.time_ms_end + 1) * scale
+        y = ((key_id + 1) / MAX_KEY) * v.height
+        for a, b in zip(x0.tolist(), x1.tolist()):
+            path.moveTo(a, y)
+            path.lineTo(b, y)
+        return path
+
+    def _paint_density(self, painter):
+        v = self.viewer
+        bin_ms = v.density_bin_ms()
+        first = int(self.time_ms_start // bin_ms)
+        num_bins = int(-(-self.time_ms_end // bin_ms)) - first
+        if self.image is None:
+            self.image = v.density_image(first, num_bins, bin_ms, rows_per_key=4, band=2)
+        # image rows are a quarter of the row spacing, a band of two around each line
+        scale = v.width / v.duration_ms
+        row_height = v.height / MAX_KEY / 4
+        painter.drawImage(QRectF(first * bin_ms * scale, 0, num_bins * bin_ms * scale,
+                                 self.image.height() * row_height), self.image)
+
+    def paint(self, painter, option, widget=None):
+        v = self.viewer
+        if v.is_coarse():
+            self._paint_density(painter)
+            return
+        ms_per_px = v.duration_ms / v.width / max(painter.worldTransform().m11(), 1e-9)
+        for key_id in v.epochs:
+            if key_id not in self.paths:
+                self.paths[key_id] = self._build_path(key_id, ms_per_px)
+            if not self.paths[key_id].isEmpty():
+                painter.setPen(v.pen(key_id))
+                painter.drawPath(self.paths[key_id])
+
+
 class BehavViewer(QGraphicsView):
-    def __init__(self):
+    def __init__(self, render_mode: str = RENDER_LINES):
         super().__init__()
         self.scene = QGraphicsScene()
         self.setScene(self.scene)
@@ -55,16 +167,32 @@ class BehavViewer(QGraphicsView):
         self.setSceneRect(0, 0, self.width, self.height)
         self.fitInView(QRectF(0, 0, self.max_show, self.height), Qt.IgnoreAspectRatio)
         
-        self.lines = []
-        self.num_items = defaultdict(int)
+        # epochs live in one sorted index per behavior, line items only exist for the
+        # rendered window around the current position and are recycled when it moves
+        self.epochs = {} # key_id -> EpochIndex, the collector's own once bound
+        self.spans = {} # key_id -> ms drawn past the end of each epoch, EVENT_SPAN_MS for Events
+        self.colors = {}
+        self.bcollector = None # BehavCollector followed through its notifier
+        self.lines = {} # key_id -> lines showing the rendered window
+        self.pool = [] # hidden lines ready for reuse
+        self.rendered = None # (start_ms, end_ms) covered by the lines
+        self.current_ms = 0
+        self.update_controller = None
+        self.render_mode = render_mode
+        self.tiles = {} # tile number -> BehavTile of the rendered window, in paths mode or at coarse zoom
+        self.pens = {}
+        self.density = {} # (key_id, bin_ms) -> occupancy of each bin over the session, one entry per zoom level
+        self.center_ms = 0
         self._init_ticks()
         self._init_line()
         self.duration_ms = 0
+        self.minimap = BehavMinimap(self)
         
     def _init_line(self):
         self.l0 = QGraphicsLineItem(QLineF(0, 0, 0, self.height))
         pen = QPen(QColor("#000000"), 0.5)
         pen.setStyle(Qt.SolidLine)  # dotted, dashed 등도 가능
+        pen.setCosmetic(True)
         self.l0.setPen(pen)
         self.scene.addItem(self.l0)
         
@@ -74,6 +202,7 @@ class BehavViewer(QGraphicsView):
             l = QGraphicsLineItem(QLineF(0, self.height, 0, self.height-1))
             pen = QPen(QColor("#000000"), 1)
             pen.setStyle(Qt.SolidLine)  # dotted, dashed 등도 가능
+            pen.setCosmetic(True)
             l.setPen(pen)
             self.scene.addItem(l)
             self.ticks.append(l)
@@ -91,20 +220,22 @@ class BehavViewer(QGraphicsView):
             return
         
         center_x = time_ms / self.duration_ms * self.width
-        n0, dn = int(self.max_show / 2), int(self.max_show/4)
+        n0, dn = self.max_show / 2, self.max_show / (NUM_TICKS - 1)
         dt = self.max_show_ms / (NUM_TICKS - 1)
+        decimals = 3 if dt < 100 else 2
         for n in range(NUM_TICKS):
-            x = center_x - n0 + n*dn + 1
+            x = center_x - n0 + n*dn
             if x < 0: continue
             self.ticks[n].setLine(QLineF(x, self.height-2, x, self.height-1))
             
+            # labels ignore the view transform, their width is in pixels
             text = self.tick_labels[n]
-            xp = int(x - text.boundingRect().width()/2) + self.max_show//8
+            xp = x - text.boundingRect().width() / 2 / self.transform().m11()
             yp = self.height-6
             self.tick_labels[n].setPos(xp, yp)
 
             t = time_ms - self.max_show_ms/2 +  n*dt
-            self.tick_labels[n].setPlainText(f"{t/1000:.2f}")
+            self.tick_labels[n].setPlainText(f"{t/1000:.{decimals}f}")
             
     def _update_line(self, time_ms):
         if self.duration_ms == 0:
@@ -114,42 +245,469 @@ class BehavViewer(QGraphicsView):
  
     def resizeEvent(self, event):
         super().resizeEvent(event)
-        for line in self.lines:
-            line.update_position(scene_width=self.width, scene_height=self.height, duration_ms=self.duration_ms)
+        if self.duration_ms > 0:
+            self.set_zoom(self.max_show_ms)
+
+    def wheelEvent(self, event):
+        # wheel zooms around the center, Shift + wheel pans without moving the video
+        steps = (event.angleDelta().y() or event.angleDelta().x()) / 120
+        if self.duration_ms == 0 or steps == 0:
+            return super().wheelEvent(event)
+        if event.modifiers() & Qt.ShiftModifier:
+            self.pan_to(self.center_ms - steps * PAN_STEP * self.max_show_ms)
+        else:
+            self.set_zoom(self.max_show_ms / ZOOM_STEP ** steps)
+        event.accept()
+
+    def mousePressEvent(self, event):
+        if self._uses_tiles() and event.button() == Qt.LeftButton:
+            pos = self.mapToScene(event.pos())
+            time_ms = self.hit_test(pos.x(), pos.y())
+            if time_ms is not None:
+                self._rewind(time_ms)
+                return
+        super().mousePressEvent(event)
+
+    def hit_test(self, x, y, tolerance_px=HIT_TOLERANCE_PX):
+        """Start time of the epoch drawn at scene position (x, y), None when there is none."""
+        if self.duration_ms == 0:
+            return None
+        key_id = int(round(y / self.height * MAX_KEY)) - 1
+        if key_id not in self.epochs:
+            return None
+        row_y = ((key_id + 1) / MAX_KEY) * self.height
+        if abs(y - row_y) * self.transform().m22() > tolerance_px:
+            return None
+        time_ms = x / self.width * self.duration_ms
+        tolerance_ms = tolerance_px / self.transform().m11() / self.width * self.duration_ms
+        positions = self.overlapping(key_id, time_ms - tolerance_ms, time_ms + tolerance_ms)
+        if not positions:
+            return None
+        # the epoch reaching closest to the click, the latest one among those under it
+        starts, ends = self.columns(key_id, positions)
+        distance = np.maximum(starts - time_ms, 0) + np.maximum(time_ms - ends, 0)
+        hits = np.flatnonzero(distance == distance.min())
+        return int(starts[hits[-1]])
+
+    def overlapping(self, key_id, start_ms, end_ms):
+        """Positions of the epochs of key_id drawn over [start_ms, end_ms]."""
+        return self.epochs[key_id].overlapping(start_ms - self.spans.get(key_id, 0), end_ms)
+
+    def columns(self, key_id, positions=None):
+        """(starts, ends) of the epochs of key_id as drawn, all of them or the ones at positions."""
+        index = self.epochs[key_id]
+        starts, ends = index.starts, index.ends
+        if positions is not None:
+            starts, ends = starts[positions], ends[positions]
+        return starts, ends + self.spans.get(key_id, 0)
+
+    def pen(self, key_id):
+        color = self.colors[key_id]
+        if color not in self.pens:
+            self.pens[color] = _epoch_pen(color)
+        return self.pens[color]
+
+    def is_coarse(self):
+        return self.max_show_ms > DENSITY_SHOW_MS
+
+    def _uses_tiles(self):
+        return self.render_mode == RENDER_PATHS or self.is_coarse()
+
+    def density_bin_ms(self, span_ms=None, num_bins=DENSITY_BINS):
+        # power of two, so nearby zoom levels share the cached densities
+        span_ms = self.max_show_ms if span_ms is None else span_ms
+        return float(2 ** max(int(np.ceil(np.log2(max(span_ms / num_bins, 1)))), 0))
+
+    def row_occupancy(self, key_id, bin_ms):
+        """Time in ms the epochs of key_id cover in each bin of bin_ms over the session."""
+        if (key_id, bin_ms) not in self.density:
+            num_bins = max(int(np.ceil(self.duration_ms / bin_ms)), 1)
+            self.density[(key_id, bin_ms)] = occupancy(*self.columns(key_id), bin_ms, num_bins)
+        return self.density[(key_id, bin_ms)]
+
+    def row_density(self, key_id, bin_ms, first_bin=0, num_bins=None):
+        """Alpha (0-255) of the bins [first_bin, first_bin + num_bins), relative to the fullest bin of the row."""
+        occupied = self.row_occupancy(key_id, bin_ms)
+        peak = occupied.max() if len(occupied) > 0 else 0
+        occupied = occupied[max(first_bin, 0):None if num_bins is None else first_bin + num_bins]
+        alpha = np.zeros(len(occupied), dtype=np.uint8)
+        if peak > 0:
+            nonzero = occupied > 0
+            alpha[nonzero] = DENSITY_MIN_ALPHA + (255 - DENSITY_MIN_ALPHA) * occupied[nonzero] / peak
+        return alpha
+
+    def density_image(self, first_bin, num_bins, bin_ms, rows_per_key=1, band=1):
+        """ARGB image of the bins [first_bin, first_bin + num_bins), rows_per_key image rows per
+        row spacing, the band rows around the line of each behavior colored."""
+        pixels = np.zeros((rows_per_key * (MAX_KEY + 1), max(num_bins, 1)), dtype=np.uint32)
+        for key_id in self.epochs:
+            alpha = self.row_density(key_id, bin_ms, first_bin, num_bins)
+            offset = max(-first_bin, 0)
+            color = QColor(self.colors[key_id])
+            row = (alpha.astype(np.uint32) << 24) | np.uint32((color.red() << 16) | (color.green() << 8) | color.blue())
+            top = rows_per_key * (key_id + 1) - band // 2
+            pixels[top:top + band, offset:offset + len(row)] = row
+        height, width = pixels.shape
+        return QImage(pixels.data, width, height, 4 * width, QImage.Format_ARGB32).copy()
+
+    def _forget_density(self, key_id):
+        self.density = {k: v for k, v in self.density.items() if k[0] != key_id}
+        self.minimap.invalidate()
+
+    def _update_density(self, key_id, time_ms_start, time_ms_end):
+        # only the bins of the changed range are counted again, returns True when the
+        # fullest bin of the row changed and with it the shade of every bin
+        peak_changed = False
+        for (k, bin_ms), occupied in self.density.items():
+            if k != key_id:
+                continue
+            first = int(max(time_ms_start, 0) // bin_ms)
+            last = min(int(time_ms_end // bin_ms), len(occupied) - 1)
+            if last < first:
+                continue
+            lo, hi = first * bin_ms, (last + 1) * bin_ms
+            peak = occupied.max()
+            if key_id in self.epochs:
+                starts, ends = self.columns(key_id, self.overlapping(key_id, lo, hi))
+                occupied[first:last + 1] = occupancy(starts - lo, ends - lo, bin_ms, last - first + 1)
+            else:
+                occupied[first:last + 1] = 0
+            peak_changed |= occupied.max() != peak
+        self.minimap.invalidate()
+        return peak_changed
+
+    def set_render_mode(self, mode: str):
+        """Draw epochs as one line item each (RENDER_LINES) or as cached row paths (RENDER_PATHS)."""
+        if mode not in RENDER_MODES:
+            raise ValueError(f"Unknown render mode {mode}, expected one of {RENDER_MODES}")
+        if mode == self.render_mode:
+            return
+        self.render_mode = mode
+        self._clear_rendered()
+        self._render(self.current_ms)
+
+    def use_path_rendering(self, flag: bool):
+        self.set_render_mode(RENDER_PATHS if flag else RENDER_LINES)
+
+    def _clear_rendered(self):
+        for lines in self.lines.values():
+            while lines:
+                self._drop_line(lines.pop())
+        self.lines.clear()
+        for tile in self.tiles.values():
+            self.scene.removeItem(tile)
+        self.tiles.clear()
+        self.rendered = None
         
     def clear_scene(self):
-        self.scene.clear()
+        self.epochs.clear()
+        self.spans.clear()
+        self.colors.clear()
+        self.density.clear()
+        self.minimap.invalidate()
+        self._clear_rendered()
+        self._render(self.current_ms)
+
+    def _visible_range(self, time_ms):
+        return time_ms - self.max_show_ms / 2, time_ms + self.max_show_ms / 2
+
+    def _in_rendered(self, time_ms_start, time_ms_end):
+        return self.rendered is not None and time_ms_start <= self.rendered[1] and time_ms_end >= self.rendered[0]
+
+    def _ensure_rendered(self, time_ms):
+        start, end = self._visible_range(time_ms)
+        if self.rendered is None or start < self.rendered[0] or end > self.rendered[1]:
+            self._render(time_ms)
+
+    def _render(self, time_ms):
+        """Show the epochs around time_ms with as many line items as needed, reusing the existing ones."""
+        if self.duration_ms == 0:
+            self.rendered = None
+            return
+        margin = WINDOW_MARGIN * self.max_show_ms
+        start, end = self._visible_range(time_ms)
+        start, end = start - margin, end + margin
+        if self._uses_tiles():
+            self._render_tiles(start, end)
+            return
+
+        for key_id in [k for k in self.lines if k not in self.epochs]:
+            for line in self.lines.pop(key_id):
+                self._drop_line(line)
+        for key_id in self.epochs:
+            lines = self.lines.setdefault(key_id, [])
+            starts, ends = self._visible_columns(key_id, start, end)
+            while len(lines) < len(starts):
+                lines.append(self._take_line())
+            while len(lines) > len(starts):
+                self._drop_line(lines.pop())
+            color = self.colors[key_id]
+            for line, time_ms_start, time_ms_end in zip(lines, starts, ends):
+                line.reset(key_id, color, time_ms_start, time_ms_end)
+                line.update_position(scene_width=self.width, scene_height=self.height, duration_ms=self.duration_ms)
+        self.rendered = (start, end)
+
+    def _visible_columns(self, key_id, start, end):
+        if key_id not in self.epochs:
+            return [], []
+        starts, ends = self.columns(key_id, self.overlapping(key_id, start, end))
+        return starts.tolist(), ends.tolist()
+
+    def _render_rows(self, ranges):
+        """Match the line items of each key_id of ranges to its epochs over the range (start_ms, end_ms),
+        None for the whole rendered window. Lines of unchanged epochs stay where they are and the
+        other rows are left alone."""
+        for key_id, time_range in ranges.items():
+            start, end = self.rendered
+            if time_range is not None:
+                start, end = max(start, time_range[0]), min(end, time_range[1])
+            wanted = Counter(zip(*self._visible_columns(key_id, start, end)))
+            color = self.colors[key_id]
+            kept = []
+            for line in self.lines.get(key_id, []):
+                epoch = (line.time_ms_start, line.time_ms_end)
+                if epoch[0] > end or epoch[1] < start:
+                    kept.append(line)
+                elif wanted[epoch] > 0:
+                    wanted[epoch] -= 1
+                    if line.color != color:
+                        line.reset(key_id, color, *epoch)
+                    kept.append(line)
+                else:
+                    self._drop_line(line)
+            for (time_ms_start, time_ms_end), num in wanted.items():
+                for _ in range(num):
+                    line = self._take_line()
+                    line.reset(key_id, color, time_ms_start, time_ms_end)
+                    line.update_position(scene_width=self.width, scene_height=self.height, duration_ms=self.duration_ms)
+                    kept.append(line)
+            self.lines[key_id] = kept
+
+    def _take_line(self):
+        if self.pool:
+            line = self.pool.pop()
+        else:
+            line = BehavLine(0, "#000000", 0, 0)
+            line.set_rewind_function(self._rewind)
+            self.scene.addItem(line)
+        line.setVisible(True)
+        return line
+
+    def _drop_line(self, line):
+        line.setVisible(False)
+        self.pool.append(line)
+
+    def _tile_range(self, start, end):
+        tile_ms = self.max_show_ms
+        return range(max(int(start // tile_ms), 0), int(end // tile_ms) + 1)
+
+    def _render_tiles(self, start, end):
+        # tiles outside the window are dropped, the ones kept still hold their paths
+        needed = self._tile_range(start, end)
+        for n in [n for n in self.tiles if n not in needed]:
+            self.scene.removeItem(self.tiles.pop(n))
+        for n in needed:
+            if n not in self.tiles:
+                tile = BehavTile(self, n * self.max_show_ms, (n + 1) * self.max_show_ms)
+                self.scene.addItem(tile)
+                self.tiles[n] = tile
+        self.rendered = (start, end)
+
+    def _invalidate(self, key_id, time_ms_start=None, time_ms_end=None):
+        # only the tiles the changed range crosses rebuild the row (all of them without a range),
+        # returns True when the line items of the row have to be matched again by _render_rows
+        if time_ms_start is None:
+            self._forget_density(key_id)
+            whole = True
+        else:
+            whole = self._update_density(key_id, time_ms_start, time_ms_end) and self.is_coarse()
+        if not self._uses_tiles():
+            return self.rendered is not None and (whole or self._in_rendered(time_ms_start, time_ms_end))
+        for n, tile in self.tiles.items():
+            if whole or n in self._tile_range(time_ms_start, time_ms_end):
+                tile.invalidate(key_id)
+        return False
+
+    def _rewind(self, time_ms):
+        if self.update_controller is not None:
+            self.update_controller(time_ms)
+
+    def bind(self, bcollector):
+        """Draw the behaviors of bcollector and follow its changes, no epoch is copied."""
+        if self.bcollector is not None:
+            self.bcollector.notifier.unsubscribe(self.on_behaviors_changed)
+        self.bcollector = bcollector
+        bcollector.notifier.subscribe(self.on_behaviors_changed)
+        self._bind_all()
+
+    def _bind_row(self, key_id):
+        b = self.bcollector.behav_set[key_id]
+        if b.time_ms is None:
+            self.epochs.pop(key_id, None)
+        else:
+            self.epochs[key_id] = b.time_ms
+        self.colors[key_id] = b.color_code
+        self.spans[key_id] = EVENT_SPAN_MS if b.type == EVENT else 0
+
+    def _bind_all(self):
+        self.epochs.clear()
+        self.spans.clear()
+        self.colors.clear()
+        for key_id in range(min(self.bcollector.num, MAX_KEY)):
+            self._bind_row(key_id)
+        self.density.clear()
+        self.minimap.invalidate()
+        self._clear_rendered()
+        self._render(self.current_ms)
+
+    def on_behaviors_changed(self, changes):
+        """Redraw what a batch of BehavChange touched, the collector already holds the new state."""
+        if any(c.kind in (BEHAVIOR_REMOVED, BEHAVIORS_RESET) for c in changes):
+            # ids moved or anything changed, every row is read again
+            self._bind_all()
+            return
+        ranges = {} # key_id -> time range whose line items are matched again, None for all
+        for c in changes:
+            key_id = c.behav_id
+            if key_id >= MAX_KEY:
+                continue
+            self._bind_row(key_id)
+            if c.kind in EPOCH_CHANGES:
+                time_range = (c.start_ms, c.end_ms + self.spans[key_id])
+                if not self._invalidate(key_id, *time_range):
+                    continue
+                if key_id in ranges:
+                    old = ranges[key_id]
+                    time_range = None if old is None else (min(old[0], time_range[0]), max(old[1], time_range[1]))
+                ranges[key_id] = time_range
+            elif self._invalidate(key_id):
+                ranges[key_id] = None
+        if ranges:
+            self._render_rows(ranges)
+
+    def _check_unbound(self):
+        if self.bcollector is not None:
+            raise ValueError("The timeline follows its BehavCollector, change the epochs there")
 
     def add_item(self, key_id, color, time_ms_start, time_ms_end):
-        line = BehavLine(key_id, color, time_ms_start, time_ms_end)
-        line.set_rewind_function(self.update_controller)
-        
-        self.scene.addItem(line)
-        self.lines.append(line)
-        line.update_position(scene_width=self.width, scene_height=self.height, duration_ms=self.duration_ms)
-        self.num_items[key_id] += 1
-        
-    def delete_item(self, time_ms):
-        for line in self.lines:
-            if line.scene() == self.scene:
-                if line.time_ms_start <= time_ms <= line.time_ms_end:
-                    key_id = line.key_id
-                    self.num_items[key_id] -= 1
-                    self.scene.removeItem(line)
+        # epochs of an unbound viewer, e.g. in benchmarks
+        self._check_unbound()
+        if key_id not in self.epochs:
+            self.epochs[key_id] = EpochIndex()
+        self.epochs[key_id].append([time_ms_start, time_ms_end])
+        self.colors[key_id] = color
+        if self._invalidate(key_id, time_ms_start, time_ms_end):
+            self._render_rows({key_id: (time_ms_start, time_ms_end)})
         
+    def delete_item(self, key_id, time_ms_start, time_ms_end):
+        self._check_unbound()
+        index = self.epochs.get(key_id)
+        if index is None:
+            return
+        positions = [n for n in index.containing(time_ms_start)
+                     if index.starts[n] == time_ms_start and index.ends[n] == time_ms_end]
+        if not positions:
+            return
+        index.pop(positions[0])
+        if self._invalidate(key_id, time_ms_start, time_ms_end):
+            self._render_rows({key_id: (time_ms_start, time_ms_end)})
+
+    def set_items(self, key_id, color, starts, ends):
+        """Replace every epoch of key_id at once, the view is repainted a single time."""
+        self._check_unbound()
+        self.epochs[key_id] = EpochIndex.from_columns(np.asarray(starts, dtype=np.int64),
+                                                      np.asarray(ends, dtype=np.int64))
+        self.colors[key_id] = color
+        if self._invalidate(key_id):
+            self._render_rows({key_id: None})
+
     def update_duration(self, duration_ms):
         self.duration_ms = duration_ms
+        self.density.clear()
+        self.minimap.invalidate()
+        self.set_zoom(self.max_show_ms)
+
+    def set_zoom(self, max_show_ms):
+        """Show max_show_ms around the center, from MIN_SHOW_MS up to the whole session."""
+        self.max_show_ms = float(max(max_show_ms, MIN_SHOW_MS))
+        if self.duration_ms == 0:
+            return
+        self.max_show_ms = min(self.max_show_ms, max(self.duration_ms, MIN_SHOW_MS))
         self.max_show = self.max_show_ms / self.duration_ms * self.width
         self.fitInView(QRectF(0, 0, self.max_show, self.height), Qt.IgnoreAspectRatio)
+        # tiles are one window wide and drawn at the old scale
+        self._clear_rendered()
+        self.pan_to(self.center_ms)
+
+    def pan_to(self, time_ms):
+        """Center the timeline on time_ms without moving the video."""
+        if self.duration_ms == 0:
+            return
+        time_ms = min(max(time_ms, 0), self.duration_ms)
+        self.center_ms = time_ms
+        self._ensure_rendered(time_ms)
+        self.centerOn(time_ms / self.duration_ms * self.width, self.height/2)
+        self._update_ticks(time_ms)
+        self.minimap.update()
     
     def on_position_changed(self, time_ms: int):
-        center_x = time_ms / self.duration_ms * self.width
-        self.centerOn(center_x, self.height/2)
-        self._update_ticks(time_ms)
+        self.current_ms = time_ms
         self._update_line(time_ms)
+        self.pan_to(time_ms)
     
     def connect_controller(self, video_control_obj: Controller):
         video_control_obj.position_updated.connect(self.on_position_changed)
         self.update_controller = video_control_obj.update_position
-        
-        
+
+
+class BehavMinimap(QWidget):
+    """Density of every behavior over the whole session with the window shown by the timeline.
+
+    Clicking or dragging moves the video there.
+    """
+    def __init__(self, viewer: BehavViewer):
+        super().__init__()
+        self.viewer = viewer
+        self.image = None
+        self.setFixedHeight(MINIMAP_HEIGHT)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+
+    def invalidate(self):
+        self.image = None
+        self.update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.image = None
+
+    def _time_at(self, x):
+        return int(min(max(x / max(self.width(), 1), 0), 1) * self.viewer.duration_ms)
+
+    def mousePressEvent(self, event):
+        if self.viewer.duration_ms > 0:
+            self.viewer._rewind(self._time_at(event.x()))
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.LeftButton:
+            self.mousePressEvent(event)
+
+    def paintEvent(self, event):
+        v = self.viewer
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("#f4f4f4"))
+        if v.duration_ms == 0:
+            return
+        width = max(self.width(), 1)
+        bin_ms = v.density_bin_ms(v.duration_ms, num_bins=width)
+        num_bins = int(np.ceil(v.duration_ms / bin_ms))
+        if self.image is None:
+            self.image = v.density_image(0, num_bins, bin_ms)
+        painter.drawImage(QRectF(0, 0, num_bins * bin_ms / v.duration_ms * width, self.height()), self.image)
+
+        x = lambda t: t / v.duration_ms * width
+        start, end = v._visible_range(v.center_ms)
+        painter.setPen(QPen(QColor("#000000"), 1))
+        painter.setBrush(QColor(0, 0, 0, 30))
+        painter.drawRect(QRectF(x(start), 0, max(x(end) - x(start), 2), self.height() - 1))
+        painter.setPen(QPen(QColor("#d00000"), 1))
+        painter.drawLine(QLineF(x(v.current_ms), 0, x(v.current_ms), self.height()))
@@ -10,7 +10,16 @@ class MenuBuilder(QObject):
     load_behav_requested    = pyqtSignal()
     save_header_requested   = pyqtSignal()
     save_behav_requested    = pyqtSignal()
+    load_session_requested  = pyqtSignal()
+    save_session_requested  = pyqtSignal()
     export_epochs_requested = pyqtSignal()
+    export_labels_requested = pyqtSignal()
+    transform_epochs_requested = pyqtSignal()
+    undo_epochs_requested   = pyqtSignal()
+    opencv_engine_toggled   = pyqtSignal(bool)
+    proxy_toggled           = pyqtSignal(bool)
+    filmstrip_toggled       = pyqtSignal(bool)
+    path_timeline_toggled   = pyqtSignal(bool)
 
     def __init__(self, parent: QMainWindow):
         super().__init__(parent)
@@ -27,6 +36,18 @@ class MenuBuilder(QObject):
         open_video_action.triggered.connect(self.load_video_requested.emit)
         file_menu.addAction(open_video_action)
 
+        # Playback engine of newly opened videos
+        opencv_engine_action = QAction("Open Videos with OpenCV Engine", self.parent)
+        opencv_engine_action.setCheckable(True)
+        opencv_engine_action.toggled.connect(self.opencv_engine_toggled.emit)
+        file_menu.addAction(opencv_engine_action)
+
+        # Low-resolution proxies for playback
+        proxy_action = QAction("Play Low-Resolution Proxies", self.parent)
+        proxy_action.setCheckable(True)
+        proxy_action.toggled.connect(self.proxy_toggled.emit)
+        file_menu.addAction(proxy_action)
+
         # Open EEG
         open_eeg_action = QAction("Open EEG", self.parent)
         open_eeg_action.triggered.connect(self.load_eeg_requested.emit)
@@ -45,6 +66,11 @@ class MenuBuilder(QObject):
         load_behavior_action.setShortcut("Ctrl+L")
         load_behavior_action.triggered.connect(self.load_behav_requested.emit)
         file_menu.addAction(load_behavior_action)
+
+        # Load Behavior Session (single file)
+        load_session_action = QAction("Load Behavior Session", self.parent)
+        load_session_action.triggered.connect(self.load_session_requested.emit)
+        file_menu.addAction(load_session_action)
         file_menu.addSeparator()
 
         # Save Header
@@ -59,11 +85,44 @@ class MenuBuilder(QObject):
         save_behavior_action.triggered.connect(self.save_behav_requested.emit)
         file_menu.addAction(save_behavior_action)
 
+        # Save Behavior Session (single file)
+        save_session_action = QAction("Save Behavior Session", self.parent)
+        save_session_action.triggered.connect(self.save_session_requested.emit)
+        file_menu.addAction(save_session_action)
+
         # Export Epochs
         export_epochs_action = QAction("Export Selected Behavior Epochs", self.parent)
         export_epochs_action.triggered.connect(self.export_epochs_requested.emit)
         file_menu.addAction(export_epochs_action)
 
+        # Export Frame Labels
+        export_labels_action = QAction("Export Frame Labels", self.parent)
+        export_labels_action.triggered.connect(self.export_labels_requested.emit)
+        file_menu.addAction(export_labels_action)
+
+        # Edit menu
+        edit_menu = self.menubar.addMenu("Edit")
+        transform_action = QAction("Transform Epochs...", self.parent)
+        transform_action.triggered.connect(self.transform_epochs_requested.emit)
+        edit_menu.addAction(transform_action)
+
+        undo_action = QAction("Undo Epoch Transform", self.parent)
+        undo_action.setShortcut("Ctrl+Z")
+        undo_action.triggered.connect(self.undo_epochs_requested.emit)
+        edit_menu.addAction(undo_action)
+
+        # View menu
+        view_menu = self.menubar.addMenu("View")
+        filmstrip_action = QAction("Show Filmstrip", self.parent)
+        filmstrip_action.setCheckable(True)
+        filmstrip_action.toggled.connect(self.filmstrip_toggled.emit)
+        view_menu.addAction(filmstrip_action)
+
+        path_timeline_action = QAction("Fast Timeline Rendering", self.parent)
+        path_timeline_action.setCheckable(True)
+        path_timeline_action.toggled.connect(self.path_timeline_toggled.emit)
+        view_menu.addAction(path_timeline_action)
+
         # Help menu
         help_menu = self.menubar.addMenu("Help")
         show_help_action = QAction("Show Help", self.parent)
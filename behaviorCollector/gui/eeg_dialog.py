@@ -8,12 +8,14 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
 from .utils_gui import error2messagebox
+from ..processing.behav_container import EVENT
 
 
 class EEGDialog(QDialog):
-    def __init__(self, eeg_data, controller=None, parent=None):
+    def __init__(self, eeg_data, controller=None, bcollector=None, parent=None):
         super().__init__(parent)
         self.controller = controller
+        self.bcollector = bcollector # behaviors shaded over the EEG, if any
         self.raw_data = np.asarray(eeg_data["data"])
         self.times = np.asarray(eeg_data["times"]).squeeze()
         self.tdelay = float(np.asarray(eeg_data.get("tdelay_video (s)", 0)).squeeze())
@@ -106,6 +108,11 @@ class EEGDialog(QDialog):
         self.window_box.setValue(0.5)
         self.window_box.valueChanged.connect(self.update_plot)
 
+        self.behav_check = QCheckBox("Show behaviors")
+        self.behav_check.setChecked(self.bcollector is not None)
+        self.behav_check.setEnabled(self.bcollector is not None)
+        self.behav_check.stateChanged.connect(self.update_plot)
+
         self.time_label = QLabel("")
         row.addWidget(QLabel("ymin"))
         row.addWidget(self.ymin_box)
@@ -113,6 +120,7 @@ class EEGDialog(QDialog):
         row.addWidget(self.ymax_box)
         row.addWidget(QLabel("+/- seconds around video time"))
         row.addWidget(self.window_box)
+        row.addWidget(self.behav_check)
         row.addStretch(1)
         row.addWidget(self.time_label)
 
@@ -121,6 +129,8 @@ class EEGDialog(QDialog):
     def _connect_signals(self):
         if self.controller is not None:
             self.controller.position_updated.connect(self._on_video_position)
+        if self.bcollector is not None:
+            self.bcollector.notifier.subscribe(self._on_behaviors_changed)
 
     def _disconnect_signals(self):
         if self.controller is not None:
@@ -128,6 +138,16 @@ class EEGDialog(QDialog):
                 self.controller.position_updated.disconnect(self._on_video_position)
             except Exception:
                 pass
+        if self.bcollector is not None:
+            self.bcollector.notifier.unsubscribe(self._on_behaviors_changed)
+
+    def _on_behaviors_changed(self, changes):
+        # only edits inside the plotted window are redrawn
+        if not self.behav_check.isChecked():
+            return
+        center_ms, window_ms = self._current_video_time_s() * 1000, self.window_box.value() * 1000
+        if any(c.overlaps(center_ms - window_ms, center_ms + window_ms) for c in changes):
+            self.update_plot()
 
     def selected_channels(self):
         return [idx + 1 for idx, chk in enumerate(self.channel_checks) if chk.isChecked()]
@@ -152,6 +172,19 @@ class EEGDialog(QDialog):
     def _update_time_label(self, time_s):
         self.time_label.setText(f"Video time: {time_s:.3f} s")
 
+    def _plot_behaviors(self, ax, start_s, end_s):
+        # States as shaded spans, Events as dotted lines, in the colors of the timeline
+        for b in self.bcollector.behav_set:
+            positions = b.find_in_range(int(start_s * 1000), int(end_s * 1000))
+            if len(positions) == 0:
+                continue
+            starts, ends = b.time_ms.starts[positions] / 1000, b.time_ms.ends[positions] / 1000
+            for t0, t1 in zip(starts.tolist(), ends.tolist()):
+                if b.type == EVENT:
+                    ax.axvline(t0, color=b.color_code, linestyle=":", linewidth=1)
+                else:
+                    ax.axvspan(t0, t1, color=b.color_code, alpha=0.2, linewidth=0)
+
     @error2messagebox(to_warn=True)
     def update_plot(self, *args, **kwargs):
         channels = self.selected_channels()
@@ -197,6 +230,8 @@ class EEGDialog(QDialog):
             ax.grid(True, linestyle="--", alpha=0.4)
             ax.set_xlim(center - window, center + window)
             ax.axvline(center, color="black", linestyle="-", linewidth=1)
+            if self.bcollector is not None and self.behav_check.isChecked():
+                self._plot_behaviors(ax, center - window, center + window)
             if len(cbrain_ids) > 1:
                 ax.legend(loc="upper right", fontsize="small")
 
@@ -19,6 +19,8 @@ class ShortcutMapDialog(QDialog):
                 "Shift + L : Jump forward 10 seconds",
                 "Shift + J : Jump back 5 seconds",
                 "Shift + K : Jump forward 5 seconds",
+                "[ : Shuttle backward (reverse with the OpenCV engine / slower)",
+                "] : Shuttle forward (faster / resume)",
                 "--- Behavior Annotation ---",
                 "Q : Select time point for Behavior 1",
                 "W : Select time point for Behavior 2",
@@ -40,7 +42,10 @@ class ShortcutMapDialog(QDialog):
                 "8 : Select time point for Behavior 18",
                 "--- Editing ---",
                 "Z : Undo last selection",
-                "X : Clear current selections"
+                "X : Clear current selections",
+                "--- Timeline ---",
+                "Wheel : Zoom in / out",
+                "Shift + Wheel : Scroll without moving the video"
                 ]
         
         for key in shortcut_labels:
@@ -6,6 +6,9 @@ from .behav_panel import BehavPanel, BehavViewer, pyqt_KEY_MAP
 from .utils_gui import error2messagebox
 from .config_menu import MenuBuilder
 from .eeg_dialog import EEGDialog
+from .thumb_view import FilmStrip
+from ..processing.behav_container import BehavCollector
+from ..processing.behav_journal import BehavJournal
 
 
 class MainWindow(QMainWindow):
@@ -21,6 +24,7 @@ class MainWindow(QMainWindow):
         self._init_ui()
         self._init_menu()
         self._connect_signals()
+        self._init_journal()
         
         self.is_behav_saved = False
         self.eeg_dialog = None
@@ -31,6 +35,10 @@ class MainWindow(QMainWindow):
         l1 = QVBoxLayout()
         self.behav_viewer = BehavViewer()
         self.controller = Controller()
+        self.filmstrip = FilmStrip()
+        self.filmstrip.setVisible(False)
+        l1.addWidget(self.filmstrip)
+        l1.addWidget(self.behav_viewer.minimap)
         l1.addWidget(self.behav_viewer)
         l1.addWidget(self.controller)
         layout.addLayout(l1, stretch=5)
@@ -57,9 +65,50 @@ class MainWindow(QMainWindow):
         self.controller.connect_menubar(self.menubar)
         self.behav_control.connect_menubar(self.menubar)
         self.menubar.load_eeg_requested.connect(self.open_eeg)
+        self.filmstrip.thumbnail_fn = self.controller.thumbnail_at
+        self.controller.position_updated.connect(self.filmstrip.set_position)
+        self.menubar.filmstrip_toggled.connect(self.filmstrip.setVisible)
+        self.menubar.path_timeline_toggled.connect(self.behav_viewer.use_path_rendering)
+        BehavCollector().notifier.subscribe(self._on_behaviors_changed)
+        
+    def _init_journal(self):
+        # every annotation edit is journaled, leftovers of a session that crashed are offered for recovery
+        self.journal = BehavJournal(BehavCollector())
+        self.orphan_journals = []
+        for sid in self.journal.find_orphans():
+            if self.journal.has_data(sid):
+                self.orphan_journals.append(sid)
+            else:
+                self.journal.remove(sid)
+        if self.orphan_journals:
+            # annotations are drawn on the timeline of a video, wait until one is open
+            self.controller.duration_updated.connect(self._offer_recovery)
+            
+    def _offer_recovery(self, duration_ms):
+        if duration_ms <= 0:
+            return
+        self.controller.duration_updated.disconnect(self._offer_recovery)
+        
+        sid = self.orphan_journals.pop() # most recent
+        reply = QMessageBox.question(
+            self,
+            "Recover annotations",
+            f"Annotations of a session that did not close properly were found ({sid}). "
+            "Do you want to recover them?",
+            QMessageBox.Yes | QMessageBox.Discard | QMessageBox.Ignore,
+            QMessageBox.Yes
+        )
+        if reply == QMessageBox.Yes:
+            self.behav_control.recover_journal(self.journal, sid)
+        elif reply == QMessageBox.Discard:
+            self.journal.remove(sid)
         
     def behav_saved(self):
         self.is_behav_saved = True
+
+    def _on_behaviors_changed(self, changes):
+        # anything annotated after the last save asks again before closing
+        self.is_behav_saved = False
         
     def closeEvent(self, event):
         if not self.is_behav_saved:
@@ -75,13 +124,14 @@ class MainWindow(QMainWindow):
                 event.ignore()
                 return
         
+        self.journal.close(discard=True)
         self.main_window_closed.emit()
         return super().closeEvent(event)
 
     @error2messagebox(to_warn=True)
     def keyPressEvent(self, event):
         key = event.key()
-        if key in (Qt.Key_H, Qt.Key_J, Qt.Key_K, Qt.Key_L, Qt.Key_Space):
+        if key in (Qt.Key_H, Qt.Key_J, Qt.Key_K, Qt.Key_L, Qt.Key_Space, Qt.Key_BracketLeft, Qt.Key_BracketRight):
             self.controller.handle_key_input(event)
         elif key in pyqt_KEY_MAP:
             self.behav_control.handle_key_input(event)
@@ -108,6 +158,6 @@ class MainWindow(QMainWindow):
             except Exception:
                 pass
 
-        self.eeg_dialog = EEGDialog(eeg_data, controller=self.controller, parent=self)
+        self.eeg_dialog = EEGDialog(eeg_data, controller=self.controller, bcollector=BehavCollector(), parent=self)
         self.eeg_dialog.show()
 
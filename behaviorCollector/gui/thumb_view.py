@@ -0,0 +1,93 @@
+import numpy as np
+from PyQt5.QtWidgets import QSlider, QLabel, QStyle, QWidget, QSizePolicy
+from PyQt5.QtGui import QImage, QPixmap, QPainter, QPen, QColor
+from PyQt5.QtCore import Qt, QPoint, QRect
+from ..processing.video_thumbs import THUMB_STRIDE_MS, THUMB_HEIGHT
+
+
+def thumb_to_pixmap(thumb):
+    thumb = np.ascontiguousarray(thumb)
+    h, w = thumb.shape[:2]
+    image = QImage(thumb.data, w, h, thumb.strides[0], QImage.Format_BGR888)
+    return QPixmap.fromImage(image)
+
+
+class ThumbSlider(QSlider):
+    """Slider showing the cached thumbnail under the cursor while hovering or dragging."""
+
+    def __init__(self, orientation, parent=None):
+        super().__init__(orientation, parent)
+        self.setMouseTracking(True)
+        self.thumbnail_fn = None # time_ms -> (time_ms, thumbnail) or None
+        self.popup = QLabel(None, Qt.ToolTip)
+
+    def _value_at(self, x):
+        return QStyle.sliderValueFromPosition(self.minimum(), self.maximum(), x, self.width())
+
+    def mouseMoveEvent(self, event):
+        super().mouseMoveEvent(event)
+        value = self.value() if self.isSliderDown() else self._value_at(event.x())
+        self._show_thumbnail(value, event.globalPos())
+
+    def leaveEvent(self, event):
+        super().leaveEvent(event)
+        if not self.isSliderDown():
+            self.popup.hide()
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        if not self.rect().contains(event.pos()):
+            self.popup.hide()
+
+    def _show_thumbnail(self, time_ms, global_pos):
+        res = self.thumbnail_fn(time_ms) if self.thumbnail_fn is not None else None
+        if res is None:
+            self.popup.hide()
+            return
+
+        _, thumb = res
+        self.popup.setPixmap(thumb_to_pixmap(thumb))
+        self.popup.adjustSize()
+        self.popup.move(global_pos - QPoint(self.popup.width() // 2, self.popup.height() + 12))
+        self.popup.show()
+
+
+class FilmStrip(QWidget):
+    """Row of thumbnails around the current position, one per thumbnail stride."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.setFixedHeight(THUMB_HEIGHT)
+        self.thumbnail_fn = None
+        self.stride_ms = THUMB_STRIDE_MS
+        self.position_ms = 0
+
+    def set_position(self, time_ms):
+        self.position_ms = time_ms
+        if self.isVisible():
+            self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("#202020"))
+        if self.thumbnail_fn is None:
+            return
+
+        center = self.thumbnail_fn(self.position_ms)
+        if center is None:
+            return
+
+        h = self.height()
+        w = int(center[1].shape[1] * h / center[1].shape[0])
+        num_side = self.width() // (2 * w) + 1
+        x0 = self.width() // 2 - w // 2
+        for k in range(-num_side, num_side + 1):
+            t = self.position_ms + k * self.stride_ms
+            res = center if k == 0 else self.thumbnail_fn(t)
+            if res is None or t < 0:
+                continue
+            painter.drawPixmap(QRect(x0 + k * w, 0, w, h), thumb_to_pixmap(res[1]))
+
+        painter.setPen(QPen(QColor("#ff2020"), 2))
+        painter.drawLine(self.width() // 2, 0, self.width() // 2, h)
@@ -3,10 +3,12 @@ from PyQt5.QtWidgets import (
     QHBoxLayout, QFileDialog, QSlider, QLabel,
     QToolButton, QDoubleSpinBox, QSpacerItem, QSizePolicy
 )
-from PyQt5.QtCore import Qt, pyqtSignal, QTimer
+from PyQt5.QtCore import Qt, pyqtSignal, QTimer, QElapsedTimer
 import numpy as np
 from functools import partial
 from .video_viewer import VideoViewerWindow
+from .video_engine import ENGINE_QT, ENGINE_OPENCV
+from .thumb_view import ThumbSlider
 from .config_menu import MenuBuilder
 
 
@@ -14,6 +16,8 @@ FPS_DEFAULT = 30
 PENDING_TIME = 50
 MOVE_LARGE = 10000 # 10 s
 MOVE_SMALL = 5000  # 5s
+SHUTTLE_SPEEDS = (-4, -2, -1, -0.5, 0, 0.5, 1, 2, 4)
+REVERSE_INTERVAL = 20 # ms, clock of the reverse playback
 
 
 class Controller(QWidget):
@@ -30,6 +34,8 @@ class Controller(QWidget):
         self._init_timer()
         self.playing_state = False
         self.min_fps = FPS_DEFAULT
+        self.engine = ENGINE_QT
+        self.use_proxy = False
         # self._update_slider_value = True
         
     def _init_ui(self):
@@ -79,7 +85,8 @@ class Controller(QWidget):
         l1.addWidget(self.current_label)
         layout.addLayout(l1)
         
-        self.slider = QSlider(Qt.Horizontal)
+        self.slider = ThumbSlider(Qt.Horizontal)
+        self.slider.thumbnail_fn = self.thumbnail_at
         self.slider.sliderMoved.connect(self.seek_slider)
         self._set_slider_style()
         layout.addWidget(self.slider)
@@ -92,23 +99,49 @@ class Controller(QWidget):
         self.seek_timer.timeout.connect(self._do_seek)
         self.pending_seek_ms = 0
         
+        # reverse playback drives every viewer from one clock, served from the ring buffer of the OpenCV engine
+        self.reverse_timer = QTimer()
+        self.reverse_timer.setInterval(REVERSE_INTERVAL)
+        self.reverse_timer.timeout.connect(self._reverse_tick)
+        self.reverse_clock = QElapsedTimer()
+        self.reverse_start_ms = 0
+        self.shuttle_speed = 0
+        
     def connect_menubar(self, menubar: MenuBuilder):
         menubar.load_video_requested.connect(self.load_video)
+        menubar.opencv_engine_toggled.connect(self.use_opencv_engine)
+        menubar.proxy_toggled.connect(self.use_proxies)
+        
+    def use_opencv_engine(self, enabled: bool):
+        # applies to videos opened afterwards
+        self.engine = ENGINE_OPENCV if enabled else ENGINE_QT
+        
+    def use_proxies(self, enabled: bool):
+        # viewers play low-resolution proxies, positions stay in the timebase of the original videos
+        self.use_proxy = enabled
+        for viewer in self.viewers:
+            if viewer is not None:
+                viewer.enable_proxy(enabled)
         
     def load_video(self):
         video_path, _ = QFileDialog.getOpenFileName(self, "Open Video File", "", "Video Files (*.mp4 *.avi *.mov)")
         if video_path:
-            viewer = VideoViewerWindow(video_path, len(self.viewers))
+            viewer = VideoViewerWindow(video_path, len(self.viewers), engine=self.engine, meta_fn=self._update_min_fps)
             viewer.show()
+            if self.use_proxy:
+                viewer.enable_proxy(True)
             
             self.viewers.append(viewer)
             viewer.closed.connect(self.closed_video)
+            if viewer.meta is not None:
+                self._update_min_fps(viewer.meta)
             
             if self.num_video == 1:
                 self._connect_viewer_signals(viewer)
-
-            if viewer.fps < self.min_fps:
-                self.min_fps = np.ceil(viewer.fps).astype(int)
+                
+    def _update_min_fps(self, meta):
+        if 0 < meta.fps < self.min_fps:
+            self.min_fps = np.ceil(meta.fps).astype(int)
                 
     def closed_video(self, vid: int):
         self.viewers[vid] = None
@@ -125,9 +158,11 @@ class Controller(QWidget):
                 viewer.close()
     
     def _connect_viewer_signals(self, viewer):
-        viewer.media_player.durationChanged.connect(self.update_duration)
-        viewer.media_player.positionChanged.connect(self.update_slider_position)
-        self.update_duration(duration_ms=viewer.duration_ms)
+        viewer.duration_changed.connect(self.update_duration)
+        viewer.position_changed.connect(self.update_slider_position)
+        if viewer.duration_ms > 0:
+            # otherwise the duration arrives with the video information
+            self.update_duration(duration_ms=viewer.duration_ms)
             
     def update_duration(self, duration_ms: float=None):
         self.slider.setRange(0, duration_ms)
@@ -145,6 +180,15 @@ class Controller(QWidget):
         self.pending_seek_ms += delta_ms
         self.seek_timer.start(PENDING_TIME)
         
+    def step_frame(self, num_frames):
+        index = self.video_index
+        if index is None:
+            self.seek_relative(num_frames * int(1000/self.min_fps))
+            return
+        # step from the already pending target so that repeated presses stay frame-exact
+        base = self.current + self.pending_seek_ms
+        self.seek_relative(index.step(base, num_frames) - base)
+        
     def _do_seek(self):
         if self.pending_seek_ms != 0:
             new_pos = max(0, self.current + self.pending_seek_ms) # ms
@@ -178,7 +222,52 @@ class Controller(QWidget):
             if viewer is not None:
                 viewer.setPlayrate(value)
         
+    def shuttle(self, step: int):
+        # nearest shuttle speed to the current state, then move `step` speeds up/down
+        current = min(SHUTTLE_SPEEDS, key=lambda v: abs(v - self.shuttle_speed))
+        n = SHUTTLE_SPEEDS.index(current) + step
+        n = min(max(n, 0), len(SHUTTLE_SPEEDS) - 1)
+        self.set_shuttle_speed(SHUTTLE_SPEEDS[n])
+        
+    def set_shuttle_speed(self, speed):
+        if speed < 0 and not self.can_reverse:
+            # Qt's player would seek again on every step, only the OpenCV engine keeps decoded frames around
+            raise ValueError("Reverse playback needs the videos to be opened with the OpenCV engine")
+        self._stop_reverse()
+        if speed > 0:
+            self.speed_box.setValue(speed)
+            if not self.playing_state:
+                self.toggle_play()
+        else:
+            if self.playing_state:
+                self.toggle_play()
+            if speed < 0:
+                self.reverse_start_ms = self.current
+                self.reverse_clock.start()
+                self.reverse_timer.start()
+                self.toggle_play_button.setText("◀")
+        self.shuttle_speed = speed
+        
+    def _stop_reverse(self):
+        if self.reverse_timer.isActive():
+            self.reverse_timer.stop()
+            self.toggle_play_button.setText("▶")
+            
+    def _reverse_tick(self):
+        position_ms = self.reverse_start_ms + self.reverse_clock.elapsed() * self.shuttle_speed
+        if position_ms <= 0:
+            position_ms = 0
+            self._stop_reverse()
+            self.shuttle_speed = 0
+        self.update_position(int(position_ms))
+        
     def toggle_play(self):
+        if self.reverse_timer.isActive():
+            self._stop_reverse()
+            self.shuttle_speed = 0
+            return
+        
+        self.shuttle_speed = 0 if self.playing_state else self.speed_box.value()
         if self.playing_state:
             self.toggle_play_button.setText("▶")
             for viewer in self.viewers:
@@ -212,13 +301,17 @@ class Controller(QWidget):
             if key == Qt.Key_Space:
                 self.toggle_play()
             elif key == Qt.Key_H:
-                self.seek_relative(-int(1000/self.min_fps))
+                self.step_frame(-1)
             elif key == Qt.Key_L:
-                self.seek_relative(int(1000/self.min_fps))
+                self.step_frame(1)
             elif key == Qt.Key_J: # speed down
                 self.update_speed_relative(-0.1)
             elif key == Qt.Key_K: # speed up
                 self.update_speed_relative(0.1)
+            elif key == Qt.Key_BracketLeft: # shuttle backward
+                self.shuttle(-1)
+            elif key == Qt.Key_BracketRight: # shuttle forward
+                self.shuttle(1)
             else:
                 raise ValueError(f"Key {key} not recognized in Controller")            
     
@@ -229,7 +322,28 @@ class Controller(QWidget):
         else:
             for viewer in self.viewers:
                 if viewer is not None:
-                    return viewer.media_player.position()
+                    return viewer.position()
+        
+    def thumbnail_at(self, time_ms):
+        # thumbnails of the reference (first) video
+        for viewer in self.viewers:
+            if viewer is not None:
+                if viewer.thumbnails is None:
+                    return None
+                return viewer.thumbnails.nearest(time_ms)
+        return None
+    
+    @property
+    def video_index(self):
+        # frames are stepped on the timeline of the reference (first) video
+        for viewer in self.viewers:
+            if viewer is not None:
+                return viewer.video_index
+        return None
+        
+    @property
+    def can_reverse(self):
+        return all(viewer.engine == ENGINE_OPENCV for viewer in self.viewers if viewer is not None)
         
     @property
     def num_video(self):
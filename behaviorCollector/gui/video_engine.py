@@ -0,0 +1,288 @@
+import cv2
+import numpy as np
+import threading
+from PyQt5.QtCore import QObject, QTimer, QElapsedTimer, pyqtSignal
+from ..processing.frame_cache import FrameCache, FrameRing
+
+
+ENGINE_QT = "qt"
+ENGINE_OPENCV = "opencv"
+VIDEO_ENGINES = (ENGINE_QT, ENGINE_OPENCV)
+
+CACHE_BUDGET_MB = 512
+RING_BUDGET_MB = 256
+RING_BEHIND = 30        # frames kept behind the playhead, swapped with RING_AHEAD in reverse
+RING_AHEAD = 60
+BACKFILL_FRAMES = 15    # frames decoded per seek when filling backwards without a keyframe index
+SEEK_GAP_FRAMES = 60    # decode forward instead of seeking when the target is this close ahead
+NOTIFY_INTERVAL = 100   # ms, positionChanged rate during playback
+TICK_INTERVAL = 5       # ms, playback clock resolution
+
+
+class FrameDecoder(threading.Thread):
+    """Decodes requested frames, then keeps the ring buffer around the playhead filled while idle."""
+
+    def __init__(self, video_path, cache: FrameCache, ring: FrameRing, on_frame, num_frames: int):
+        super().__init__(daemon=True)
+        self.video_path = video_path
+        self.cache = cache
+        self.ring = ring
+        self.on_frame = on_frame # called from the decoder thread with (frame_no, frame)
+        self.num_frames = num_frames
+        self.index = None
+        self.intra_only = False # every frame is a keyframe (proxies), seek straight to it
+        self.ring_budget = int(RING_BUDGET_MB * 1024**2)
+        self._cond = threading.Condition()
+        self._target = None
+        self._next = 0 # frame number returned by the next grab()
+        self._stop = False
+
+    def request(self, frame_no: int):
+        with self._cond:
+            self._target = frame_no
+            self.ring.recenter(frame_no)
+            self._cond.notify()
+
+    def set_num_frames(self, num_frames: int):
+        with self._cond:
+            self.num_frames = num_frames
+            self._cond.notify()
+
+    def set_direction(self, direction: int):
+        with self._cond:
+            self.ring.set_direction(direction)
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+
+    def run(self):
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            while True:
+                with self._cond:
+                    if self._stop:
+                        break
+                    target, self._target = self._target, None
+                    missing = self.ring.next_missing(self.num_frames) if target is None else None
+                    if target is None and missing is None:
+                        self._cond.wait()
+                        continue
+
+                if target is not None:
+                    frame = self.ring.get(target)
+                    if frame is None:
+                        frame = self.cache.peek(target)
+                    if frame is None:
+                        frame = self._decode_to(cap, target)
+                    if frame is not None:
+                        self.ring.put(target, frame)
+                        self.on_frame(target, frame)
+                elif self._decode_to(cap, missing, backward=missing < self.ring.center) is None:
+                    # end of stream, nothing left to prefetch
+                    with self._cond:
+                        self.num_frames = min(self.num_frames, missing)
+        finally:
+            cap.release()
+
+    def _seek(self, cap, frame_no, backward=False):
+        if self.intra_only:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
+            self._next = frame_no
+            return
+        if self.index is not None and len(self.index.keyframes) > 0:
+            self._next = self.index.seek(cap, frame_no)
+            return
+        if backward:
+            # keyframes unknown, decode a chunk forward so one seek serves several frames behind the playhead
+            frame_no = max(frame_no - BACKFILL_FRAMES, self.ring.center - self.ring.behind, 0)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
+        self._next = frame_no
+
+    def _decode_to(self, cap, frame_no, backward=False):
+        if frame_no < self._next or frame_no - self._next > SEEK_GAP_FRAMES:
+            self._seek(cap, frame_no, backward=backward)
+
+        frame = None
+        while self._next <= frame_no:
+            if not cap.grab():
+                return None
+            k = self._next
+            self._next += 1
+            if k == frame_no or (self.ring.in_window(k) and self.ring.get(k) is None):
+                ret, frame = cap.retrieve()
+                if not ret:
+                    return None
+                if self.ring_budget is not None:
+                    self.ring.fit_budget(frame.nbytes, self.ring_budget)
+                    self.ring_budget = None
+                self.ring.put(k, frame)
+                self.cache.put(k, frame)
+        return frame
+
+
+class CvMediaPlayer(QObject):
+    """Subset of the QMediaPlayer interface driven by OpenCV decoding and a decoded-frame cache."""
+
+    positionChanged = pyqtSignal('qint64')
+    durationChanged = pyqtSignal('qint64')
+    frame_ready = pyqtSignal(object)
+    _decoded = pyqtSignal(int, object)
+
+    def __init__(self, video_path, fps, num_frames, cache_budget_mb=CACHE_BUDGET_MB, parent=None):
+        super().__init__(parent)
+        self.fps = fps if fps > 1e-3 else 30
+        self.num_frames = num_frames
+        self.index = None
+        self.rate = 1.0
+        self.playing = False
+
+        self._position = 0
+        self._frame = -1 # frame that should be on screen
+        self._shown = -1 # frame that is on screen
+        self._play_start_ms = 0
+        self._direction = 1
+        self._hits = 0 # frames shown from the ring buffer or the cache, the only hit statistics
+        self._misses = 0
+
+        self.cache = FrameCache(int(cache_budget_mb * 1024**2))
+        self.ring = FrameRing(RING_BEHIND, RING_AHEAD)
+        self._decoded.connect(self._on_decoded)
+        self.decoder = None
+        self.set_source(video_path)
+
+        self.clock = QElapsedTimer()
+        self.notify_clock = QElapsedTimer()
+        self.timer = QTimer(self)
+        self.timer.setInterval(TICK_INTERVAL)
+        self.timer.timeout.connect(self._tick)
+
+        QTimer.singleShot(0, lambda: self.setPosition(0))
+
+    def set_source(self, video_path, intra_only=False):
+        """(Re)start decoding from video_path, which must have the same frames as the original video."""
+        if self.decoder is not None:
+            self.decoder.stop()
+        self.cache.clear()
+        self.ring.resize(RING_BEHIND, RING_AHEAD)
+        self._direction = 1
+        
+        self.decoder = FrameDecoder(video_path, self.cache, self.ring, self._decoded.emit, self.num_frames)
+        self.decoder.index = self.index
+        self.decoder.intra_only = intra_only
+        self.decoder.start()
+        self._frame = self._shown = -1
+        
+    def set_index(self, index):
+        self.index = index
+        self.num_frames = index.num_frames
+        self.decoder.index = index
+        self.decoder.set_num_frames(index.num_frames)
+        self.durationChanged.emit(self.duration())
+        
+    def set_video_info(self, fps, num_frames):
+        # nominal values from the metadata probe, the frame index takes precedence once available
+        self.fps = fps if fps > 1e-3 else 30
+        if self.index is None:
+            self.num_frames = num_frames
+            self.decoder.set_num_frames(num_frames)
+            self.durationChanged.emit(self.duration())
+
+    def frame_at(self, position_ms):
+        if self.index is not None:
+            return self.index.frame_at(position_ms)
+        n = int(position_ms * self.fps / 1000)
+        return min(max(n, 0), max(self.num_frames - 1, 0))
+
+    def time_of(self, frame_no):
+        if self.index is not None:
+            return self.index.time_of(frame_no)
+        return int(np.ceil(frame_no * 1000 / self.fps))
+
+    def duration(self):
+        if self.index is not None:
+            return self.index.duration_ms
+        return int(self.num_frames / self.fps * 1e3)
+
+    def position(self):
+        return self._position
+
+    def setPosition(self, position_ms):
+        self._position = int(min(max(position_ms, 0), self.duration()))
+        if self.playing:
+            self._play_start_ms = self._position
+            self.clock.restart()
+        self._show(self.frame_at(self._position))
+        self.positionChanged.emit(self._position)
+
+    def play(self):
+        if self.playing:
+            return
+        self.playing = True
+        self._play_start_ms = self._position
+        self.clock.start()
+        self.notify_clock.start()
+        self.timer.start()
+
+    def pause(self):
+        if not self.playing:
+            return
+        self.playing = False
+        self.timer.stop()
+        self.positionChanged.emit(self._position)
+
+    def setPlaybackRate(self, rate: float):
+        if self.playing:
+            self._play_start_ms = self._position
+            self.clock.restart()
+        self.rate = rate
+
+    def release(self):
+        self.timer.stop()
+        self.decoder.stop()
+
+    @property
+    def hit_rate(self):
+        total = self._hits + self._misses
+        return self._hits / total if total > 0 else 0
+
+    def _tick(self):
+        position_ms = self._play_start_ms + self.clock.elapsed() * self.rate
+        if position_ms >= self.duration() or position_ms <= 0:
+            self._position = int(min(max(position_ms, 0), self.duration()))
+            self.pause()
+            return
+
+        self._position = int(position_ms)
+        self._show(self.frame_at(self._position))
+        if self.notify_clock.elapsed() >= NOTIFY_INTERVAL:
+            self.notify_clock.restart()
+            self.positionChanged.emit(self._position)
+
+    def _show(self, frame_no):
+        if frame_no == self._frame:
+            return
+        direction = 1 if frame_no > self._frame else -1
+        if direction != self._direction:
+            self._direction = direction
+            self.decoder.set_direction(direction)
+        self._frame = frame_no
+        
+        frame = self.ring.get(frame_no)
+        if frame is None:
+            frame = self.cache.get(frame_no)
+        if frame is not None:
+            self._hits += 1
+            self._shown = frame_no
+            self.frame_ready.emit(frame)
+        else:
+            self._misses += 1
+        self.decoder.request(frame_no) # decodes on a miss, recenters the ring buffer otherwise
+
+    def _on_decoded(self, frame_no, frame):
+        # late frames are dropped, the decoder is already working on the newer request
+        if frame_no == self._frame and frame_no != self._shown:
+            self._shown = frame_no
+            self.frame_ready.emit(frame)
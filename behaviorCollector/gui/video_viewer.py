@@ -1,34 +1,54 @@
-import cv2
+import threading
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QLabel, 
     QGraphicsView, QHBoxLayout, QSpacerItem, QSizePolicy,
-    QGraphicsScene, QToolButton
+    QGraphicsScene, QToolButton, QGraphicsPixmapItem
 )
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
 from PyQt5.QtMultimediaWidgets import QGraphicsVideoItem
 from PyQt5.QtCore import Qt, QUrl, QTimer, QRectF, QSizeF, QPointF, pyqtSignal
-
+from PyQt5.QtGui import QImage, QPixmap
+from ..processing.video_index import VideoIndex
+from ..processing.video_meta import probe_video_async
+from ..processing.video_proxy import build_proxy, find_proxy, ProxyTimebase
+from ..processing.video_thumbs import ThumbnailStore
+from .video_engine import CvMediaPlayer, ENGINE_QT, ENGINE_OPENCV, VIDEO_ENGINES
 
 
 class VideoViewerWindow(QMainWindow):
 
     closed = pyqtSignal(int)
+    meta_ready = pyqtSignal(object)
+    index_ready = pyqtSignal(object)
+    # positions and durations are always in the timebase of the original video
+    position_changed = pyqtSignal('qint64')
+    duration_changed = pyqtSignal('qint64')
+    proxy_ready = pyqtSignal(str)
+    proxy_progress = pyqtSignal(float)
     
-    def __init__(self, video_path, vid: int):
+    def __init__(self, video_path, vid: int, engine: str = ENGINE_QT, meta_fn=None):
         super().__init__()
-        self.setWindowTitle(f"{video_path} - Video Viewer")
+        if engine not in VIDEO_ENGINES:
+            raise ValueError(f"Unknown video engine {engine}")
+        
         self.setMinimumSize(480, 480)
         self.setFocusPolicy(Qt.NoFocus)
         self.vid = vid
+        self.engine = engine
+        self.meta_fn = meta_fn # called with the VideoMeta once the probe finishes
         
         self.video_path = video_path
+        self.play_path = video_path # low-resolution proxy or the original video
         self._init_video(video_path)
+        self._init_proxy()
+        self._init_thumbnails(video_path)
         self._init_ui()
+        self._update_title()
     
     def _init_video(self, video_path):
         # read video information
-        self._load_video_info(video_path) # fps, frame_count
-        self.media_player = QMediaPlayer(None, QMediaPlayer.VideoSurface) # load media player
+        self._load_video_info(video_path) # fps, frame_count, filled in when the probe finishes
+        self._load_video_index(video_path)
         
         # QGraphicsScene setup
         self.scene = QGraphicsScene()
@@ -36,6 +56,19 @@ class VideoViewerWindow(QMainWindow):
         self.view = QGraphicsView(self.scene)
         self.view.setAlignment(Qt.AlignCenter)
         self.enable_zoom = False
+        
+        if self.engine == ENGINE_OPENCV:
+            self._init_cv_player(video_path)
+        else:
+            self._init_qt_player(video_path)
+        self.media_player.positionChanged.connect(self._on_player_position)
+        self.media_player.durationChanged.connect(self._on_player_duration)
+        
+    def _init_qt_player(self, video_path):
+        self.timebase = None # ProxyTimebase while a proxy is played
+        self._resume_ms = 0
+        self._resume_play = False
+        self.media_player = QMediaPlayer(None, QMediaPlayer.VideoSurface) # load media player
 
         # Video item
         self.video_item = QGraphicsVideoItem()
@@ -45,8 +78,127 @@ class VideoViewerWindow(QMainWindow):
         # Connect media player
         self.media_player.setVideoOutput(self.video_item)
         self.media_player.setMedia(QMediaContent(QUrl.fromLocalFile(video_path)))
-        self.media_player.positionChanged.connect(self.update_time_label)
         self.media_player.mediaStatusChanged.connect(self.on_media_status_changed)
+        
+    def _init_cv_player(self, video_path):
+        self.media_player = CvMediaPlayer(video_path, self.fps, self.frame_count, parent=self)
+        self.video_item = QGraphicsPixmapItem()
+        self.scene.addItem(self.video_item)
+        self.media_player.frame_ready.connect(self._show_frame)
+        
+    def _init_proxy(self):
+        self.use_proxy = False
+        self._proxy_thread = None
+        self._proxy_stop = threading.Event()
+        self.proxy_ready.connect(self._on_proxy_ready)
+        self.proxy_progress.connect(self._on_proxy_progress)
+        
+    def _init_thumbnails(self, video_path):
+        # scrub thumbnails are generated once per video in the background and resumed when interrupted
+        self.thumbnails = None
+        self._thumbs_stop = threading.Event()
+        threading.Thread(target=self._build_thumbnails, args=(video_path,), daemon=True).start()
+        
+    def _build_thumbnails(self, path):
+        try:
+            store = ThumbnailStore(path)
+            self.thumbnails = store
+            store.generate(stop_event=self._thumbs_stop)
+        except Exception as e:
+            print(f"Failed to generate thumbnails of {path}: {e}")
+        
+    def enable_proxy(self, enabled: bool):
+        self.use_proxy = enabled
+        if not enabled:
+            self._switch_source(self.video_path)
+            return
+        
+        proxy_path = find_proxy(self.video_path)
+        if proxy_path is not None:
+            self._switch_source(proxy_path)
+        elif self._proxy_thread is None:
+            self._proxy_stop.clear()
+            self._proxy_thread = threading.Thread(target=self._build_proxy, daemon=True)
+            self._proxy_thread.start()
+            
+    def _build_proxy(self):
+        try:
+            proxy_path = build_proxy(self.video_path, progress_fn=self.proxy_progress.emit, stop_event=self._proxy_stop)
+        except Exception as e:
+            print(f"Failed to build proxy of {self.video_path}: {e}")
+            proxy_path = None
+        self._proxy_thread = None
+        if proxy_path is not None:
+            self.proxy_ready.emit(proxy_path)
+            
+    def _on_proxy_ready(self, proxy_path):
+        self._update_title()
+        if self.use_proxy:
+            self._switch_source(proxy_path)
+            
+    def _on_proxy_progress(self, ratio):
+        self._update_title(f"building proxy {ratio*100:.0f}%")
+        
+    def _switch_source(self, path):
+        if path == self.play_path:
+            return
+        
+        position_ms = self.position()
+        self.play_path = path
+        is_proxy = path != self.video_path
+        if self.engine == ENGINE_OPENCV:
+            # proxy frame k is original frame k, the player keeps counting in original frames
+            self.media_player.set_source(path, intra_only=is_proxy)
+            self.media_player.setPosition(position_ms)
+        else:
+            self.timebase = self._make_timebase()
+            self._resume_ms = position_ms
+            self._resume_play = self.media_player.state() == QMediaPlayer.PlayingState
+            self.media_player.setMedia(QMediaContent(QUrl.fromLocalFile(path)))
+        self._update_title()
+        
+    def _make_timebase(self):
+        # built again when the video information arrives, the frame rate is unknown until then
+        if self.play_path == self.video_path or self.fps <= 0:
+            return None
+        return ProxyTimebase(self.fps, index=self.video_index, fps=self.fps)
+        
+    def _update_title(self, status=None):
+        tags = [self.engine]
+        if self.play_path != self.video_path:
+            tags.append("proxy")
+        if status is not None:
+            tags.append(status)
+        self.setWindowTitle(f"{self.video_path} - Video Viewer ({', '.join(tags)})")
+        
+    def _to_source(self, play_ms):
+        if self.engine == ENGINE_QT and self.timebase is not None:
+            return self.timebase.to_source(play_ms)
+        return play_ms
+    
+    def _to_play(self, source_ms):
+        if self.engine == ENGINE_QT and self.timebase is not None:
+            return self.timebase.to_proxy(source_ms)
+        return source_ms
+        
+    def _on_player_position(self, play_ms):
+        position_ms = self._to_source(play_ms)
+        self.update_time_label(position_ms)
+        self.position_changed.emit(position_ms)
+        
+    def _on_player_duration(self, play_ms):
+        self.duration_changed.emit(self._to_source(play_ms))
+        
+    def position(self):
+        return self._to_source(self.media_player.position())
+        
+    def _show_frame(self, frame):
+        h, w = frame.shape[:2]
+        image = QImage(frame.data, w, h, frame.strides[0], QImage.Format_BGR888)
+        resize = self.video_item.pixmap().isNull()
+        self.video_item.setPixmap(QPixmap.fromImage(image))
+        if resize:
+            self._resize()
     
     def _init_ui(self):        
         layout = QVBoxLayout()
@@ -77,36 +229,100 @@ class VideoViewerWindow(QMainWindow):
         self.setCentralWidget(container)
         
     def _load_video_info(self, path):
-        cap = cv2.VideoCapture(path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        self.fps = fps if fps > 1e-3 else 0
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.duration_ms = int(frame_count/self.fps*1e3) if self.fps > 1e-3 else 0
-        cap.release()
+        # probed off the GUI thread (cached per video), the window shows up before the file is opened
+        self.meta = None
+        self.fps = 0
+        self.frame_count = 0
+        self.duration_ms = 0
+        self.meta_ready.connect(self._set_video_info, Qt.QueuedConnection)
+        probe_video_async(path).add_done_callback(self._on_probed)
+        
+    def _on_probed(self, future):
+        try:
+            meta = future.result()
+        except Exception as e:
+            print(f"Failed to read video information of {self.video_path}: {e}")
+            return
+        self.meta_ready.emit(meta)
+        
+    def _set_video_info(self, meta):
+        self.meta = meta
+        self.fps = meta.fps
+        self.frame_count = meta.frame_count
+        self.duration_ms = meta.duration_ms
+        if self.engine == ENGINE_OPENCV:
+            self.media_player.set_video_info(meta.fps, meta.frame_count)
+        else:
+            self.timebase = self._make_timebase()
+        self.update_time_label(self.position())
+        if self.meta_fn is not None:
+            self.meta_fn(meta)
+        
+    def _load_video_index(self, path):
+        # frame timestamps are indexed once per video and cached, until then assume a constant frame rate
+        self.video_index = None
+        self.index_ready.connect(self._set_video_index)
+        threading.Thread(target=self._build_video_index, args=(path,), daemon=True).start()
+        
+    def _build_video_index(self, path):
+        try:
+            index = VideoIndex.load_or_build(path)
+        except Exception as e:
+            print(f"Failed to index {path}: {e}")
+            return
+        self.index_ready.emit(index)
+        
+    def _set_video_index(self, index):
+        if index.num_frames > 0:
+            self.video_index = index
+            if self.engine == ENGINE_OPENCV:
+                self.media_player.set_index(index)
+            elif self.timebase is not None:
+                self.timebase.index = index
+        
+    def frame_at(self, position_ms):
+        if self.video_index is not None:
+            return self.video_index.frame_at(position_ms)
+        return int(position_ms / 1000 * self.fps)
         
     def update_time_label(self, position_ms):
         seconds = position_ms / 1000
-        frame_number = int(seconds * self.fps)
-        self.time_label.setText(f"Time: {seconds:.3f} s / {self.duration_ms/1000:.3f} s | Frame: {frame_number}")
+        frame_number = self.frame_at(position_ms)
+        text = f"Time: {seconds:.3f} s / {self.duration_ms/1000:.3f} s | Frame: {frame_number}"
+        if self.engine == ENGINE_OPENCV:
+            text += f" | Cache hit: {self.media_player.hit_rate*100:.0f}%"
+        self.time_label.setText(text)
 
     def on_media_status_changed(self, status):
         if status == QMediaPlayer.LoadedMedia:
-            self.media_player.setPosition(0)
-            self.media_player.pause()
+            # 0 on the first load, the previous position after switching between proxy and original
+            self.media_player.setPosition(self._to_play(self._resume_ms))
+            if self._resume_play:
+                self.media_player.play()
+            else:
+                self.media_player.pause()
             QTimer.singleShot(100, self._resize)
 
     def update_position(self, position_ms):
-        self.media_player.setPosition(position_ms)
-        QTimer.singleShot(100, self.media_player.pause)
+        if self.video_index is not None:
+            # snap onto the exact timestamp of the displayed frame
+            position_ms = self.video_index.time_of(self.video_index.frame_at(position_ms))
+        self.media_player.setPosition(self._to_play(position_ms))
+        if self.engine == ENGINE_QT:
+            QTimer.singleShot(100, self.media_player.pause)
     
     def resizeEvent(self, event):
         super().resizeEvent(event)
         self._resize()
             
     def _resize(self):
-        video_size = self.video_item.nativeSize()  # 실제 비디오 해상도
+        if self.engine == ENGINE_OPENCV:
+            video_size = QSizeF(self.video_item.pixmap().size())
+        else:
+            video_size = self.video_item.nativeSize()  # 실제 비디오 해상도
         if not video_size.isEmpty():
-            self.video_item.setSize(video_size)
+            if self.engine == ENGINE_QT:
+                self.video_item.setSize(video_size)
             self.scene.setSceneRect(QRectF(QPointF(0, 0), video_size))
             self.view.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
         
@@ -138,6 +354,10 @@ class VideoViewerWindow(QMainWindow):
             self.view.scale(zoom_out_factor, zoom_out_factor)
             
     def closeEvent(self, event):
+        self._proxy_stop.set()
+        self._thumbs_stop.set()
+        if self.engine == ENGINE_OPENCV:
+            self.media_player.release()
         self.closed.emit(self.vid)
         super().closeEvent(event)
     
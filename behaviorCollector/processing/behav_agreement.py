@@ -0,0 +1,237 @@
+import os
+import warnings
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from itertools import combinations
+from typing import List
+from .behav_container import BehavInfo, EVENT, load_behav_set
+from .behav_labels import rasterize, frame_times
+
+
+TOLERANCE_MS = 500 # onsets / offsets / marks closer than this are the same boundary
+DEFAULT_FPS = 30 # frame grid when none of the annotated videos can be read
+
+
+@dataclass
+class Agreement:
+    """Agreement between the raters of one video set.
+
+    cohen[p, k] is Cohen's kappa of rater pair pairs[p] on behavior k, fleiss[k]
+    Fleiss' kappa of all raters. confusion[p] counts frames labeled i by the first
+    rater of the pair and j by the second, the last row / column being no behavior.
+    matching has one row per rater pair, behavior and boundary (onset, offset, event).
+    """
+    raters: List[str]
+    behaviors: List[str]
+    types: List[str]
+    num_frames: int = 0
+    pairs: List = field(default_factory=list)
+    cohen: np.ndarray = None
+    fleiss: np.ndarray = None
+    confusion: np.ndarray = None
+    matching: np.ndarray = None
+
+
+def cohen_kappa(a, b):
+    """Cohen's kappa of every column of two boolean (n_frames, n_behaviors) matrices."""
+    a, b = np.asarray(a, dtype=bool), np.asarray(b, dtype=bool)
+    observed = (a == b).mean(axis=0)
+    pa, pb = a.mean(axis=0), b.mean(axis=0)
+    expected = pa * pb + (1 - pa) * (1 - pb)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(expected < 1, (observed - expected) / (1 - expected), np.nan)
+
+
+def fleiss_kappa(labels):
+    """Fleiss' kappa of every column of a boolean (n_raters, n_frames, n_behaviors) stack."""
+    labels = np.asarray(labels, dtype=bool)
+    num_raters = labels.shape[0]
+    if num_raters < 2:
+        raise ValueError("Fleiss' kappa needs at least two raters")
+    positive = labels.sum(axis=0, dtype=np.int64)
+    negative = num_raters - positive
+    per_frame = (positive * (positive - 1) + negative * (negative - 1)) / (num_raters * (num_raters - 1))
+    observed = per_frame.mean(axis=0)
+    p = positive.mean(axis=0) / num_raters
+    expected = p ** 2 + (1 - p) ** 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(expected < 1, (observed - expected) / (1 - expected), np.nan)
+
+
+def confusion_matrix(a, b):
+    """(n_behaviors + 1) square frame counts of label i in a against label j in b, last index = none."""
+    a = np.concatenate([a, ~a.any(axis=1, keepdims=True)], axis=1)
+    b = np.concatenate([b, ~b.any(axis=1, keepdims=True)], axis=1)
+    # float BLAS product, exact far beyond any frame count
+    return (a.T.astype(np.float64) @ b.astype(np.float64)).astype(np.int64)
+
+
+def _nearest(x, y):
+    # position in sorted y of the value nearest to each x
+    n = np.searchsorted(y, x)
+    lo = np.clip(n - 1, 0, len(y) - 1)
+    hi = np.clip(n, 0, len(y) - 1)
+    return np.where(np.abs(y[hi] - x) < np.abs(x - y[lo]), hi, lo)
+
+
+def match_times(a, b, tolerance_ms: float = TOLERANCE_MS):
+    """Number of one-to-one matches between two sets of times within tolerance_ms.
+
+    A time of a and a time of b match when each is the other's nearest neighbor.
+    """
+    a, b = np.sort(np.asarray(a)), np.sort(np.asarray(b))
+    if len(a) == 0 or len(b) == 0:
+        return 0
+    to_b, to_a = _nearest(a, b), _nearest(b, a)
+    mutual = to_a[to_b] == np.arange(len(a))
+    return int(np.count_nonzero(mutual & (np.abs(b[to_b] - a) <= tolerance_ms)))
+
+
+def _align(behav_sets):
+    # behaviors matched by name across raters, a rater without a behavior gets an empty one
+    names, types = [], []
+    for behav_set in behav_sets:
+        for b in behav_set:
+            if b.name not in names:
+                names.append(b.name)
+                types.append(b.type)
+    aligned = []
+    for behav_set in behav_sets:
+        by_name = {b.name: b for b in behav_set}
+        aligned.append([
+            by_name.get(name) or BehavInfo(name=name, id=-1, note="", type=tp, color_code="")
+            for name, tp in zip(names, types)
+        ])
+    return names, types, aligned
+
+
+def _frame_grid(behav_sets, fps=None):
+    if fps is None:
+        for behav_set in behav_sets:
+            for b in behav_set:
+                for video_path in b.video_path or []:
+                    if video_path and os.path.exists(video_path):
+                        return frame_times(video_path)
+        fps = DEFAULT_FPS
+    end_ms = max([int(b.time_ms.ends.max()) for behav_set in behav_sets for b in behav_set
+                  if b.time_ms is not None and len(b.time_ms) > 0] + [0])
+    return np.arange(0, end_ms + 1e3 / fps, 1e3 / fps)
+
+
+def compare_raters(paths, tolerance_ms: float = TOLERANCE_MS, fps: float = None):
+    """Agreement of the annotations saved at paths (one per rater) for the same videos.
+
+    The frame grid is the one of the first annotated video that can be opened, or a
+    uniform grid at fps (DEFAULT_FPS when no video is found).
+    """
+    if len(paths) < 2:
+        raise ValueError("Please give at least two annotation directories to compare")
+    behav_sets = [load_behav_set(path) for path in paths]
+    names, types, aligned = _align(behav_sets)
+    pts_ms = _frame_grid(behav_sets, fps=fps)
+    labels = np.stack([rasterize(behav_set, pts_ms) for behav_set in aligned])
+
+    pairs = list(combinations(range(len(paths)), 2))
+    rows = []
+    for i, j in pairs:
+        for k, (name, tp) in enumerate(zip(names, types)):
+            a, b = aligned[i][k].time_ms, aligned[j][k].time_ms
+            a_starts = a.starts if a is not None else np.zeros(0, dtype=np.int64)
+            b_starts = b.starts if b is not None else np.zeros(0, dtype=np.int64)
+            bounds = [("event", a_starts, b_starts)] if tp == EVENT else [
+                ("onset", a_starts, b_starts),
+                ("offset", a.ends if a is not None else a_starts, b.ends if b is not None else b_starts)
+            ]
+            for boundary, ta, tb in bounds:
+                rows.append((i, j, name, boundary, len(ta), len(tb), match_times(ta, tb, tolerance_ms)))
+
+    matching = np.array(rows, dtype=[
+        ("rater_a", np.int64), ("rater_b", np.int64),
+        ("behavior", f"U{max([len(n) for n in names] + [1])}"), ("boundary", "U6"),
+        ("num_a", np.int64), ("num_b", np.int64), ("matched", np.int64)
+    ])
+    return Agreement(
+        raters=[str(p) for p in paths],
+        behaviors=names,
+        types=types,
+        num_frames=len(pts_ms),
+        pairs=pairs,
+        cohen=np.array([cohen_kappa(labels[i], labels[j]) for i, j in pairs]),
+        fleiss=fleiss_kappa(labels),
+        confusion=np.array([confusion_matrix(labels[i], labels[j]) for i, j in pairs]),
+        matching=matching
+    )
+
+
+def find_video_sets(rater_roots):
+    """{name: [path per rater]} of the annotation directories found under every rater root.
+
+    Each rater keeps one sub-directory (or .bcs session) per video set, with the same
+    name for every rater; names missing for some rater are skipped.
+    """
+    names = None
+    for root in rater_roots:
+        found = set(os.listdir(root))
+        names = found if names is None else names & found
+    return {
+        name: [os.path.join(root, name) for root in rater_roots]
+        for name in sorted(names or [])
+    }
+
+
+def compare_sets(video_sets, num_workers: int = None, tolerance_ms: float = TOLERANCE_MS,
+                 fps: float = None, tqdm_fn=None):
+    """compare_raters on every video set (a list of annotation paths each), in worker processes.
+
+    Results are in the order of video_sets, None for the sets that failed.
+    """
+    video_sets = [list(paths) for paths in video_sets]
+    results = [None] * len(video_sets)
+    bar = tqdm_fn(total=len(video_sets), desc="Comparing raters") if tqdm_fn is not None else None
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        futures = {pool.submit(compare_raters, paths, tolerance_ms, fps): n for n, paths in enumerate(video_sets)}
+        for f in as_completed(futures):
+            n = futures[f]
+            if f.exception() is not None:
+                warnings.warn(f"Failed to compare {video_sets[n]}: {f.exception()}")
+            else:
+                results[n] = f.result()
+            if bar is not None:
+                bar.update()
+    if bar is not None:
+        bar.close()
+    return results
+
+
+def agreement_table(results, names=None):
+    """Tidy structured array with one row per video set and behavior.
+
+    Fields: set, behavior, type, fleiss, cohen (mean over rater pairs) and onset_match /
+    offset_match, the share of boundaries matched over all pairs (2 * matched / (num_a + num_b)).
+    Event marks are reported as onsets, offset_match is NaN for them.
+    """
+    if names is None:
+        names = [os.path.basename(os.path.normpath(r.raters[0])) if r is not None else None for r in results]
+    rows = []
+    for name, r in zip(names, results):
+        if r is None:
+            continue
+        for k, (behavior, tp) in enumerate(zip(r.behaviors, r.types)):
+            share = []
+            for boundary in (("event",) if tp == EVENT else ("onset", "offset")):
+                m = r.matching[(r.matching["behavior"] == behavior) & (r.matching["boundary"] == boundary)]
+                total = m["num_a"].sum() + m["num_b"].sum()
+                share.append(2 * m["matched"].sum() / total if total > 0 else np.nan)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning) # all-NaN kappas of empty behaviors
+                cohen = np.nanmean(r.cohen[:, k])
+            rows.append((name, behavior, tp, r.fleiss[k], cohen, share[0], share[1] if len(share) > 1 else np.nan))
+
+    return np.array(rows, dtype=[
+        ("set", f"U{max([len(row[0]) for row in rows] + [1])}"),
+        ("behavior", f"U{max([len(row[1]) for row in rows] + [1])}"),
+        ("type", "U5"),
+        ("fleiss", np.float64), ("cohen", np.float64),
+        ("onset_match", np.float64), ("offset_match", np.float64)
+    ])
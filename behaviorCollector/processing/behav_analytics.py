@@ -0,0 +1,261 @@
+import csv
+import os
+import numpy as np
+from .behav_container import BehavInfo, EVENT, load_behav_set
+
+
+BIN_MS = 60 * 1000 # ethogram bin, one minute
+
+
+class EpochTable:
+    """Epochs of many sessions flattened into parallel NumPy columns.
+
+    Behaviors are matched across sessions by name. Row i is an epoch of behavior
+    `behaviors[behav[i]]` in session `sessions[session[i]]`, rows are sorted by
+    (session, behavior, start). Events are epochs with end == start.
+    """
+
+    def __init__(self, sessions):
+        self.sessions, self.behaviors, self.types = [], [], []
+        index, chunks = {}, []
+        for s, (name, behav_set) in enumerate(_as_sessions(sessions)):
+            self.sessions.append(name)
+            for b in behav_set:
+                if b.name not in index:
+                    index[b.name] = len(self.behaviors)
+                    self.behaviors.append(b.name)
+                    self.types.append(b.type)
+                if b.time_ms is None or len(b.time_ms) == 0:
+                    continue
+                chunks.append((s, index[b.name], b.time_ms))
+
+        # each behavior is already sorted by start, ordering the chunks is enough
+        chunks.sort(key=lambda c: c[:2])
+        num = [len(epochs) for _, _, epochs in chunks]
+        self.session = np.repeat(np.array([c[0] for c in chunks], dtype=np.int64), num)
+        self.behav = np.repeat(np.array([c[1] for c in chunks], dtype=np.int64), num)
+        self.starts = np.concatenate([c[2].starts for c in chunks]) if chunks else np.zeros(0, dtype=np.int64)
+        self.ends = np.concatenate([c[2].ends for c in chunks]) if chunks else np.zeros(0, dtype=np.int64)
+        if len(set(c[:2] for c in chunks)) < len(chunks):
+            # the same name twice in a session, its epochs have to be merged
+            order = np.lexsort((self.starts, self.group))
+            self.session, self.behav, self.starts, self.ends = [
+                c[order] for c in (self.session, self.behav, self.starts, self.ends)]
+
+    @property
+    def num_groups(self):
+        return len(self.sessions) * len(self.behaviors)
+
+    @property
+    def group(self):
+        # flat (session, behavior) index
+        return self.session * len(self.behaviors) + self.behav
+
+    @property
+    def is_event(self):
+        return np.array([tp == EVENT for tp in self.types], dtype=bool)
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def _as_sessions(sessions):
+    # [(name, behav_set)] from a collector, a behav_set, a saved path, or a list / dict of those
+    if isinstance(sessions, EpochTable):
+        raise ValueError("Pass the sessions themselves, not an EpochTable")
+    if isinstance(sessions, dict):
+        return [(str(name), _as_behav_set(s)) for name, s in sessions.items()]
+    if hasattr(sessions, "behav_set") or isinstance(sessions, str) or _is_behav_set(sessions):
+        sessions = [sessions]
+    res = []
+    for n, s in enumerate(sessions):
+        name = os.path.basename(os.path.normpath(s)) if isinstance(s, str) else f"session{n}"
+        res.append((name, _as_behav_set(s)))
+    return res
+
+
+def _is_behav_set(obj):
+    return isinstance(obj, (list, tuple)) and len(obj) > 0 and all(isinstance(b, BehavInfo) for b in obj)
+
+
+def _as_behav_set(session):
+    if isinstance(session, str):
+        return load_behav_set(session)
+    if hasattr(session, "behav_set"):
+        return session.behav_set
+    return list(session)
+
+
+def _as_table(sessions):
+    return sessions if isinstance(sessions, EpochTable) else EpochTable(sessions)
+
+
+def _session_order(table):
+    # rows ordered by (session, start), one sort on a combined key is much faster than lexsort
+    if len(table) == 0:
+        return np.zeros(0, dtype=np.int64)
+    offset = int(table.starts.min())
+    span = int(table.starts.max()) - offset + 1
+    if span * len(table.sessions) < 2 ** 62:
+        return np.argsort(table.session * span + (table.starts - offset), kind="stable")
+    return np.lexsort((table.starts, table.session))
+
+
+def behavior_stats(sessions):
+    """Bout statistics per session and behavior, as a tidy structured array.
+
+    sessions: a BehavCollector, a behav_set, a saved path (directory, .bcs), a list of
+    those or a dict name -> session; an EpochTable is reused as is.
+    Fields: session, behavior, type, count, total_ms, mean_ms, latency_ms (start of the
+    first bout) and mean_ibi_ms (onset to previous offset). Events count as zero-length
+    bouts. Empty behaviors get count 0 and NaN for the undefined fields.
+    """
+    table = _as_table(sessions)
+    num_groups = table.num_groups
+    group = table.group
+    durations = table.ends - table.starts
+
+    count = np.bincount(group, minlength=num_groups)
+    total = np.bincount(group, weights=durations, minlength=num_groups)
+    latency = np.full(num_groups, np.nan)
+    ibi_sum = np.zeros(num_groups)
+    if len(group) > 0:
+        first = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+        latency[group[first]] = table.starts[first]
+        same = group[1:] == group[:-1]
+        ibi_sum = np.bincount(group[1:][same], weights=(table.starts[1:] - table.ends[:-1])[same],
+                              minlength=num_groups)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, total / count, np.nan)
+        mean_ibi = np.where(count > 1, ibi_sum / (count - 1), np.nan)
+
+    num_behav = len(table.behaviors)
+    dtype = [
+        ("session", f"U{max([len(s) for s in table.sessions] + [1])}"),
+        ("behavior", f"U{max([len(b) for b in table.behaviors] + [1])}"),
+        ("type", "U5"),
+        ("count", np.int64),
+        ("total_ms", np.int64),
+        ("mean_ms", np.float64),
+        ("latency_ms", np.float64),
+        ("mean_ibi_ms", np.float64)
+    ]
+    stats = np.zeros(num_groups, dtype=dtype)
+    stats["session"] = np.repeat(table.sessions, num_behav) if num_groups > 0 else []
+    stats["behavior"] = np.tile(table.behaviors, len(table.sessions)) if num_groups > 0 else []
+    stats["type"] = np.tile(table.types, len(table.sessions)) if num_groups > 0 else []
+    stats["count"] = count
+    stats["total_ms"] = total
+    stats["mean_ms"] = mean
+    stats["latency_ms"] = latency
+    stats["mean_ibi_ms"] = mean_ibi
+    return stats
+
+
+def inter_bout_intervals(sessions):
+    """(session index, behavior index, interval in ms) columns of every inter-bout interval."""
+    table = _as_table(sessions)
+    group = table.group
+    same = group[1:] == group[:-1]
+    return table.session[1:][same], table.behav[1:][same], (table.starts[1:] - table.ends[:-1])[same]
+
+
+def transition_matrix(sessions, include_self: bool = False, max_gap_ms: int = None,
+                      per_session: bool = False, normalize: bool = False):
+    """Counts of behavior a followed by behavior b, with bouts of a session ordered by onset.
+
+    Returns (behavior names, matrix) where matrix[a, b] counts a -> b over all sessions,
+    or matrix[s, a, b] per session. Transitions with more than max_gap_ms between the
+    offset of a and the onset of b are skipped. normalize turns rows into probabilities.
+    """
+    table = _as_table(sessions)
+    num_behav = len(table.behaviors)
+    order = _session_order(table)
+    session, behav = table.session[order], table.behav[order]
+    starts, ends = table.starts[order], table.ends[order]
+
+    keep = session[1:] == session[:-1]
+    if not include_self:
+        keep &= behav[1:] != behav[:-1]
+    if max_gap_ms is not None:
+        keep &= starts[1:] - ends[:-1] <= max_gap_ms
+    src, dst = behav[:-1][keep], behav[1:][keep]
+
+    if per_session:
+        flat = (session[1:][keep] * num_behav + src) * num_behav + dst
+        shape = (len(table.sessions), num_behav, num_behav)
+    else:
+        flat = src * num_behav + dst
+        shape = (num_behav, num_behav)
+    matrix = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+
+    if normalize:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rows = matrix.sum(axis=-1, keepdims=True)
+            matrix = np.where(rows > 0, matrix / np.maximum(rows, 1), 0.)
+    return list(table.behaviors), matrix
+
+
+def ethogram(sessions, bin_ms: int = BIN_MS, duration_ms: int = None):
+    """Time-binned ethogram of shape (sessions, behaviors, bins).
+
+    A State bin holds the time in ms covered by its bouts, an Event bin the number of
+    marks. Bins cover [0, duration_ms), by default up to the last offset of all sessions.
+    Returns (session names, behavior names, ethogram).
+    """
+    table = _as_table(sessions)
+    if duration_ms is None:
+        duration_ms = int(table.ends.max()) + 1 if len(table) > 0 else 0
+    num_bins = -(-duration_ms // bin_ms)
+    width = num_bins + 1 # spill-over column for offsets at the very end, dropped below
+    num_groups = table.num_groups
+
+    group = table.group
+    starts = np.clip(table.starts, 0, num_bins * bin_ms)
+    ends = np.clip(table.ends, 0, num_bins * bin_ms)
+    k0, k1 = starts // bin_ms, ends // bin_ms
+    row = group * width
+
+    is_event = table.is_event[table.behav] if len(table) > 0 else np.zeros(0, dtype=bool)
+    in_range = table.starts < num_bins * bin_ms
+    ev = is_event & in_range
+    st = ~is_event
+
+    # partial first and last bins of each bout, whole bins in between through a difference array
+    one = st & (k0 == k1)
+    many = st & (k0 < k1)
+    size = num_groups * width
+    occupied = np.bincount(row[one] + k0[one], weights=(ends - starts)[one], minlength=size)
+    occupied += np.bincount(row[many] + k0[many], weights=((k0 + 1) * bin_ms - starts)[many], minlength=size)
+    occupied += np.bincount(row[many] + k1[many], weights=(ends - k1 * bin_ms)[many], minlength=size)
+    diff = np.bincount(row[many] + k0[many] + 1, weights=np.full(many.sum(), float(bin_ms)), minlength=size)
+    diff -= np.bincount(row[many] + k1[many], weights=np.full(many.sum(), float(bin_ms)), minlength=size)
+    occupied = occupied.reshape(num_groups, width) + np.cumsum(diff.reshape(num_groups, width), axis=1)
+    occupied += np.bincount(row[ev] + k0[ev], minlength=size).reshape(num_groups, width)
+
+    occupied = occupied[:, :num_bins].reshape(len(table.sessions), len(table.behaviors), num_bins)
+    return list(table.sessions), list(table.behaviors), occupied
+
+
+def occupancy(starts, ends, bin_ms: float, num_bins: int):
+    """Time in ms the epochs [starts, ends) of one behavior cover in each bin of [0, num_bins * bin_ms)."""
+    limit = num_bins * bin_ms
+    starts = np.clip(np.asarray(starts, dtype=np.float64), 0, limit)
+    ends = np.clip(np.asarray(ends, dtype=np.float64), 0, limit)
+    k0 = np.minimum(starts // bin_ms, num_bins - 1).astype(np.int64)
+    k1 = np.minimum(ends // bin_ms, num_bins - 1).astype(np.int64)
+    # the rest of the first bin, minus the rest of the last one, plus whole bins in between
+    whole = np.bincount(k0 + 1, minlength=num_bins + 1) - np.bincount(k1 + 1, minlength=num_bins + 1)
+    occupied = (np.bincount(k0, weights=(k0 + 1) * bin_ms - starts, minlength=num_bins + 1)
+                - np.bincount(k1, weights=(k1 + 1) * bin_ms - ends, minlength=num_bins + 1)
+                + bin_ms * np.cumsum(whole))
+    return occupied[:num_bins]
+
+
+def save_table(table, file_name: str):
+    """Write a structured array (e.g. from behavior_stats) as CSV."""
+    with open(file_name, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(table.dtype.names)
+        writer.writerows(table.tolist())
@@ -3,12 +3,21 @@ from typing import Optional, List, Union
 from collections import defaultdict
 import json
 import os
+import numpy as np
+from .epoch_index import EpochIndex
+from .epoch_ops import apply_op
+from .behav_events import (
+    ChangeNotifier, EPOCHS_ADDED, EPOCHS_REMOVED, EPOCHS_RESET,
+    BEHAVIOR_ADDED, BEHAVIOR_REMOVED, BEHAVIOR_CHANGED, BEHAVIORS_RESET
+)
 
 
 EVENT = "Event"
 STATE = "State"
 BEHAV_TYPES = (EVENT, STATE)
 PREFIX = "behav"
+MAX_UNDO = 50 # bulk epoch operations kept for undo
+EVENT_SPAN_MS = 1 # an Event mark at t covers [t, t + EVENT_SPAN_MS] for lookups, as drawn on the timeline
 
 
 @dataclass
@@ -19,7 +28,11 @@ class BehavInfo:
     type: str
     color_code: str # HEX color code
     video_path: List = None
-    time_ms: str = None
+    time_ms: EpochIndex = None # sorted epochs, ints for Events and [start, end] for States
+    
+    def __post_init__(self):
+        if self.time_ms is not None and not isinstance(self.time_ms, EpochIndex):
+            self.time_ms = EpochIndex.from_times(self.time_ms, point=self.type == EVENT)
     
     # def add_video_path(self, video_path: str):
     #     if self.video_path is None:
@@ -31,7 +44,7 @@ class BehavInfo:
     
     def append(self, time_ms: Union[List, int]=None):
         if self.time_ms is None:
-            self.time_ms = []
+            self.time_ms = EpochIndex(point=self.type == EVENT)
         
         if self.type == EVENT:
             if isinstance(time_ms, list):
@@ -42,18 +55,42 @@ class BehavInfo:
                 raise ValueError("States needs a list of time_ms values")
             self.time_ms.append(time_ms)
             
-    def delete(self, del_time_ms):
+    def extend(self, times):
+        # bulk insert, ints for Events, [start, end] pairs or an (n, 2) array for States
         if self.time_ms is None:
-            return
-        
-        for n, t in enumerate(self.time_ms):
-            if self.type == EVENT:
-                _tr = [t, t+1]
-            else:
-                _tr = t
+            self.time_ms = EpochIndex(point=self.type == EVENT, capacity=len(times))
+        self.time_ms.extend(times)
+            
+    def header(self):
+        """Copy of the behavior without its epochs."""
+        return BehavInfo(name=self.name, id=self.id, note=self.note, type=self.type,
+                         color_code=self.color_code, video_path=self.video_path)
 
-            if del_time_ms >= _tr[0] and del_time_ms <= _tr[1]:
-                self.time_ms.pop(n)
+    def set_epochs(self, starts, ends):
+        # replaces every epoch at once, returns the previous index
+        old = self.time_ms
+        self.time_ms = EpochIndex.from_columns(starts, ends, point=self.type == EVENT)
+        return old
+            
+    def find(self, time_ms):
+        """Positions in time_ms of the epochs containing time_ms."""
+        return self.find_in_range(time_ms, time_ms)
+    
+    def find_in_range(self, start_ms, end_ms):
+        """Positions in time_ms of the epochs overlapping [start_ms, end_ms]."""
+        if self.time_ms is None:
+            return []
+        if self.type == EVENT:
+            return self.time_ms.overlapping(start_ms - EVENT_SPAN_MS, end_ms)
+        return self.time_ms.overlapping(start_ms, end_ms)
+            
+    def delete(self, del_time_ms):
+        # returns the deleted epochs
+        positions = self.find(del_time_ms)
+        deleted = [self.time_ms[n] for n in positions]
+        if positions:
+            self.time_ms.remove_positions(positions)
+        return deleted
     
     def update_video_path(self, video_path: List[str]):
         self.video_path = video_path
@@ -70,7 +107,7 @@ class BehavInfo:
             "type": self.type,
             "video_path": self.video_path,
             "color_code": self.color_code,
-            "time_ms": self.time_ms if self.time_ms is not None else []
+            "time_ms": self.time_ms.tolist() if self.time_ms is not None else []
         }
         with open(file_name, "w") as f:
             json.dump(data, f, indent=4)
@@ -98,6 +135,27 @@ class BehavInfo:
             return len(self.time_ms)
         
         
+def load_behav_set(path: str, session: str = None):
+    """Behaviors saved at path (behav_*.json directory, .bcs session or .sqlite store), sorted by id.
+
+    Unlike BehavCollector.load, the behaviors are returned as a plain list, so that
+    many sessions can be held at once (analysis, agreement, command line).
+    """
+    from .behav_session import is_session_file, load_session
+    from .behav_store import is_store_file, BehavStore
+    if is_session_file(path):
+        _, behav_set = load_session(path)
+    elif is_store_file(path):
+        if session is None:
+            raise ValueError("Please give the name of the session to load from a store")
+        with BehavStore(path, read_only=True) as store:
+            _, behav_set = store.load(session)
+    else:
+        file_behav_set =  [f for f in os.listdir(path) if PREFIX in f and ".json" in f]
+        behav_set = [BehavInfo.load(os.path.join(path, f)) for f in file_behav_set]
+    return sorted(behav_set, key=lambda b: b.id)
+
+
 def is_valid_path(func):
     # TODO: remove this decorator (deprecated)
     def wrapper(self, *args, **kwargs):
@@ -117,23 +175,122 @@ class BehavCollector:
         if not hasattr(cls, "_init"):
             self.behav_set = []
             self.video_path = []
+            self.journal = None # BehavJournal logging every mutation, if any
+            self.undo_stack = [] # (op, {behav_id: EpochIndex before op}) of bulk epoch operations
+            self.notifier = ChangeNotifier() # views subscribe here instead of keeping their own copy
             cls._init = True
         
     def update_video_path(self, video_path: List[str]):
         self.video_path = video_path
         for b in self.behav_set:
             b.update_video_path(video_path)
+        if self.journal is not None:
+            self.journal.video_path(video_path)
     
     @is_valid_path
     def add_behav_time(self, behav_id, time_ms):
         if self.num <= behav_id:
             return
         self.behav_set[behav_id].append(time_ms)
+        self.undo_stack.clear()
+        if self.journal is not None:
+            self.journal.add_time(behav_id, time_ms)
+        t0, t1 = (time_ms, time_ms) if np.isscalar(time_ms) else (min(time_ms), max(time_ms))
+        self.notifier.emit(EPOCHS_ADDED, behav_id, t0, t1, 1)
+        
+    def add_behav_times(self, behav_id, times):
+        if self.num <= behav_id:
+            return
+        self.behav_set[behav_id].extend(times)
+        self.undo_stack.clear()
+        if self.journal is not None:
+            self.journal.add_times(behav_id, times)
+        if len(times) > 0:
+            times = np.asarray(times)
+            self.notifier.emit(EPOCHS_ADDED, behav_id, int(times.min()), int(times.max()), len(times))
         
+    def attach_epochs(self, behav_id, starts, ends):
+        """Merge epochs read from disk into behav_id, next to the ones added in the meantime.
+
+        Not journaled, compact the journal once everything is attached.
+        """
+        b = self.behav_set[behav_id]
+        if len(starts) == 0:
+            return
+        t0, t1, count = int(np.min(starts)), int(np.max(ends)), len(starts)
+        if b.num > 0:
+            starts = np.concatenate([b.time_ms.starts, starts])
+            ends = np.concatenate([b.time_ms.ends, ends])
+            order = np.argsort(starts, kind="stable")
+            starts, ends = starts[order], ends[order]
+        b.set_epochs(starts, ends)
+        self.notifier.emit(EPOCHS_ADDED, behav_id, t0, t1, count)
+
     def delete_behav_time(self, time_ms):
-        # remove all the times 
-        for b in self.behav_set:
-            b.delete(time_ms)
+        # remove all the epochs containing time_ms, returns the removed (behav_id, time_ms) pairs
+        deleted = []
+        with self.notifier.batch():
+            for behav_id, b in enumerate(self.behav_set):
+                removed = b.delete(time_ms)
+                if removed:
+                    t0, t1 = np.min(removed), np.max(removed)
+                    self.notifier.emit(EPOCHS_REMOVED, behav_id, int(t0), int(t1), len(removed))
+                deleted.extend((behav_id, t) for t in removed)
+        if deleted:
+            self.undo_stack.clear()
+        if self.journal is not None and deleted:
+            self.journal.delete_time(time_ms)
+        return deleted
+
+    def transform_epochs(self, op: str, behav_ids=None, **params):
+        """Apply a bulk operation of epoch_ops.EPOCH_OPS to all epochs of behav_ids (default: all behaviors).
+
+        The whole call is undone by a single undo_epochs(). Returns the ids of the changed behaviors.
+        """
+        if behav_ids is None:
+            behav_ids = range(self.num)
+        previous = {}
+        with self.notifier.batch():
+            for behav_id in behav_ids:
+                b = self.behav_set[behav_id]
+                if b.time_ms is None or len(b.time_ms) == 0:
+                    continue
+                res = apply_op(op, b.time_ms.starts, b.time_ms.ends, point=b.type == EVENT, **params)
+                if res is None:
+                    continue
+                previous[behav_id] = b.set_epochs(*res)
+                if self.journal is not None:
+                    self.journal.set_times(behav_id, *res)
+                self.notifier.emit(EPOCHS_RESET, behav_id)
+        if previous:
+            self.undo_stack.append((op, previous))
+            del self.undo_stack[:-MAX_UNDO]
+        return list(previous)
+
+    def undo_epochs(self):
+        """Revert the last transform_epochs call, returns the ids of the restored behaviors."""
+        if not self.undo_stack:
+            return []
+        _, previous = self.undo_stack.pop()
+        with self.notifier.batch():
+            for behav_id, index in previous.items():
+                self.behav_set[behav_id].time_ms = index
+                if self.journal is not None:
+                    self.journal.set_times(behav_id, index.starts, index.ends)
+                self.notifier.emit(EPOCHS_RESET, behav_id)
+        return list(previous)
+    
+    def find_epochs(self, time_ms):
+        """(behav_id, position) of every epoch containing time_ms."""
+        return self.find_epochs_in_range(time_ms, time_ms)
+    
+    def find_epochs_in_range(self, start_ms, end_ms):
+        """(behav_id, position) of every epoch overlapping [start_ms, end_ms]."""
+        return [
+            (behav_id, n)
+            for behav_id, b in enumerate(self.behav_set)
+            for n in b.find_in_range(start_ms, end_ms)
+        ]
 
     def add_behav(self, name: str, note: str, type: str, color_code: str):
         # check first
@@ -152,12 +309,42 @@ class BehavCollector:
                 video_path=self.video_path
             )
         )
+        self.undo_stack.clear()
+        if self.journal is not None:
+            self.journal.add_behav(name, note, type, color_code)
+        self.notifier.emit(BEHAVIOR_ADDED, bid)
         
+    def add_behav_info(self, behav: BehavInfo):
+        """Add a behavior built elsewhere (e.g. by interval_ops) with its epochs, returns its id."""
+        with self.notifier.batch():
+            self.add_behav(name=behav.name, note=behav.note, type=behav.type, color_code=behav.color_code)
+            behav_id = self.num - 1
+            if behav.time_ms is not None and len(behav.time_ms) > 0:
+                starts, ends = behav.time_ms.starts, behav.time_ms.ends
+                self.add_behav_times(behav_id, starts if behav.type == EVENT else np.stack([starts, ends], axis=1))
+        return behav_id
+
     def delete_behav(self, behav_id):
         self.behav_set.pop(behav_id)
+        self.undo_stack.clear()
+        if self.journal is not None:
+            self.journal.delete_behav(behav_id)
+        self.notifier.emit(BEHAVIOR_REMOVED, behav_id)
     
     @is_valid_path
-    def save(self, path_dir: str):
+    def save(self, path_dir: str, session: str = None, cohort: str = None):
+        # a path ending with .bcs is written as a single session file instead of a directory,
+        # a path ending with .sqlite is a store shared by many sessions (session name required)
+        from .behav_session import is_session_file, save_session
+        from .behav_store import is_store_file, BehavStore
+        if is_session_file(path_dir):
+            return save_session(self, path_dir)
+        if is_store_file(path_dir):
+            if session is None:
+                raise ValueError("Please give a session name to save into a store")
+            with BehavStore(path_dir) as store:
+                return store.save(self, session, cohort=cohort)
+        
         if any(os.scandir(path_dir)):
             raise ValueError(f"Directory {path_dir} is not empty")
         
@@ -180,15 +367,18 @@ class BehavCollector:
         return True
     
     @staticmethod
-    def load(path_dir: str):
+    def load(path_dir: str, session: str = None):
         # if self.num != 0:
         #     raise ValueError("Behavior alread loaded. Please create a new BehavCollector instance.")
+        return BehavCollector.from_behav_set(load_behav_set(path_dir, session=session))
+
+    @staticmethod
+    def from_behav_set(behav_set):
+        """Collector with the behaviors of behav_set added, the ones whose name it already has are skipped."""
         behav_collector = BehavCollector()
-        file_behav_set =  [f for f in os.listdir(path_dir) if PREFIX in f and ".json" in f]
         existing_names = [b.name for b in behav_collector.behav_set]
 
-        for f in file_behav_set:
-            b = BehavInfo.load(os.path.join(path_dir, f))
+        for b in behav_set:
             if b.name in existing_names:
                 print(f"Behavior {b.name} already exists.")
                 continue
@@ -198,6 +388,10 @@ class BehavCollector:
         
         # sort
         behav_collector.behav_set = sorted(behav_collector.behav_set, key=lambda b: b.id)
+        if behav_collector.journal is not None:
+            # loaded behaviors are not journaled one by one, checkpoint the whole state instead
+            behav_collector.journal.compact()
+        behav_collector.notifier.emit(BEHAVIORS_RESET)
 
         # for f in behav_set:
         #     behav_collector.behav_set.append(BehavInfo.load(os.path.join(path_dir, f)))
@@ -240,6 +434,9 @@ class BehavCollector:
     def set_value(self, key_id, key, value):
         assert self.num > key_id
         setattr(self.behav_set[key_id], key, value)
+        if self.journal is not None:
+            self.journal.set_value(key_id, key, value)
+        self.notifier.emit(BEHAVIOR_CHANGED, key_id)
     
     def get_type(self, key_id):
         return self.get_value(key_id, "type")
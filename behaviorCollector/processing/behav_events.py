@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+
+# Changes of a BehavCollector, delivered to its subscribers as lists of BehavChange.
+# Views keep no copy of the annotations: on a change they re-read the collector and
+# redraw the range it names.
+EPOCHS_ADDED = "epochs_added"
+EPOCHS_REMOVED = "epochs_removed"
+EPOCHS_RESET = "epochs_reset" # every epoch of the behavior replaced
+BEHAVIOR_ADDED = "behavior_added"
+BEHAVIOR_REMOVED = "behavior_removed" # the following behaviors moved down by one id
+BEHAVIOR_CHANGED = "behavior_changed" # name, type, color or note
+BEHAVIORS_RESET = "behaviors_reset" # anything may have changed, e.g. after loading
+EPOCH_CHANGES = (EPOCHS_ADDED, EPOCHS_REMOVED)
+
+
+@dataclass
+class BehavChange:
+    kind: str
+    behav_id: int = None # None for BEHAVIORS_RESET
+    start_ms: int = None # time range of the added or removed epochs
+    end_ms: int = None
+    count: int = 0
+
+    def overlaps(self, start_ms, end_ms):
+        if self.kind not in EPOCH_CHANGES:
+            return True
+        return self.start_ms <= end_ms and self.end_ms >= start_ms
+
+
+class ChangeNotifier:
+    """Calls every subscriber with the list of changes of each mutation.
+
+    Inside `with notifier.batch():` changes are held back and delivered once when the
+    outermost batch ends, additions or removals of the same behavior merged into one.
+    """
+
+    def __init__(self):
+        self.subscribers = []
+        self._pending = None
+        self._depth = 0
+
+    def subscribe(self, fn):
+        if fn not in self.subscribers:
+            self.subscribers.append(fn)
+
+    def unsubscribe(self, fn):
+        if fn in self.subscribers:
+            self.subscribers.remove(fn)
+
+    def emit(self, kind, behav_id=None, start_ms=None, end_ms=None, count=0):
+        change = BehavChange(kind, behav_id, start_ms, end_ms, count)
+        if self._depth == 0:
+            self._deliver([change])
+        else:
+            self._queue(change)
+
+    def _queue(self, change):
+        pending = self._pending
+        if change.kind == BEHAVIORS_RESET:
+            pending.clear() # a reset covers everything before it
+        elif change.kind in EPOCH_CHANGES:
+            # merged with the last change, unless it is about another behavior
+            last = pending[-1] if pending else None
+            if last is not None and last.kind == change.kind and last.behav_id == change.behav_id:
+                last.start_ms = min(last.start_ms, change.start_ms)
+                last.end_ms = max(last.end_ms, change.end_ms)
+                last.count += change.count
+                return
+        pending.append(change)
+
+    @contextmanager
+    def batch(self):
+        if self._depth == 0:
+            self._pending = []
+        self._depth += 1
+        try:
+            yield self
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                pending, self._pending = self._pending, None
+                if pending:
+                    self._deliver(pending)
+
+    def _deliver(self, changes):
+        for fn in list(self.subscribers):
+            fn(changes)
@@ -1,119 +1,395 @@
 import cv2
 import os
 import warnings
+import multiprocessing
+import queue as queue_mod
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from .behav_container import BehavCollector, EVENT, STATE
+from .video_index import VideoIndex
+from .video_meta import VideoMeta, probe_video
 from tqdm import tqdm
 
 
 FPS_WRITE = 10
 PADDING_MS = 1000  # export window padding before/after behavior
+SEEK_GAP_MS = 10000  # single-pass mode seeks forward only over gaps longer than this
+PTS_TOLERANCE_MS = 0.5  # slack when matching backend timestamps against the frame index
+POLL_INTERVAL = 0.1  # s, progress polling interval of the parallel export
+
+
+@dataclass
+class EpochJob:
+    prefix: str
+    type: str
+    start_ms: int
+    end_ms: int
+
+
+@dataclass
+class ExtractStats:
+    decoded_frames: int = 0
+    written_frames: int = 0 # clip frames + snapshots
+    missed: int = 0
+    
+    def __add__(self, other):
+        return ExtractStats(
+            decoded_frames=self.decoded_frames + other.decoded_frames,
+            written_frames=self.written_frames + other.written_frames,
+            missed=self.missed + other.missed
+        )
+    
+    def __str__(self):
+        return f"Decoded {self.decoded_frames} frames, wrote {self.written_frames} frames"
+
+
+class _NullBar:
+    def update(self, n=1):
+        pass
+    
+    def close(self):
+        pass
+
+
+class _QueueBar:
+    # progress bar stand-in used inside worker processes
+    def __init__(self, queue):
+        self.queue = queue
+        
+    def update(self, n=1):
+        self.queue.put(n)
+        
+    def close(self):
+        pass
+
+
+def _extract_shard(video_path, n, jobs, queue):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        index = _load_index(video_path)
+        meta = _load_meta(video_path)
+        return BehavExtractor._sweep_video(n, cap, jobs, _QueueBar(queue), index=index, meta=meta)
+    finally:
+        cap.release()
+
+
+def _load_index(video_path, build=False):
+    try:
+        if build:
+            return VideoIndex.load_or_build(video_path)
+        return VideoIndex.load(video_path)
+    except Exception as e:
+        warnings.warn(f"Frame index of {video_path} is not available: {e}")
+        return None
+
+
+def _load_meta(video_path):
+    try:
+        return probe_video(video_path)
+    except Exception as e:
+        warnings.warn(f"Video information of {video_path} is not available: {e}")
+        return None
+
+
+def _split_shards(jobs, num_shards):
+    # contiguous time slices so every shard stays a forward-only sweep
+    jobs = sorted(jobs, key=lambda j: (j.start_ms, j.end_ms))
+    num_shards = max(1, min(num_shards, len(jobs)))
+    size, rest = divmod(len(jobs), num_shards)
+    shards, i0 = [], 0
+    for k in range(num_shards):
+        i1 = i0 + size + (1 if k < rest else 0)
+        shards.append(jobs[i0:i1])
+        i0 = i1
+    return shards
 
 
 class BehavExtractor:
-    def __init__(self, bcollector: BehavCollector):
+    def __init__(self, bcollector: BehavCollector, build_index=False):
         self.bcollector = bcollector
-        self.video_capture = [
-            cv2.VideoCapture(path) for path in bcollector.video_path if path is not None
-        ]
+        self.video_path = [path for path in bcollector.video_path if path is not None]
+        self.video_capture = [cv2.VideoCapture(path) for path in self.video_path]
+        # frame-exact timestamps when the video was indexed (e.g. by the viewer), backend timestamps otherwise
+        self.video_index = [_load_index(path, build=build_index) for path in self.video_path]
+        self.video_meta = [_load_meta(path) for path in self.video_path] # shared with the viewer through the probe cache
+        self.stats = ExtractStats()
         
-    def extract_epochs(self, path_dir: str, tqdm_fn=None, selections=None):
+    def extract_epochs(self, path_dir: str, tqdm_fn=None, selections=None, single_pass=False, num_workers=1):
         if any(os.scandir(path_dir)):
             warnings.warn(f"Directory {path_dir} is not empty")
             
         if tqdm_fn is None:
             tqdm_fn = tqdm
+        self.stats = ExtractStats()
+        
+        if num_workers is not None and num_workers > 1:
+            return self._extract_parallel(path_dir, tqdm_fn, selections, num_workers)
+        
+        if single_pass:
+            return self._extract_single_pass(path_dir, tqdm_fn, selections)
         
         for behav_idx, b in enumerate(self.bcollector.behav_set):
-            if not b.time_ms:
+            jobs = self._collect_jobs(path_dir, selections, behav_ids=[behav_idx])
+            if not jobs:
                 continue
 
-            selected_indices = list(range(len(b.time_ms)))
-            if selections is not None:
-                selected = selections.get(behav_idx)
-                # None -> select all epochs for this behavior
-                if selected is None:
-                    selected_indices = list(range(len(b.time_ms)))
-                else:
-                    selected_indices = sorted(selected)
-                if not selected_indices:
-                    continue
-
-            bar = tqdm_fn(total=len(selected_indices), desc=f"Extracting {b.name} epochs")
-            for n in selected_indices:
+            bar = tqdm_fn(total=len(jobs) * len(self.video_capture), desc=f"Extracting {b.name} epochs")
+            self._extract_jobs(jobs, bar)
+            bar.close()
+        
+        return True
+    
+    def _extract_jobs(self, jobs, bar=None):
+        if bar is None:
+            bar = _NullBar()
+        
+        stats = ExtractStats()
+        for n, cap in enumerate(self.video_capture):
+            try:
+                stats += self._sweep_video(n, cap, jobs, bar, index=self.video_index[n], meta=self.video_meta[n])
+            except Exception as e:
+                warnings.warn(f"Failed to extract epochs from video {n}: {e}")
+        self.stats += stats
+        return stats
+    
+    def _selected_indices(self, behav_idx, selections=None):
+        b = self.bcollector.behav_set[behav_idx]
+        if not b.time_ms:
+            return []
+        
+        if selections is None:
+            return list(range(len(b.time_ms)))
+        if behav_idx not in selections:
+            return []
+        
+        selected = selections[behav_idx]
+        # None -> select all epochs for this behavior
+        if selected is None:
+            return list(range(len(b.time_ms)))
+        return sorted(selected)
+    
+    def _make_job(self, path_dir, b, n):
+        if b.type == STATE:
+            start_ms = b.time_ms[n][0]
+            end_ms = b.time_ms[n][1]
+            # name_start ms_end ms (video_id), epochs within the same second must not share a file
+            prefix = os.path.join(path_dir, f"{b.name}_{start_ms}_{end_ms}")
+        elif b.type == EVENT:
+            start_ms = end_ms = b.time_ms[n]
+            prefix = os.path.join(path_dir, f"{b.name}_{start_ms}")
+        else:
+            raise ValueError(f"Unexpected type {b.type}")
+        return EpochJob(prefix=prefix, type=b.type, start_ms=start_ms, end_ms=end_ms)
+    
+    def _collect_jobs(self, path_dir, selections=None, behav_ids=None):
+        if behav_ids is None:
+            behav_ids = range(self.bcollector.num)
+        
+        jobs = []
+        for behav_idx in behav_ids:
+            b = self.bcollector.behav_set[behav_idx]
+            for n in self._selected_indices(behav_idx, selections):
                 try:
-                    if b.type == STATE:
-                        start_ms = b.time_ms[n][0]
-                        end_ms = b.time_ms[n][1]
-                        
-                        # name_start time_end time (video_id)
-                        prefix = os.path.join(path_dir, f"{b.name}_{start_ms//1000}_{end_ms//1000}")
-                        self.extract_single_epoch(prefix, start_ms, end_ms)
-                    elif b.type == EVENT:
-                        start_ms = b.time_ms[n]
-                        prefix = os.path.join(path_dir, f"{b.name}_{start_ms//1000}")
-                        self.extract_single_event(prefix, start_ms)
+                    jobs.append(self._make_job(path_dir, b, n))
                 except Exception as e:
                     warnings.warn(f"Failed to extract epoch {n} for behavior {b.name}: {e}")
-                bar.update()
-            bar.close()
+        return jobs
+    
+    @staticmethod
+    def _clip_window(start_ms, end_ms, duration_ms):
+        start_clip = max(0, start_ms - PADDING_MS)
+        end_clip = end_ms + PADDING_MS
+        if duration_ms is not None:
+            start_clip = max(0, min(start_clip, duration_ms))
+            end_clip = max(start_clip, min(end_clip, duration_ms))
+        return start_clip, end_clip
+    
+    def _extract_single_pass(self, path_dir, tqdm_fn, selections=None):
+        jobs = self._collect_jobs(path_dir, selections)
+        if not jobs:
+            return True
+        
+        bar = tqdm_fn(total=len(jobs) * len(self.video_capture), desc="Extracting epochs")
+        self._extract_jobs(jobs, bar)
+        bar.close()
+        
+        return True
+    
+    def _extract_parallel(self, path_dir, tqdm_fn, selections, num_workers):
+        jobs = self._collect_jobs(path_dir, selections)
+        if not jobs or not self.video_path:
+            return True
+        
+        # one camera per worker, cameras are split into time shards when workers are left over
+        num_shards = -(-num_workers // len(self.video_path))
+        tasks = [
+            (path, n, shard)
+            for n, path in enumerate(self.video_path)
+            for shard in _split_shards(jobs, num_shards)
+        ]
+        
+        total = len(jobs) * len(self.video_path)
+        bar = tqdm_fn(total=total, desc=f"Extracting epochs ({num_workers} workers)")
+        # spawned, not forked: the caller may be a GUI process with Qt and its threads running
+        context = multiprocessing.get_context("spawn")
+        with context.Manager() as manager, ProcessPoolExecutor(max_workers=num_workers, mp_context=context) as pool:
+            queue = manager.Queue()
+            futures = {pool.submit(_extract_shard, path, n, shard, queue): n for path, n, shard in tasks}
+            while any(not f.done() for f in futures) or not queue.empty():
+                try:
+                    bar.update(queue.get(timeout=POLL_INTERVAL))
+                except queue_mod.Empty:
+                    pass
+            
+            for f, n in futures.items():
+                if f.exception() is not None:
+                    warnings.warn(f"Failed to extract epochs from video {n}: {f.exception()}")
+                else:
+                    self.stats += f.result()
+        bar.close()
         
         return True
     
-    def _get_video_duration_ms(self, cap):
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
-        if fps <= 0:
-            return None
-        return (total_frames / fps) * 1000
-
-    def _draw_behavior_border(self, frame):
+    @staticmethod
+    def _merge_windows(windows):
+        # union of time-sorted (start_clip, end_clip, job) windows
+        blocks = []
+        for w in windows:
+            if blocks and w[0] <= blocks[-1][1]:
+                blocks[-1][1] = max(blocks[-1][1], w[1])
+                blocks[-1][2].append(w)
+            else:
+                blocks.append([w[0], w[1], [w]])
+        return blocks
+    
+    @classmethod
+    def _sweep_video(cls, n, cap, jobs, bar, index: VideoIndex = None, meta: VideoMeta = None):
+        """Decode the union of all padded windows once and fan each frame out to every clip/snapshot containing it."""
+        if not cap.isOpened():
+            raise ValueError("Video capture cannot be opened")
+        
+        if index is not None and index.num_frames > 0:
+            duration_ms = index.duration_ms
+        else:
+            index = None
+            duration_ms = meta.duration_ms if meta is not None and meta.duration_ms > 0 else None
+        windows = []
+        for job in jobs:
+            if job.type == STATE:
+                start_clip, end_clip = cls._clip_window(job.start_ms, job.end_ms, duration_ms)
+            else:
+                start_clip = end_clip = job.start_ms
+            windows.append((start_clip, end_clip, job))
+        windows.sort(key=lambda w: (w[0], w[1]))
+        
+        if meta is not None:
+            frame_size = meta.frame_size
+        else:
+            frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        stats = ExtractStats()
+        current_ms = None
+        frame_no = -1
+        frame = None
+        carry = False # the last grabbed frame was not yet looked at by the next block
+        for block_start, _, block in cls._merge_windows(windows):
+            if current_ms is None or block_start - current_ms > SEEK_GAP_MS:
+                if index is not None:
+                    index.seek(cap, index.frame_at(block_start))
+                    frame_no = -1 # resync against the index on the next grab
+                else:
+                    cap.set(cv2.CAP_PROP_POS_MSEC, block_start)
+                carry = False
+            
+            active = [] # (end_clip, job, writter)
+            pending = 0
+            while pending < len(block) or active:
+                if carry:
+                    carry = False
+                else:
+                    if not cap.grab():
+                        break
+                    frame = None
+                    stats.decoded_frames += 1
+                    if index is None:
+                        current_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+                    else:
+                        if frame_no < 0:
+                            frame_no = index.frame_at(cap.get(cv2.CAP_PROP_POS_MSEC) + PTS_TOLERANCE_MS)
+                        else:
+                            frame_no += 1
+                        current_ms = float(index.pts_ms[min(frame_no, index.num_frames - 1)])
+                
+                # close finished clips before opening new ones
+                for item in [a for a in active if current_ms > a[0]]:
+                    item[2].release()
+                    active.remove(item)
+                    bar.update()
+                
+                snapshots = []
+                while pending < len(block) and block[pending][0] <= current_ms:
+                    _, end_clip, job = block[pending]
+                    pending += 1
+                    if job.type == EVENT:
+                        snapshots.append(job)
+                        continue
+                    if current_ms > end_clip:
+                        bar.update()
+                        continue
+                    writter = cv2.VideoWriter(
+                        f"{job.prefix}({n}).avi",
+                        cv2.VideoWriter_fourcc(*'XVID'),
+                        FPS_WRITE,
+                        frame_size
+                    )
+                    active.append((end_clip, job, writter))
+                
+                if not active and not snapshots:
+                    continue
+                
+                if frame is None:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                
+                for job in snapshots:
+                    cv2.imwrite(f"{job.prefix}({n}).jpg", frame)
+                    stats.written_frames += 1
+                    bar.update()
+                
+                for _, job, writter in active:
+                    if job.start_ms <= current_ms <= job.end_ms:
+                        writter.write(cls._draw_behavior_border(frame.copy()))
+                    else:
+                        writter.write(frame)
+                    stats.written_frames += 1
+            else:
+                # the frame that ended this block may already lie in the next one
+                carry = True
+            
+            for _, _, writter in active:
+                writter.release()
+                bar.update()
+            
+            for _, _, job in block[pending:]:
+                warnings.warn(f"Failed to read frame at {job.prefix} ({n})")
+                stats.missed += 1
+                bar.update()
+        
+        return stats
+    
+    @staticmethod
+    def _draw_behavior_border(frame):
         h, w = frame.shape[:2]
         cv2.rectangle(frame, (0, 0), (w - 1, h - 1), (0, 0, 255), 2)
         return frame
 
     def extract_single_epoch(self, prefix_video, start_ms: int, end_ms: int):
-        padded_start = max(0, start_ms - PADDING_MS)
-        padded_end = end_ms + PADDING_MS
-
-        for n, cap in enumerate(self.video_capture):
-            if not cap.isOpened():
-                raise ValueError("Video capture cannot be opened")
-
-            duration_ms = self._get_video_duration_ms(cap)
-            start_clip = padded_start
-            end_clip = padded_end
-            if duration_ms is not None:
-                start_clip = max(0, min(start_clip, duration_ms))
-                end_clip = max(start_clip, min(end_clip, duration_ms))
-            
-            writter = cv2.VideoWriter(
-                f"{prefix_video}({n}).avi",
-                cv2.VideoWriter_fourcc(*'XVID'),
-                FPS_WRITE,
-                (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
-            )
-            
-            cap.set(cv2.CAP_PROP_POS_MSEC, start_clip)
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                current_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
-                if current_ms > end_clip:
-                    break
-                if start_ms <= current_ms <= end_ms:
-                    frame = self._draw_behavior_border(frame)
-                writter.write(frame)
-            writter.release()
+        job = EpochJob(prefix=prefix_video, type=STATE, start_ms=start_ms, end_ms=end_ms)
+        return self._extract_jobs([job])
 
     def extract_single_event(self, perfix_event, start_ms: int):
-        for n, cap in enumerate(self.video_capture):
-            if not cap.isOpened():
-                raise ValueError("Video capture cannot be opened")
-            
-            cap.set(cv2.CAP_PROP_POS_MSEC, start_ms)
-            ret, frame = cap.read()
-            if not ret:
-                raise ValueError(f"Failed to read frame at {perfix_event} ms")
-            
-            cv2.imwrite(f"{perfix_event}({n}).jpg", frame)
+        job = EpochJob(prefix=perfix_event, type=EVENT, start_ms=start_ms, end_ms=start_ms)
+        stats = self._extract_jobs([job])
+        if stats.missed:
+            raise ValueError(f"Failed to read frame at {perfix_event} ms")
+        return stats
@@ -0,0 +1,383 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from typing import List
+import numpy as np
+from .behav_container import EVENT, EVENT_SPAN_MS
+from .behav_events import BEHAVIORS_RESET
+from .behav_session import save_session, load_session, read_session_header
+from .video_cache import get_cache_dir
+
+
+JOURNAL_KIND = "journal"
+JOURNAL_SUFFIX = ".journal"
+SNAPSHOT_SUFFIX = ".bcs"
+LOCK_SUFFIX = ".lock"
+SYNC_EVERY = 64        # records between fsyncs while annotating quickly
+SYNC_INTERVAL = 1.0    # s, the tail of the journal is never older than this on disk
+COMPACT_EVERY = 20000  # records between compactions into the snapshot
+STALE_AFTER = 30       # s, a journal whose lock was not refreshed for this long belongs to a dead session
+
+OP_ADD_TIME = 1
+OP_ADD_TIMES = 2
+OP_DELETE_TIME = 3
+OP_ADD_BEHAV = 4
+OP_DELETE_BEHAV = 5
+OP_SET_VALUE = 6
+OP_VIDEO_PATH = 7
+OP_SET_TIMES = 8
+
+# op, behav_id, t0, t1, payload size | payload | crc32 of both
+_RECORD = struct.Struct("<Biqq I")
+_CRC = struct.Struct("<I")
+
+
+@dataclass
+class _Snapshot:
+    behav_set: List
+    video_path: List
+
+
+def _encode(op, behav_id=0, t0=0, t1=0, payload=b""):
+    record = _RECORD.pack(op, behav_id, t0, t1, len(payload)) + payload
+    return record + _CRC.pack(zlib.crc32(record))
+
+
+def read_records(file_name: str):
+    """Records of a journal segment, stops at the first torn or corrupted record."""
+    with open(file_name, "rb") as f:
+        data = memoryview(f.read())
+    pos = 0
+    while pos + _RECORD.size + _CRC.size <= len(data):
+        op, behav_id, t0, t1, size = _RECORD.unpack_from(data, pos)
+        end = pos + _RECORD.size + size
+        if end + _CRC.size > len(data):
+            break
+        if _CRC.unpack_from(data, end)[0] != zlib.crc32(data[pos:end]):
+            break
+        yield op, behav_id, t0, t1, bytes(data[pos + _RECORD.size:end])
+        pos = end + _CRC.size
+
+
+class BehavJournal:
+    """Append-only log of BehavCollector mutations for crash recovery.
+
+    Records are buffered and fsynced every SYNC_EVERY records or SYNC_INTERVAL seconds.
+    Every COMPACT_EVERY records the current state is written to a session snapshot in a
+    background thread and the journal segments it covers are deleted. Files of a session
+    `sid` in the journal directory: sid.bcs (snapshot), sid.<gen>.journal (segments
+    newer than the snapshot) and sid.lock (refreshed while the session is alive).
+    """
+
+    def __init__(self, bcollector, path_dir: str = None):
+        self.bcollector = bcollector
+        self.path_dir = path_dir if path_dir is not None else get_cache_dir(JOURNAL_KIND)
+        self.sid = f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}"
+        self.num_records = 0
+        self._gen = 0
+        self._since_compact = 0
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        self._compactor = None
+        self._file = open(self._segment_path(self.sid, self._gen), "ab")
+        self._touch()
+
+        self._stop = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_loop, daemon=True)
+        self._syncer.start()
+        bcollector.journal = self
+
+    def _path(self, sid, suffix):
+        return os.path.join(self.path_dir, sid + suffix)
+
+    def _segment_path(self, sid, gen):
+        return self._path(sid, f".{gen:06d}{JOURNAL_SUFFIX}")
+
+    def _segments(self, sid):
+        prefix = sid + "."
+        names = [f for f in os.listdir(self.path_dir) if f.startswith(prefix) and f.endswith(JOURNAL_SUFFIX)]
+        return sorted((int(f[len(prefix):-len(JOURNAL_SUFFIX)]), os.path.join(self.path_dir, f)) for f in names)
+
+    def _touch(self):
+        with open(self._path(self.sid, LOCK_SUFFIX), "a"):
+            pass
+        os.utime(self._path(self.sid, LOCK_SUFFIX))
+
+    # writing
+
+    def _append(self, record):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(record)
+            self.num_records += 1
+            self._unsynced += 1
+            if self._unsynced >= SYNC_EVERY:
+                self._sync_locked()
+        self._since_compact += 1
+        if self._since_compact >= COMPACT_EVERY:
+            self.compact()
+
+    def _sync_locked(self):
+        if self._file is not None and self._unsynced > 0:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def sync(self):
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_loop(self):
+        while not self._stop.wait(SYNC_INTERVAL):
+            try:
+                self.sync()
+                self._touch()
+            except OSError as e:
+                print(f"Failed to sync the annotation journal: {e}")
+
+    def add_time(self, behav_id, time_ms):
+        if isinstance(time_ms, (list, tuple)):
+            self._append(_encode(OP_ADD_TIME, behav_id, int(time_ms[0]), int(time_ms[1])))
+        else:
+            self._append(_encode(OP_ADD_TIME, behav_id, int(time_ms), int(time_ms)))
+
+    def add_times(self, behav_id, times):
+        arr = np.asarray(times, dtype="<i8")
+        self._append(_encode(OP_ADD_TIMES, behav_id, arr.ndim, 0, arr.tobytes()))
+
+    def set_times(self, behav_id, starts, ends):
+        # every epoch of a behavior replaced at once (bulk operations and their undo)
+        cols = np.stack([np.asarray(starts, dtype="<i8"), np.asarray(ends, dtype="<i8")])
+        self._append(_encode(OP_SET_TIMES, behav_id, len(starts), 0, cols.tobytes()))
+
+    def delete_time(self, time_ms):
+        self._append(_encode(OP_DELETE_TIME, 0, int(time_ms)))
+
+    def add_behav(self, name, note, type, color_code):
+        payload = json.dumps({"name": name, "note": note, "type": type, "color_code": color_code}).encode()
+        self._append(_encode(OP_ADD_BEHAV, payload=payload))
+
+    def delete_behav(self, behav_id):
+        self._append(_encode(OP_DELETE_BEHAV, behav_id))
+
+    def set_value(self, behav_id, key, value):
+        self._append(_encode(OP_SET_VALUE, behav_id, payload=json.dumps({key: value}).encode()))
+
+    def video_path(self, video_path):
+        self._append(_encode(OP_VIDEO_PATH, payload=json.dumps(video_path).encode()))
+
+    # compaction
+
+    def compact(self):
+        """Fold everything logged so far into the snapshot, written in a background thread.
+
+        Must be called from the thread mutating the collector, the state is copied right away.
+        """
+        if self._compactor is not None:
+            self._compactor.join() # snapshots are written in order
+        with self._lock:
+            if self._file is None:
+                return
+            self._sync_locked()
+            self._file.close()
+            self._gen += 1
+            self._file = open(self._segment_path(self.sid, self._gen), "ab")
+        self._since_compact = 0
+
+        snapshot = _Snapshot(
+            behav_set=[replace(b, time_ms=b.time_ms.copy() if b.time_ms is not None else None)
+                       for b in self.bcollector.behav_set],
+            video_path=list(self.bcollector.video_path)
+        )
+        self._compactor = threading.Thread(target=self._write_snapshot, args=(snapshot, self._gen), daemon=True)
+        self._compactor.start()
+
+    def _write_snapshot(self, snapshot, gen):
+        try:
+            save_session(snapshot, self._path(self.sid, SNAPSHOT_SUFFIX), extra={"journal_gen": gen})
+            for g, path in self._segments(self.sid):
+                if g < gen:
+                    os.remove(path)
+        except OSError as e:
+            print(f"Failed to compact the annotation journal: {e}")
+
+    def close(self, discard=False):
+        """Stop journaling, discard=True removes the files (e.g. after the annotations were saved)."""
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._lock:
+            if self._file is not None:
+                self._sync_locked()
+                self._file.close()
+                self._file = None
+        if self.bcollector.journal is self:
+            self.bcollector.journal = None
+        if discard:
+            self.remove(self.sid)
+
+    # recovery
+
+    def find_orphans(self):
+        """Session ids of journals left behind by sessions that did not close, oldest first."""
+        sids = set()
+        for f in os.listdir(self.path_dir):
+            if f.endswith(JOURNAL_SUFFIX) or f.endswith(SNAPSHOT_SUFFIX):
+                sids.add(f.split(".")[0])
+        sids.discard(self.sid)
+
+        orphans = []
+        for sid in sorted(sids):
+            lock = self._path(sid, LOCK_SUFFIX)
+            if not os.path.exists(lock) or time.time() - os.path.getmtime(lock) > STALE_AFTER:
+                orphans.append(sid)
+        return orphans
+
+    def has_data(self, sid):
+        return os.path.exists(self._path(sid, SNAPSHOT_SUFFIX)) or any(
+            os.path.getsize(path) > 0 for _, path in self._segments(sid))
+
+    def recover(self, sid):
+        """Rebuild the annotations of session sid into the (empty) collector, then remove its files."""
+        bcollector = self.bcollector
+        if bcollector.num != 0:
+            raise ValueError("Annotations can only be recovered before any behavior is defined")
+
+        bcollector.journal = None # replayed mutations are not logged again
+        try:
+            # views are told once, replayed batches change the epochs without notifying
+            with bcollector.notifier.batch():
+                gen = 0
+                snapshot = self._path(sid, SNAPSHOT_SUFFIX)
+                if os.path.exists(snapshot):
+                    header, _ = read_session_header(snapshot)
+                    gen = header.get("journal_gen", 0)
+                    bcollector.video_path, bcollector.behav_set = load_session(snapshot)
+                for g, path in self._segments(sid):
+                    if g >= gen:
+                        replay(bcollector, read_records(path))
+                bcollector.notifier.emit(BEHAVIORS_RESET)
+        finally:
+            bcollector.journal = self
+
+        # the recovered state now lives in this session
+        self.compact()
+        self._compactor.join()
+        self.remove(sid)
+        return bcollector
+
+    def remove(self, sid):
+        for suffix in (SNAPSHOT_SUFFIX, LOCK_SUFFIX):
+            if os.path.exists(self._path(sid, suffix)):
+                os.remove(self._path(sid, suffix))
+        for _, path in self._segments(sid):
+            os.remove(path)
+
+
+def _range_max(values, lo, hi):
+    """max(values[lo:hi]) for every pair with hi > lo, from a sparse table."""
+    table = [values]
+    while 2 ** len(table) <= len(values):
+        prev, half = table[-1], 2 ** (len(table) - 1)
+        table.append(np.maximum(prev[:-half], prev[half:]))
+    level = np.floor(np.log2(hi - lo)).astype(int)
+    res = np.empty(len(lo), dtype=values.dtype)
+    for j in np.unique(level):
+        sel = level == j
+        res[sel] = np.maximum(table[j][lo[sel]], table[j][hi[sel] - 2 ** j])
+    return res
+
+
+def _survivors(starts, ends, seqs, del_times, del_seqs):
+    # an epoch is removed by any later deletion time inside it
+    lo = np.searchsorted(del_times, starts, side="left")
+    hi = np.searchsorted(del_times, ends, side="right")
+    keep = np.ones(len(starts), dtype=bool)
+    hit = hi > lo
+    if hit.any():
+        keep[hit] = _range_max(del_seqs, lo[hit], hi[hit]) < seqs[hit]
+    return keep
+
+
+def _apply_batch(bcollector, adds, deletes):
+    # deletions only affect epochs added before them, so a batch of additions and
+    # deletions resolves with sorted searches instead of one index update per record
+    if deletes:
+        del_times, del_seqs = np.array(deletes, dtype=np.int64).T
+        order = np.argsort(del_times, kind="stable")
+        del_times, del_seqs = del_times[order], del_seqs[order]
+
+    for behav_id, b in enumerate(bcollector.behav_set):
+        span = EVENT_SPAN_MS if b.type == EVENT else 0
+        if deletes and b.time_ms is not None and len(b.time_ms) > 0:
+            old = b.time_ms
+            keep = _survivors(old.starts, old.ends + span, np.full(len(old), -1), del_times, del_seqs)
+            old.remove_positions(np.flatnonzero(~keep))
+
+        new = adds.get(behav_id)
+        if not new:
+            continue
+        starts = np.concatenate([a[0] for a in new])
+        ends = np.concatenate([a[1] for a in new])
+        seqs = np.concatenate([a[2] for a in new])
+        order = np.argsort(seqs, kind="stable") # equal starts keep their logging order
+        starts, ends, seqs = starts[order], ends[order], seqs[order]
+        if deletes:
+            keep = _survivors(starts, ends + span, seqs, del_times, del_seqs)
+            starts, ends = starts[keep], ends[keep]
+        b.extend(starts if b.type == EVENT else np.stack([starts, ends], axis=1))
+
+
+def replay(bcollector, records):
+    """Apply journal records to bcollector, epoch additions and deletions are applied in bulk."""
+    adds = defaultdict(list) # behav_id -> [(starts, ends, seqs)]
+    singles = defaultdict(list) # behav_id -> [(t0, t1, seq)]
+    deletes = [] # (time_ms, seq)
+
+    def flush():
+        for behav_id, items in singles.items():
+            t0, t1, seq = np.array(items, dtype=np.int64).T
+            adds[behav_id].append((t0, t1, seq))
+        singles.clear()
+        if adds or deletes:
+            _apply_batch(bcollector, adds, deletes)
+        adds.clear()
+        deletes.clear()
+
+    for seq, (op, behav_id, t0, t1, payload) in enumerate(records):
+        if op == OP_ADD_TIME:
+            if behav_id < bcollector.num:
+                singles[behav_id].append((t0, t1, seq))
+        elif op == OP_ADD_TIMES:
+            if behav_id < bcollector.num:
+                arr = np.frombuffer(payload, dtype="<i8")
+                arr = arr.reshape(-1, 2) if t0 == 2 else np.stack([arr, arr], axis=1)
+                starts, ends = arr.min(axis=1), arr.max(axis=1)
+                adds[behav_id].append((starts, ends, np.full(len(arr), seq)))
+        elif op == OP_DELETE_TIME:
+            deletes.append((t0, seq))
+        else:
+            # behaviors added, removed or changed, pending epochs are applied first
+            flush()
+            if op == OP_ADD_BEHAV:
+                bcollector.add_behav(**json.loads(payload))
+            elif op == OP_DELETE_BEHAV:
+                bcollector.delete_behav(behav_id)
+            elif op == OP_SET_VALUE:
+                for key, value in json.loads(payload).items():
+                    bcollector.set_value(behav_id, key, value)
+            elif op == OP_VIDEO_PATH:
+                bcollector.update_video_path(json.loads(payload))
+            elif op == OP_SET_TIMES:
+                if behav_id < bcollector.num:
+                    cols = np.frombuffer(payload, dtype="<i8").reshape(2, t0)
+                    bcollector.behav_set[behav_id].set_epochs(cols[0], cols[1])
+            else:
+                raise ValueError(f"Unknown journal record {op}")
+    flush()
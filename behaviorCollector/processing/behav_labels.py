@@ -0,0 +1,139 @@
+import json
+import os
+import numpy as np
+from .behav_container import BehavInfo, EVENT
+from .video_index import VideoIndex
+from .video_meta import probe_video
+
+
+LABELS_SUFFIX = ".labels.npz"
+
+
+def frame_times(video_path: str):
+    """Presentation time in ms of every frame, from the cached frame index or else the nominal fps."""
+    index = VideoIndex.load(video_path)
+    if index is not None and index.num_frames > 0:
+        return np.asarray(index.pts_ms, dtype=np.float64)
+    meta = probe_video(video_path)
+    if meta.fps <= 0 or meta.frame_count <= 0:
+        raise ValueError(f"Cannot read the frame rate of {video_path}")
+    return np.arange(meta.frame_count) * (1e3 / meta.fps)
+
+
+def rasterize(behav_set, pts_ms):
+    """Boolean (n_frames, n_behaviors) matrix of the frames each behavior is shown on.
+
+    A State [start, end] labels every frame displayed between start and end, an Event
+    labels the frame displayed at its time. Epochs outside the video are dropped.
+    """
+    pts_ms = np.asarray(pts_ms, dtype=np.float64)
+    num_frames, num_behav = len(pts_ms), len(behav_set)
+    frame_ms = float(pts_ms[-1] - pts_ms[0]) / (num_frames - 1) if num_frames > 1 else 1.
+    last_ms = pts_ms[-1] + frame_ms if num_frames > 0 else 0.
+
+    cols = ([], [], [])
+    for k, b in enumerate(behav_set):
+        if b.time_ms is None or len(b.time_ms) == 0:
+            continue
+        starts, ends = b.time_ms.starts, b.time_ms.ends
+        keep = (starts < last_ms) & (ends >= pts_ms[0]) if num_frames > 0 else np.zeros(len(starts), dtype=bool)
+        cols[0].append(np.full(int(keep.sum()), k, dtype=np.int64))
+        cols[1].append(starts[keep])
+        cols[2].append(ends[keep])
+    if not cols[0] or num_frames == 0:
+        return np.zeros((num_frames, num_behav), dtype=bool)
+    behav, starts, ends = [np.concatenate(c) for c in cols]
+
+    # frame displayed at t = last frame with pts <= t
+    f0 = np.maximum(np.searchsorted(pts_ms, starts, side="right") - 1, 0)
+    f1 = np.searchsorted(pts_ms, ends, side="right") - 1
+    size = (num_frames + 1) * num_behav
+    # +1 at the first frame of an epoch and -1 after its last, the running sum is the label
+    diff = np.bincount(f0 * num_behav + behav, minlength=size)
+    diff -= np.bincount((f1 + 1) * num_behav + behav, minlength=size)
+    return np.cumsum(diff.reshape(num_frames + 1, num_behav)[:-1], axis=0) > 0
+
+
+def decode_labels(labels, pts_ms, types):
+    """Epochs of every label column, ints for Events and [start, end] pairs for States.
+
+    A run of labeled frames becomes one State from the time of its first frame to the
+    time of its last frame; every labeled frame of an Event column is one mark.
+    """
+    labels = np.asarray(labels, dtype=bool)
+    num_frames, num_behav = labels.shape
+    times = np.ceil(np.asarray(pts_ms, dtype=np.float64)).astype(np.int64) # as VideoIndex.time_of
+
+    padded = np.zeros((num_behav, num_frames + 2), dtype=np.int8)
+    padded[:, 1:-1] = labels.T
+    edges = np.diff(padded, axis=1)
+    behav_on, frame_on = np.nonzero(edges == 1) # grouped by behavior, frames in order
+    behav_off, frame_off = np.nonzero(edges == -1)
+    bounds = np.searchsorted(behav_on, np.arange(num_behav + 1))
+
+    epochs = []
+    for k, tp in enumerate(types):
+        on = frame_on[bounds[k]:bounds[k + 1]]
+        off = frame_off[bounds[k]:bounds[k + 1]] - 1
+        if tp == EVENT:
+            epochs.append(times[np.flatnonzero(labels[:, k])])
+        else:
+            epochs.append(np.stack([times[on], times[off]], axis=1))
+    return epochs
+
+
+def save_labels(file_name: str, labels, pts_ms, behav_set, video_path: str = None):
+    """Bit-packed label matrix (8 behaviors per byte) with its frame times and behavior header."""
+    header = {
+        "video_path": video_path,
+        "num_behaviors": len(behav_set),
+        "behaviors": [
+            {"name": b.name, "id": b.id, "note": b.note, "type": b.type, "color_code": b.color_code}
+            for b in behav_set
+        ]
+    }
+    tmp_name = file_name + ".tmp"
+    with open(tmp_name, "wb") as f:
+        np.savez(f, labels=np.packbits(labels, axis=1), pts_ms=np.asarray(pts_ms, dtype=np.float64),
+                 header=np.array(json.dumps(header)))
+    os.replace(tmp_name, file_name)
+    return True
+
+
+def load_labels(file_name: str):
+    """(header, boolean label matrix, frame times in ms) of a file written by save_labels."""
+    with np.load(file_name) as data:
+        header = json.loads(str(data["header"]))
+        labels = np.unpackbits(data["labels"], axis=1, count=header["num_behaviors"]).astype(bool)
+        pts_ms = data["pts_ms"]
+    return header, labels, pts_ms
+
+
+def export_labels(bcollector, path_dir: str):
+    """Write one label file per video of bcollector to path_dir, returns the written paths."""
+    if not bcollector.video_path:
+        raise ValueError("There is no video to export frame labels for")
+    written = []
+    for video_path in bcollector.video_path:
+        if not video_path:
+            continue
+        pts_ms = frame_times(video_path)
+        labels = rasterize(bcollector.behav_set, pts_ms)
+        name = os.path.splitext(os.path.basename(video_path))[0]
+        file_name = os.path.join(path_dir, name + LABELS_SUFFIX)
+        save_labels(file_name, labels, pts_ms, bcollector.behav_set, video_path=video_path)
+        written.append(file_name)
+    return written
+
+
+def import_labels(file_name: str):
+    """Behaviors decoded from a label file, as a behav_set."""
+    header, labels, pts_ms = load_labels(file_name)
+    entries = header["behaviors"]
+    epochs = decode_labels(labels, pts_ms, [e["type"] for e in entries])
+    video_path = [header["video_path"]] if header.get("video_path") else None
+    return [
+        BehavInfo(name=e["name"], id=e["id"], note=e.get("note", ""), type=e["type"],
+                  color_code=e["color_code"], video_path=video_path, time_ms=times)
+        for e, times in zip(entries, epochs)
+    ]
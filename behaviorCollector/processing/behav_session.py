@@ -0,0 +1,139 @@
+import json
+import os
+import struct
+import zlib
+import numpy as np
+from .behav_container import BehavInfo, EVENT
+from .epoch_index import EpochIndex
+
+
+SESSION_SUFFIX = ".bcs"
+SESSION_MAGIC = b"BEHAVSES"
+SESSION_VERSION = 1
+ZLIB_LEVEL = 1 # columns are delta encoded and byte shuffled, higher levels barely shrink them further
+_HEADER_LEN = struct.Struct("<I")
+
+
+def is_session_file(path: str):
+    return path.endswith(SESSION_SUFFIX)
+
+
+def encode_columns(starts, ends):
+    """zlib blob of the start deltas and epoch lengths, stored as byte planes."""
+    n = len(starts)
+    cols = np.empty((2, n), dtype="<i8")
+    cols[0] = np.diff(starts, prepend=0)
+    cols[1] = np.subtract(ends, starts)
+    planes = cols.view(np.uint8).reshape(2, n, 8).transpose(0, 2, 1)
+    return zlib.compress(planes.tobytes(), ZLIB_LEVEL)
+
+
+def decode_columns(blob, n: int):
+    planes = np.frombuffer(zlib.decompress(blob), dtype=np.uint8).reshape(2, 8, n)
+    cols = np.ascontiguousarray(planes.transpose(0, 2, 1)).view("<i8").reshape(2, n)
+    starts = np.cumsum(cols[0])
+    return starts, starts + cols[1]
+
+
+class _SessionColumns:
+    # reads the epochs of one behavior from the session file on first use
+    def __init__(self, file_name, offset, nbytes, num):
+        self.file_name = file_name
+        self.offset = offset
+        self.nbytes = nbytes
+        self.num = num
+
+    def read_raw(self):
+        with open(self.file_name, "rb") as f:
+            f.seek(self.offset)
+            blob = f.read(self.nbytes)
+        if len(blob) != self.nbytes:
+            raise ValueError(f"Session file {self.file_name} is truncated")
+        return blob
+
+    def __call__(self):
+        return decode_columns(self.read_raw(), self.num)
+
+
+def save_session(bcollector, file_name: str, extra: dict = None):
+    """Write header, behaviors and compressed epoch columns of bcollector to a single file.
+
+    bcollector only needs `behav_set` and `video_path`, extra entries are stored in the header.
+    """
+    entries, blobs, lazy, offset = [], [], [], 0
+    for b in bcollector.behav_set:
+        source = b.time_ms.source if b.time_ms is not None else None
+        if isinstance(source, _SessionColumns):
+            # never touched since loading, copied over without decoding
+            blob = source.read_raw()
+            lazy.append((source, offset))
+        elif b.time_ms is not None:
+            blob = encode_columns(b.time_ms.starts, b.time_ms.ends)
+        else:
+            blob = encode_columns(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+        entries.append({
+            "name": b.name,
+            "id": b.id,
+            "note": b.note,
+            "type": b.type,
+            "color_code": b.color_code,
+            "num": b.num,
+            "offset": offset,
+            "nbytes": len(blob)
+        })
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = {
+        "version": SESSION_VERSION,
+        "video_path": bcollector.video_path,
+        "behaviors": entries
+    }
+    header = json.dumps({**(extra or {}), **header}).encode()
+
+    tmp_name = file_name + ".tmp"
+    with open(tmp_name, "wb") as f:
+        f.write(SESSION_MAGIC)
+        f.write(_HEADER_LEN.pack(len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_name, file_name)
+
+    # the file may have replaced the one the lazy behaviors point to
+    data_start = len(SESSION_MAGIC) + _HEADER_LEN.size + len(header)
+    for source, offset in lazy:
+        source.file_name = file_name
+        source.offset = data_start + offset
+    return True
+
+
+def read_session_header(file_name: str):
+    """Header dict of a session file and the file offset of its first column blob."""
+    with open(file_name, "rb") as f:
+        if f.read(len(SESSION_MAGIC)) != SESSION_MAGIC:
+            raise ValueError(f"{file_name} is not a behavior session file")
+        (size,) = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+        header = json.loads(f.read(size).decode())
+    if header.get("version", 0) > SESSION_VERSION:
+        raise ValueError(f"Session file version {header['version']} is not supported")
+    return header, len(SESSION_MAGIC) + _HEADER_LEN.size + size
+
+
+def load_session(file_name: str):
+    """Video paths and behaviors of a session file, epochs are only read when a behavior is used."""
+    header, data_start = read_session_header(file_name)
+    behav_set = []
+    for entry in header["behaviors"]:
+        columns = _SessionColumns(file_name, data_start + entry["offset"], entry["nbytes"], entry["num"])
+        behav_set.append(BehavInfo(
+            name=entry["name"],
+            id=entry["id"],
+            note=entry.get("note", ""),
+            type=entry["type"],
+            color_code=entry["color_code"],
+            video_path=header["video_path"],
+            time_ms=EpochIndex.lazy(columns, entry["num"], point=entry["type"] == EVENT)
+        ))
+    return header["video_path"], behav_set
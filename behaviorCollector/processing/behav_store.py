@@ -0,0 +1,254 @@
+import os
+import sqlite3
+import time
+import warnings
+from urllib.parse import quote
+from .behav_container import BehavInfo, EVENT, load_behav_set
+
+
+STORE_SUFFIX = ".sqlite"
+IMPORT_BATCH = 50 # sessions per transaction when importing JSON directories
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    cohort TEXT,
+    source TEXT,
+    saved_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_cohort ON sessions(cohort);
+
+CREATE TABLE IF NOT EXISTS videos (
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    path TEXT,
+    PRIMARY KEY (session_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS behaviors (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    behav_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    color_code TEXT,
+    note TEXT,
+    UNIQUE (session_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_behaviors_name ON behaviors(name);
+
+CREATE TABLE IF NOT EXISTS epochs (
+    behavior_id INTEGER NOT NULL REFERENCES behaviors(id) ON DELETE CASCADE,
+    start_ms INTEGER NOT NULL,
+    end_ms INTEGER NOT NULL,
+    duration_ms INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_epochs_start ON epochs(behavior_id, start_ms);
+CREATE INDEX IF NOT EXISTS idx_epochs_duration ON epochs(behavior_id, duration_ms);
+"""
+
+
+def is_store_file(path: str):
+    return path.endswith(STORE_SUFFIX)
+
+
+def session_names(locations):
+    """Session names of locations (paths without extension), unique per location.
+
+    A session is named after the base name of its location; base names shared by different
+    locations get the path below their common parent instead, e.g. cohortA/m1 and cohortB/m1.
+    """
+    locations = [os.path.abspath(p) for p in locations]
+    shared = {}
+    for location in dict.fromkeys(locations):
+        shared.setdefault(os.path.basename(location), []).append(location)
+    names = []
+    for location in locations:
+        group = shared[os.path.basename(location)]
+        if len(group) == 1:
+            names.append(os.path.basename(location))
+        else:
+            root = os.path.commonpath([os.path.dirname(p) for p in group])
+            names.append(os.path.relpath(location, root).replace(os.sep, "/"))
+    return names
+
+
+class BehavStore:
+    """Annotations of many sessions in one SQLite file, indexed for cross-session queries.
+
+    Opened with read_only=True, the store must exist and is never written to.
+    """
+
+    def __init__(self, file_name: str, read_only: bool = False):
+        self.file_name = file_name
+        if read_only:
+            if not os.path.exists(file_name):
+                raise FileNotFoundError(f"Store {file_name} does not exist")
+            self.conn = sqlite3.connect(f"file:{quote(os.path.abspath(file_name))}?mode=ro", uri=True)
+            return
+        self.conn = sqlite3.connect(file_name)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def sessions(self):
+        return [row[0] for row in self.conn.execute("SELECT name FROM sessions ORDER BY name")]
+
+    def _insert_session(self, session, behav_set, video_path, cohort=None, source=None):
+        # runs inside the caller's transaction, a saved session replaces the previous one
+        self.conn.execute("DELETE FROM sessions WHERE name = ?", (session,))
+        sid = self.conn.execute(
+            "INSERT INTO sessions (name, cohort, source, saved_at) VALUES (?, ?, ?, ?)",
+            (session, cohort, source, time.time())
+        ).lastrowid
+        self.conn.executemany(
+            "INSERT INTO videos (session_id, position, path) VALUES (?, ?, ?)",
+            [(sid, n, path) for n, path in enumerate(video_path or [])]
+        )
+        for b in behav_set:
+            bid = self.conn.execute(
+                "INSERT INTO behaviors (session_id, behav_id, name, type, color_code, note) VALUES (?, ?, ?, ?, ?, ?)",
+                (sid, b.id, b.name, b.type, b.color_code, b.note)
+            ).lastrowid
+            if b.time_ms is None or len(b.time_ms) == 0:
+                continue
+            starts, ends = b.time_ms.starts, b.time_ms.ends
+            self.conn.executemany(
+                "INSERT INTO epochs (behavior_id, start_ms, end_ms, duration_ms) VALUES (?, ?, ?, ?)",
+                zip([bid] * len(starts), starts.tolist(), ends.tolist(), (ends - starts).tolist())
+            )
+        return sid
+
+    def save(self, bcollector, session: str, cohort: str = None):
+        with self.conn:
+            self._insert_session(session, bcollector.behav_set, bcollector.video_path, cohort=cohort)
+        return True
+
+    def load(self, session: str):
+        """Video paths and behaviors of a saved session."""
+        row = self.conn.execute("SELECT id FROM sessions WHERE name = ?", (session,)).fetchone()
+        if row is None:
+            raise ValueError(f"Session {session} is not in {self.file_name}")
+        sid = row[0]
+
+        video_path = [path for (path,) in self.conn.execute(
+            "SELECT path FROM videos WHERE session_id = ? ORDER BY position", (sid,))]
+        behav_set = []
+        for bid, behav_id, name, tp, color_code, note in self.conn.execute(
+                "SELECT id, behav_id, name, type, color_code, note FROM behaviors WHERE session_id = ? ORDER BY behav_id",
+                (sid,)).fetchall():
+            rows = self.conn.execute(
+                "SELECT start_ms, end_ms FROM epochs WHERE behavior_id = ? ORDER BY start_ms", (bid,)).fetchall()
+            b = BehavInfo(name=name, id=behav_id, note=note, type=tp, color_code=color_code, video_path=video_path)
+            b.extend([start for start, _ in rows] if tp == EVENT else rows)
+            behav_set.append(b)
+        return video_path, behav_set
+
+    def import_dirs(self, path_dirs, cohort: str = None, batch_size: int = IMPORT_BATCH, tqdm_fn=None):
+        """Bulk-load behavior directories written by BehavCollector.save, one session per directory.
+
+        Sessions are named after their directory (see session_names), `batch_size` sessions are
+        committed per transaction. Returns the number of imported sessions.
+        """
+        path_dirs = list(dict.fromkeys(os.path.abspath(p) for p in path_dirs))
+        names = dict(zip(path_dirs, session_names(path_dirs)))
+        bar = tqdm_fn(total=len(path_dirs), desc="Importing sessions") if tqdm_fn is not None else None
+        num = 0
+        for i0 in range(0, len(path_dirs), batch_size):
+            with self.conn:
+                for path_dir in path_dirs[i0:i0 + batch_size]:
+                    try:
+                        behav_set = load_behav_set(path_dir)
+                    except (OSError, ValueError, KeyError) as e:
+                        warnings.warn(f"Failed to import {path_dir}: {e}")
+                        continue
+                    if not behav_set:
+                        continue
+                    session = names[path_dir]
+                    row = self.conn.execute("SELECT source FROM sessions WHERE name = ?", (session,)).fetchone()
+                    if row is not None and row[0] not in (None, path_dir):
+                        warnings.warn(f"Session {session} imported from {row[0]} is replaced by {path_dir}")
+                    self._insert_session(session, behav_set, behav_set[0].video_path,
+                                         cohort=cohort, source=path_dir)
+                    num += 1
+                    if bar is not None:
+                        bar.update()
+        if bar is not None:
+            bar.close()
+        return num
+
+    def find_epochs(self, behavior: str = None, cohort: str = None, sessions=None,
+                    min_duration_ms: int = None, max_duration_ms: int = None,
+                    start_ms: int = None, end_ms: int = None):
+        """(session, behavior, start_ms, end_ms) of the epochs matching every given filter.
+
+        start_ms / end_ms select epochs overlapping [start_ms, end_ms].
+        """
+        where, args = [], []
+        if behavior is not None:
+            where.append("b.name = ?")
+            args.append(behavior)
+        if cohort is not None:
+            where.append("s.cohort = ?")
+            args.append(cohort)
+        if sessions is not None:
+            sessions = list(sessions)
+            where.append(f"s.name IN ({', '.join('?' * len(sessions))})")
+            args.extend(sessions)
+        if min_duration_ms is not None:
+            where.append("e.duration_ms >= ?")
+            args.append(min_duration_ms)
+        if max_duration_ms is not None:
+            where.append("e.duration_ms <= ?")
+            args.append(max_duration_ms)
+        if end_ms is not None:
+            where.append("e.start_ms <= ?")
+            args.append(end_ms)
+        if start_ms is not None:
+            where.append("e.end_ms >= ?")
+            args.append(start_ms)
+
+        query = (
+            "SELECT s.name, b.name, e.start_ms, e.end_ms FROM epochs e "
+            "JOIN behaviors b ON b.id = e.behavior_id "
+            "JOIN sessions s ON s.id = b.session_id"
+        )
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY s.name, b.name, e.start_ms"
+        return self.conn.execute(query, args).fetchall()
+
+    def summarize(self, behavior: str = None, cohort: str = None, min_duration_ms: int = None):
+        """(session, behavior, count, total duration in ms) per session and behavior."""
+        where, args = [], []
+        if behavior is not None:
+            where.append("b.name = ?")
+            args.append(behavior)
+        if cohort is not None:
+            where.append("s.cohort = ?")
+            args.append(cohort)
+        if min_duration_ms is not None:
+            where.append("e.duration_ms >= ?")
+            args.append(min_duration_ms)
+
+        query = (
+            "SELECT s.name, b.name, COUNT(*), SUM(e.duration_ms) FROM epochs e "
+            "JOIN behaviors b ON b.id = e.behavior_id "
+            "JOIN sessions s ON s.id = b.session_id"
+        )
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " GROUP BY s.name, b.name ORDER BY s.name, b.name"
+        return self.conn.execute(query, args).fetchall()
@@ -0,0 +1,277 @@
+import numpy as np
+
+
+MIN_CAPACITY = 16
+TREE_FANOUT = 64 # ends per block of the max tree
+SCAN_LIMIT = 4 * TREE_FANOUT # candidates scanned directly instead of descending the tree
+
+
+def _block_max(values, first):
+    # maxima of the blocks of TREE_FANOUT values, from block `first` on
+    tail = values[first * TREE_FANOUT:]
+    pad = -len(tail) % TREE_FANOUT
+    if pad:
+        tail = np.concatenate([tail, np.full(pad, np.iinfo(np.int64).min)])
+    return tail.reshape(-1, TREE_FANOUT).max(axis=1)
+
+
+class EpochIndex:
+    """Epochs kept sorted by start time in two int64 columns with amortized growth.
+
+    Lookups bisect the start column. The epochs containing t all start within
+    [t - max_len, t], which a stabbing query scans when that window is short; otherwise
+    (a few long epochs among many short ones) a tree of block maxima over the end column
+    finds them in O(log n) levels. Point epochs (Events) are stored with end == start and
+    read back as ints, interval epochs (States) as [start, end] lists, like the former
+    list of times.
+    `starts` and `ends` are read-only views of the columns (no copy).
+    A lazy index only knows its length until the columns are first used.
+    """
+
+    def __init__(self, point: bool = False, capacity: int = MIN_CAPACITY):
+        self.point = point
+        self._starts = np.empty(max(capacity, MIN_CAPACITY), dtype=np.int64)
+        self._ends = np.empty_like(self._starts)
+        self._size = 0
+        self._max_len = 0 # longest epoch, None after the longest was removed until asked again
+        self._levels = [] # block maxima of the ends, each level over blocks of the one below
+        self._stale = 0 # first position changed since the tree was built, None when up to date
+        self._loader = None
+
+    @classmethod
+    def from_times(cls, times, point: bool = False):
+        index = cls(point=point, capacity=len(times))
+        index.extend(times)
+        return index
+
+    @classmethod
+    def from_columns(cls, starts, ends, point: bool = False):
+        index = cls(point=point, capacity=len(starts))
+        if len(starts) > 0:
+            index.extend(np.asarray(starts) if point else np.stack([starts, ends], axis=1))
+        return index
+
+    @classmethod
+    def lazy(cls, loader, size: int, point: bool = False):
+        """Index of `size` epochs whose columns are read by loader() -> (starts, ends) on first use."""
+        index = cls(point=point)
+        index._size = size
+        index._loader = loader
+        return index
+
+    @property
+    def source(self):
+        # loader of a lazy index that was not used yet, None once the columns are in memory
+        return self._loader
+
+    def _ensure(self):
+        if self._loader is None:
+            return
+        loader, self._loader = self._loader, None
+        starts, ends = loader()
+        self._starts = np.array(starts, dtype=np.int64)
+        self._ends = np.array(ends, dtype=np.int64)
+        self._size = len(self._starts)
+        self._max_len = None
+        self._stale = 0
+
+    @property
+    def starts(self):
+        self._ensure()
+        return self._view(self._starts)
+
+    @property
+    def ends(self):
+        self._ensure()
+        return self._view(self._ends)
+
+    def _view(self, column):
+        view = column[:self._size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def nbytes(self):
+        self._ensure()
+        return self._starts.nbytes + self._ends.nbytes
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        # converted in bulk, much cheaper than boxing element by element
+        if self.point:
+            return iter(self.starts.tolist())
+        return iter(np.stack([self.starts, self.ends], axis=1).tolist())
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return [self[k] for k in range(*n.indices(self._size))]
+        self._ensure()
+        if n < 0:
+            n += self._size
+        if not 0 <= n < self._size:
+            raise IndexError("epoch index out of range")
+        if self.point:
+            return int(self._starts[n])
+        return [int(self._starts[n]), int(self._ends[n])]
+
+    def __eq__(self, other):
+        if not isinstance(other, EpochIndex):
+            return list(self) == list(other)
+        return (self.point == other.point and len(self) == len(other)
+                and np.array_equal(self.starts, other.starts) and np.array_equal(self.ends, other.ends))
+
+    def __repr__(self):
+        return f"EpochIndex({list(self)})"
+
+    def tolist(self):
+        return list(self)
+
+    def copy(self):
+        index = EpochIndex(point=self.point, capacity=self._size)
+        index.extend(np.stack([self.starts, self.ends], axis=1) if not self.point else self.starts)
+        return index
+
+    def _reserve(self, size):
+        if size <= len(self._starts):
+            return
+        capacity = max(size, 2 * len(self._starts))
+        for name in ("_starts", "_ends"):
+            column = np.empty(capacity, dtype=np.int64)
+            column[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, column)
+
+    def _as_columns(self, times):
+        arr = np.asarray(times, dtype=np.int64)
+        if self.point:
+            if arr.ndim != 1:
+                raise ValueError(f"Point epochs must be a list of times, got shape {arr.shape}")
+            return arr, arr
+        if arr.ndim != 2 or arr.shape[1] != 2:
+            raise ValueError(f"Epochs must be [start, end] pairs, got shape {arr.shape}")
+        return arr.min(axis=1), arr.max(axis=1)
+
+    def append(self, time_ms):
+        """Insert an epoch (int or [start, end]) at its sorted position, returns its position."""
+        if isinstance(time_ms, (list, tuple, np.ndarray)):
+            start, end = int(time_ms[0]), int(time_ms[1])
+        else:
+            start = end = int(time_ms)
+        if end < start:
+            start, end = end, start
+
+        self._ensure()
+        n = int(np.searchsorted(self.starts, start, side="right"))
+        self._reserve(self._size + 1)
+        size = self._size
+        self._starts[n + 1:size + 1] = self._starts[n:size]
+        self._ends[n + 1:size + 1] = self._ends[n:size]
+        self._starts[n] = start
+        self._ends[n] = end
+        self._size += 1
+        self._changed(n, end - start)
+        return n
+
+    def extend(self, times):
+        """Insert many epochs at once (ints, [start, end] pairs or an (n, 2) array)."""
+        if len(times) == 0:
+            return
+        self._ensure()
+        starts, ends = self._as_columns(times)
+        merged_starts = np.concatenate([self.starts, starts])
+        merged_ends = np.concatenate([self.ends, ends])
+        order = np.argsort(merged_starts, kind="stable") # existing epochs stay ahead of equal new ones
+
+        size = len(merged_starts)
+        self._reserve(size)
+        self._starts[:size] = merged_starts[order]
+        self._ends[:size] = merged_ends[order]
+        self._size = size
+        self._changed(0, int((ends - starts).max()))
+
+    def pop(self, n: int):
+        self._ensure()
+        item = self[n]
+        if n < 0:
+            n += self._size
+        self._removed(self._ends[n] - self._starts[n])
+        size = self._size
+        self._starts[n:size - 1] = self._starts[n + 1:size]
+        self._ends[n:size - 1] = self._ends[n + 1:size]
+        self._size -= 1
+        self._changed(n)
+        return item
+
+    def remove_positions(self, positions):
+        if len(positions) == 0:
+            return
+        self._ensure()
+        keep = np.ones(self._size, dtype=bool)
+        keep[list(positions)] = False
+        self._removed((self.ends[~keep] - self.starts[~keep]).max())
+        size = int(keep.sum())
+        self._starts[:size] = self.starts[keep]
+        self._ends[:size] = self.ends[keep]
+        self._size = size
+        self._changed(int(min(positions)))
+
+    @property
+    def max_len(self):
+        if self._max_len is None:
+            self._ensure()
+            self._max_len = int((self.ends - self.starts).max()) if self._size > 0 else 0
+        return self._max_len
+
+    def _changed(self, n, length=0):
+        self._stale = n if self._stale is None else min(self._stale, n)
+        if self._max_len is not None:
+            self._max_len = max(self._max_len, int(length))
+
+    def _removed(self, length):
+        if self._max_len is not None and length >= self._max_len:
+            self._max_len = None
+
+    def _tree(self):
+        # levels of block maxima above the end column, rebuilt from the first stale block on
+        if self._stale is not None:
+            values, first, levels = self.ends, self._stale // TREE_FANOUT, []
+            while len(values) > TREE_FANOUT:
+                old = self._levels[len(levels)] if len(levels) < len(self._levels) else values[:0]
+                keep = min(first, len(old))
+                values = np.concatenate([old[:keep], _block_max(values, keep)])
+                levels.append(values)
+                first //= TREE_FANOUT
+            self._levels, self._stale = levels, None
+        return self._levels
+
+    def _ending_after(self, time_ms, n):
+        # positions before n of the epochs ending at or after time_ms, descending the tree
+        # from the top level through the blocks holding such an epoch
+        layers = [self.ends] + self._tree()
+        nodes = np.arange(len(layers[-1]))
+        for k in range(len(layers) - 1, -1, -1):
+            nodes = nodes[(nodes * TREE_FANOUT ** k < n) & (layers[k][nodes] >= time_ms)]
+            if k == 0:
+                break
+            nodes = (nodes[:, None] * TREE_FANOUT + np.arange(TREE_FANOUT)).ravel()
+            nodes = nodes[nodes < len(layers[k - 1])]
+        return nodes
+
+    def overlapping(self, start_ms, end_ms):
+        """Positions of the epochs overlapping [start_ms, end_ms], in start order."""
+        self._ensure()
+        starts = self.starts
+        n1 = int(np.searchsorted(starts, end_ms, side="right"))
+        m = min(int(np.searchsorted(starts, start_ms, side="left")), n1)
+        # epochs starting within the range all overlap it, the earlier ones only when they end in it
+        n0 = int(np.searchsorted(starts, start_ms - self.max_len, side="left"))
+        if m - n0 <= SCAN_LIMIT:
+            before = np.flatnonzero(self._ends[n0:m] >= start_ms) + n0
+        else:
+            before = self._ending_after(start_ms, m)
+        return before.tolist() + list(range(m, n1))
+
+    def containing(self, time_ms):
+        """Positions of the epochs with start <= time_ms <= end."""
+        return self.overlapping(time_ms, time_ms)
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+# Bulk transforms of the epochs of one behavior. Each takes the start and end columns
+# (end == start for Events) and returns new columns, sorted by start.
+
+
+def shift_epochs(starts, ends, offset_ms: int):
+    return starts + int(offset_ms), ends + int(offset_ms)
+
+
+def scale_epochs(starts, ends, factor: float, origin_ms: int = 0):
+    """Stretch times around origin_ms, e.g. to correct a clock drift between cameras."""
+    if factor <= 0:
+        raise ValueError(f"Scale factor must be positive, got {factor}")
+    scale = lambda t: origin_ms + np.round((t - origin_ms) * factor).astype(np.int64)
+    return scale(starts), scale(ends)
+
+
+def clip_epochs(starts, ends, start_ms: int, end_ms: int):
+    """Cut epochs to [start_ms, end_ms], the ones entirely outside are dropped."""
+    keep = (ends >= start_ms) & (starts <= end_ms)
+    return np.maximum(starts[keep], start_ms), np.minimum(ends[keep], end_ms)
+
+
+def snap_epochs(starts, ends, pts_ms):
+    """Move every onset and offset to the time of the nearest frame."""
+    pts_ms = np.asarray(pts_ms, dtype=np.float64)
+    if len(pts_ms) == 0:
+        raise ValueError("No frame times to snap to")
+    times = np.ceil(pts_ms).astype(np.int64) # as VideoIndex.time_of
+
+    def snap(t):
+        n = np.searchsorted(pts_ms, t)
+        lo, hi = np.clip(n - 1, 0, len(pts_ms) - 1), np.clip(n, 0, len(pts_ms) - 1)
+        return times[np.where(pts_ms[hi] - t < t - pts_ms[lo], hi, lo)]
+
+    return snap(starts), snap(ends)
+
+
+def merge_gaps(starts, ends, max_gap_ms: int):
+    """Merge bouts separated by at most max_gap_ms (overlapping bouts included)."""
+    if len(starts) == 0:
+        return starts, ends
+    reach = np.maximum.accumulate(ends)
+    first = np.flatnonzero(np.r_[True, starts[1:] - reach[:-1] > max_gap_ms])
+    return starts[first], np.maximum.reduceat(ends, first)
+
+
+def drop_short(starts, ends, min_ms: int):
+    """Remove bouts shorter than min_ms."""
+    keep = ends - starts >= min_ms
+    return starts[keep], ends[keep]
+
+
+# name -> (function, applies to Events too)
+EPOCH_OPS = {
+    "shift": (shift_epochs, True),
+    "scale": (scale_epochs, True),
+    "clip": (clip_epochs, True),
+    "snap": (snap_epochs, True),
+    "merge_gaps": (merge_gaps, False),
+    "drop_short": (drop_short, False)
+}
+
+
+def apply_op(op: str, starts, ends, point: bool = False, **params):
+    """Run the EPOCH_OPS entry op, returns None when it does not apply to Events and point is set."""
+    if op not in EPOCH_OPS:
+        raise ValueError(f"Unknown epoch operation {op}, expected one of {list(EPOCH_OPS)}")
+    fn, for_events = EPOCH_OPS[op]
+    if point and not for_events:
+        return None
+    starts, ends = fn(np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64), **params)
+    if point:
+        ends = starts
+    order = np.argsort(starts, kind="stable")
+    return starts[order], ends[order]
@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+
+
+class FrameCache:
+    """Thread-safe LRU cache of decoded frames bounded by a memory budget (bytes)."""
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.nbytes = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, frame_no: int):
+        with self._lock:
+            frame = self._frames.get(frame_no)
+            if frame is not None:
+                self._frames.move_to_end(frame_no)
+            return frame
+
+    def peek(self, frame_no: int):
+        # lookup without touching the LRU order (used by the decoder)
+        with self._lock:
+            return self._frames.get(frame_no)
+
+    def __contains__(self, frame_no: int):
+        with self._lock:
+            return frame_no in self._frames
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, frame_no: int, frame):
+        with self._lock:
+            old = self._frames.pop(frame_no, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._frames[frame_no] = frame
+            self.nbytes += frame.nbytes
+            while self.nbytes > self.budget_bytes and len(self._frames) > 1:
+                _, evicted = self._frames.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+
+class FrameRing:
+    """Fixed-size ring of decoded frames covering [center - behind, center + ahead].
+
+    A frame lives in slot frame_no % capacity, so slots stay unique for any window
+    of `capacity` consecutive frames and recentering never moves data.
+    """
+
+    def __init__(self, behind: int, ahead: int):
+        self._lock = threading.Lock()
+        self.center = 0
+        self.resize(behind, ahead)
+
+    def resize(self, behind: int, ahead: int):
+        with self._lock:
+            self.behind = max(behind, 0)
+            self.ahead = max(ahead, 0)
+            self.capacity = self.behind + self.ahead + 1
+            self._slots = [None] * self.capacity
+
+    def fit_budget(self, frame_nbytes: int, budget_bytes: int):
+        capacity = max(3, min(self.capacity, budget_bytes // max(frame_nbytes, 1)))
+        if capacity < self.capacity:
+            behind = (capacity - 1) * self.behind // (self.behind + self.ahead)
+            self.resize(behind, capacity - 1 - behind)
+
+    def set_direction(self, direction: int):
+        # keep the longer side of the window in the playback direction
+        with self._lock:
+            if (direction < 0) == (self.ahead > self.behind):
+                self.behind, self.ahead = self.ahead, self.behind
+
+    def recenter(self, frame_no: int):
+        self.center = frame_no
+
+    def in_window(self, frame_no: int):
+        return self.center - self.behind <= frame_no <= self.center + self.ahead
+
+    def put(self, frame_no: int, frame):
+        with self._lock:
+            if self.in_window(frame_no):
+                self._slots[frame_no % self.capacity] = (frame_no, frame)
+
+    def get(self, frame_no: int):
+        with self._lock:
+            item = self._slots[frame_no % self.capacity]
+        if item is not None and item[0] == frame_no:
+            return item[1]
+        return None
+
+    def next_missing(self, num_frames: int):
+        """Closest frame of the window that is not decoded yet, searched in playback direction first."""
+        with self._lock:
+            center, behind, ahead = self.center, self.behind, self.ahead
+            forward = range(center, center + ahead + 1)
+            backward = range(center - 1, center - behind - 1, -1)
+            order = (forward, backward) if ahead >= behind else (range(center, center - behind - 1, -1), forward[1:])
+            for frames in order:
+                for k in frames:
+                    if k < 0 or k >= num_frames:
+                        continue
+                    item = self._slots[k % self.capacity]
+                    if item is None or item[0] != k:
+                        return k
+        return None
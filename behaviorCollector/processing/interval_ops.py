@@ -0,0 +1,137 @@
+import numpy as np
+from .behav_container import BehavInfo, EVENT, EVENT_SPAN_MS
+from .epoch_ops import merge_gaps
+
+
+# Set operations on the epochs of behaviors. States are half-open intervals [start, end),
+# an Event at t covers [t, t + EVENT_SPAN_MS): it lies in a State starting at t but not in
+# one ending at t. Every operation sorts once and then works on whole columns,
+# O(n log n) in the number of epochs.
+
+
+def _columns(b):
+    if b.time_ms is None or len(b.time_ms) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.asarray(b.time_ms.starts), np.asarray(b.time_ms.ends)
+
+
+def _spans(b):
+    # half-open time covered by each epoch
+    starts, ends = _columns(b)
+    return starts, ends + EVENT_SPAN_MS if b.type == EVENT else ends
+
+
+def normalize(starts, ends):
+    """Disjoint intervals covering the same time, sorted by start (overlapping or touching ones merged)."""
+    if len(starts) == 0:
+        return starts, ends
+    order = np.argsort(starts, kind="stable")
+    return merge_gaps(starts[order], ends[order], 0)
+
+
+def _sweep(a, b, keep):
+    # segments between consecutive boundaries, labeled with a coverage mask (1: a, 2: b)
+    (sa, ea), (sb, eb) = normalize(*a), normalize(*b)
+    times = np.concatenate([sa, ea, sb, eb])
+    if len(times) == 0:
+        return times, times
+    delta = np.concatenate([np.ones(len(sa)), -np.ones(len(ea)), np.full(len(sb), 2), np.full(len(eb), -2)])
+    bounds, inverse = np.unique(times, return_inverse=True)
+    mask = np.cumsum(np.bincount(inverse, weights=delta)).astype(np.int64)[:-1]
+    selected = keep(mask)
+    # runs of selected segments become output intervals
+    edges = np.diff(np.r_[0, selected.astype(np.int8), 0])
+    first, last = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    return bounds[first], bounds[last]
+
+
+def _result(like, name, starts, ends):
+    # new behavior of the type and color of like, not part of any collector yet
+    b = BehavInfo(name=name, id=-1, note="", type=like.type, color_code=like.color_code, video_path=like.video_path)
+    b.extend(starts if like.type == EVENT else np.stack([starts, ends], axis=1))
+    return b
+
+
+def union(*behavs, name: str = None):
+    """Epochs covered by any of behavs, all States or all Events."""
+    if not behavs:
+        raise ValueError("Please give at least one behavior")
+    types = {b.type for b in behavs}
+    if len(types) > 1:
+        raise ValueError("Cannot take the union of States and Events")
+    cols = [_columns(b) for b in behavs]
+    starts, ends = np.concatenate([c[0] for c in cols]), np.concatenate([c[1] for c in cols])
+    name = name or " | ".join(b.name for b in behavs)
+    if types == {EVENT}:
+        starts = np.unique(starts)
+        return _result(behavs[0], name, starts, starts)
+    return _result(behavs[0], name, *normalize(starts, ends))
+
+
+def intersection(a, b, name: str = None):
+    """Time covered by both States, or the Events of a inside the States of b."""
+    name = name or f"{a.name} & {b.name}"
+    if a.type == EVENT:
+        return within(a, b, name=name)
+    if b.type == EVENT:
+        raise ValueError("The intersection of a State with Events is empty, use within(events, state)")
+    return _result(a, name, *_sweep(_columns(a), _columns(b), lambda mask: mask == 3))
+
+
+def difference(a, b, name: str = None):
+    """Time covered by a but not b, or the Events of a outside the States of b."""
+    name = name or f"{a.name} - {b.name}"
+    if a.type == EVENT:
+        return within(a, b, invert=True, name=name)
+    if b.type == EVENT:
+        return _result(a, name, *_columns(a)) # points do not remove time
+    return _result(a, name, *_sweep(_columns(a), _columns(b), lambda mask: mask == 1))
+
+
+def within(a, b, invert: bool = False, name: str = None):
+    """Epochs of a lying entirely inside the epochs of b (outside of them with invert)."""
+    starts, ends = _columns(a)
+    bs, be = normalize(*_spans(b))
+    # the interval of b starting last at or before an epoch is the only one that can hold it
+    n = np.searchsorted(bs, starts, side="right") - 1
+    inside = (n >= 0) & (_spans(a)[1] <= be[np.maximum(n, 0)]) if len(bs) > 0 else np.zeros(len(starts), dtype=bool)
+    keep = ~inside if invert else inside
+    name = name or f"{a.name} {'outside' if invert else 'within'} {b.name}"
+    return _result(a, name, starts[keep], ends[keep])
+
+
+def overlapping(a, b, invert: bool = False, name: str = None):
+    """Epochs of a sharing any time with the epochs of b (none with invert)."""
+    starts, ends = _columns(a)
+    bs, be = normalize(*_spans(b))
+    # the interval of b starting last before the end of an epoch is the only candidate
+    n = np.searchsorted(bs, _spans(a)[1], side="left") - 1
+    hit = (n >= 0) & (be[np.maximum(n, 0)] > starts) if len(bs) > 0 else np.zeros(len(starts), dtype=bool)
+    keep = ~hit if invert else hit
+    name = name or f"{a.name} {'apart from' if invert else 'overlapping'} {b.name}"
+    return _result(a, name, starts[keep], ends[keep])
+
+
+def overlap_durations(a, b):
+    """Time in ms each epoch of a shares with the epochs of b."""
+    starts, ends = _columns(a)
+    bs, be = normalize(*_columns(b))
+    if len(bs) == 0:
+        return np.zeros(len(starts), dtype=np.int64)
+    covered = np.cumsum(be - bs)
+
+    def coverage(t):
+        # time of b before t
+        n = np.searchsorted(bs, t, side="right") - 1
+        safe = np.maximum(n, 0)
+        return np.where(n >= 0, covered[safe] - np.maximum(be[safe] - t, 0), 0)
+
+    return coverage(ends) - coverage(starts)
+
+
+def total_overlap(a, b):
+    """Time in ms covered by both States."""
+    if a.type == EVENT or b.type == EVENT:
+        return 0
+    starts, ends = _sweep(_columns(a), _columns(b), lambda mask: mask == 3)
+    return int((ends - starts).sum())
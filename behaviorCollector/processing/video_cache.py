@@ -0,0 +1,25 @@
+import hashlib
+import os
+
+
+CACHE_ENV = "BEHAV_COLLECTOR_CACHE"
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "behaviorCollector")
+
+
+def get_cache_dir(kind: str):
+    root = os.environ.get(CACHE_ENV, CACHE_ROOT)
+    path_dir = os.path.join(root, kind)
+    os.makedirs(path_dir, exist_ok=True)
+    return path_dir
+
+
+def video_cache_key(video_path: str):
+    # a re-encoded or replaced file gets a new key, stale entries are simply never hit again
+    st = os.stat(video_path)
+    ident = f"{os.path.abspath(video_path)}|{st.st_size}|{st.st_mtime_ns}"
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    return f"{name}_{hashlib.sha1(ident.encode()).hexdigest()[:16]}"
+
+
+def video_cache_path(video_path: str, kind: str, suffix: str = ""):
+    return os.path.join(get_cache_dir(kind), video_cache_key(video_path) + suffix)
@@ -0,0 +1,122 @@
+import cv2
+import os
+import numpy as np
+from .video_cache import video_cache_path
+
+
+INDEX_KIND = "index"
+PTS_SUFFIX = ".pts.npy"
+KEY_SUFFIX = ".key.npy"
+
+
+class VideoIndex:
+    """Presentation timestamp of every frame and keyframe positions of a single video.
+
+    Frame numbers follow presentation order. An empty keyframe array means the
+    keyframes are unknown and seeks fall back to the backend.
+    """
+
+    def __init__(self, pts_ms: np.ndarray, keyframes: np.ndarray):
+        self.pts_ms = pts_ms
+        self.keyframes = keyframes
+
+    @property
+    def num_frames(self):
+        return len(self.pts_ms)
+
+    @property
+    def duration_ms(self):
+        if self.num_frames == 0:
+            return 0
+        return int(self.pts_ms[-1] + self.frame_interval_ms)
+
+    @property
+    def frame_interval_ms(self):
+        if self.num_frames < 2:
+            return 0
+        return float(self.pts_ms[-1] - self.pts_ms[0]) / (self.num_frames - 1)
+
+    @property
+    def fps(self):
+        dt = self.frame_interval_ms
+        return 1e3 / dt if dt > 0 else 0
+
+    def frame_at(self, time_ms):
+        """Frame displayed at time_ms, i.e. the last frame whose timestamp is <= time_ms."""
+        n = int(np.searchsorted(self.pts_ms, time_ms, side="right")) - 1
+        return min(max(n, 0), self.num_frames - 1)
+
+    def time_of(self, frame: int):
+        # rounded up so that frame_at(time_of(n)) == n with integer ms positions
+        frame = min(max(frame, 0), self.num_frames - 1)
+        return int(np.ceil(self.pts_ms[frame]))
+
+    def step(self, time_ms, num_frames: int):
+        return self.time_of(self.frame_at(time_ms) + num_frames)
+
+    def keyframe_before(self, frame: int):
+        if len(self.keyframes) == 0:
+            return frame
+        n = int(np.searchsorted(self.keyframes, frame, side="right")) - 1
+        return int(self.keyframes[max(n, 0)])
+
+    def seek(self, cap, frame: int):
+        """Seek cap to the keyframe at or before frame, returns the frame number of the next grab()."""
+        key = self.keyframe_before(frame)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, key)
+        return key
+
+    def save(self, video_path: str):
+        base = video_cache_path(video_path, INDEX_KIND)
+        for suffix, arr in ((PTS_SUFFIX, self.pts_ms), (KEY_SUFFIX, self.keyframes)):
+            tmp = f"{base}{suffix}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, np.asarray(arr))
+            os.replace(tmp, base + suffix)
+
+    @staticmethod
+    def load(video_path: str):
+        """Memory-map a cached index, returns None when the video was not indexed yet."""
+        base = video_cache_path(video_path, INDEX_KIND)
+        if not (os.path.exists(base + PTS_SUFFIX) and os.path.exists(base + KEY_SUFFIX)):
+            return None
+        return VideoIndex(
+            pts_ms=np.load(base + PTS_SUFFIX, mmap_mode="r"),
+            keyframes=np.load(base + KEY_SUFFIX, mmap_mode="r")
+        )
+
+    @staticmethod
+    def load_or_build(video_path: str):
+        index = VideoIndex.load(video_path)
+        if index is None:
+            index = VideoIndex.build(video_path)
+            index.save(video_path)
+        return index
+
+    @staticmethod
+    def build(video_path: str):
+        # packet scan without decoding when the backend supports it, full decode otherwise
+        has_key = hasattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME")
+        cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1]) if has_key else None
+        if cap is None or not cap.isOpened():
+            has_key = False
+            cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Video {video_path} cannot be opened")
+
+        pts, is_key = [], []
+        while cap.grab():
+            pts.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+            if has_key:
+                is_key.append(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) > 0)
+        cap.release()
+
+        # packets arrive in decode order, frames are numbered in presentation order
+        pts = np.asarray(pts, dtype=np.float64)
+        order = np.argsort(pts, kind="stable")
+        if has_key:
+            keyframes = np.flatnonzero(np.asarray(is_key, dtype=bool)[order])
+        else:
+            keyframes = np.zeros(0, dtype=np.int64)
+
+        return VideoIndex(pts_ms=pts[order], keyframes=keyframes.astype(np.int64))
@@ -0,0 +1,89 @@
+import cv2
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from .video_cache import video_cache_path, video_cache_key
+
+
+META_KIND = "meta"
+PROBE_WORKERS = 4
+
+
+@dataclass
+class VideoMeta:
+    fps: float = 0
+    frame_count: int = 0
+    width: int = 0
+    height: int = 0
+    fourcc: str = ""
+
+    @property
+    def duration_ms(self):
+        return int(self.frame_count / self.fps * 1e3) if self.fps > 1e-3 else 0
+
+    @property
+    def frame_size(self):
+        return (self.width, self.height)
+
+
+_memory = {} # cache key -> VideoMeta
+_lock = threading.Lock()
+_pool = None
+
+
+def _read_meta(video_path: str):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Video {video_path} cannot be opened")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        code = int(cap.get(cv2.CAP_PROP_FOURCC))
+        return VideoMeta(
+            fps=fps if fps > 1e-3 else 0,
+            frame_count=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            fourcc="".join(chr((code >> 8 * k) & 0xFF) for k in range(4)).strip("\x00")
+        )
+    finally:
+        cap.release()
+
+
+def probe_video(video_path: str):
+    """VideoMeta of video_path, read from the in-memory or on-disk cache when the file is unchanged."""
+    key = video_cache_key(video_path)
+    with _lock:
+        meta = _memory.get(key)
+    if meta is not None:
+        return meta
+
+    path = video_cache_path(video_path, META_KIND, ".json")
+    meta = None
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                meta = VideoMeta(**json.load(f))
+        except (ValueError, TypeError):
+            meta = None # written by an older version, probed again
+
+    if meta is None:
+        meta = _read_meta(video_path)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(asdict(meta), f)
+        os.replace(tmp_path, path)
+
+    with _lock:
+        _memory[key] = meta
+    return meta
+
+
+def probe_video_async(video_path: str):
+    """Future of probe_video(video_path), run on a shared thread pool."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix="video-probe")
+    return _pool.submit(probe_video, video_path)
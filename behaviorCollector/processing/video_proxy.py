@@ -0,0 +1,96 @@
+import cv2
+import os
+import numpy as np
+from .video_cache import video_cache_path
+
+
+PROXY_KIND = "proxy"
+PROXY_HEIGHT = 480
+PROXY_FOURCC = "MJPG" # intra-frame only, every proxy frame can be decoded on its own
+PROXY_SUFFIX = ".avi"
+
+
+def get_proxy_path(video_path: str):
+    return video_cache_path(video_path, PROXY_KIND, PROXY_SUFFIX)
+
+
+def find_proxy(video_path: str):
+    path = get_proxy_path(video_path)
+    return path if os.path.exists(path) else None
+
+
+def build_proxy(video_path: str, max_height=PROXY_HEIGHT, progress_fn=None, stop_event=None):
+    """Transcode video_path to a low-resolution intra-frame proxy in the cache.
+
+    The proxy keeps the frame count and nominal frame rate of the original, so proxy
+    frame k is original frame k. Returns the proxy path, or None when stopped early.
+    """
+    path = get_proxy_path(video_path)
+    if os.path.exists(path):
+        return path
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Video {video_path} cannot be opened")
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    scale = min(1, max_height / height) if height > 0 else 1
+    size = (int(width * scale) // 2 * 2, int(height * scale) // 2 * 2)
+
+    # written under a temporary name, an interrupted build is started over next time
+    tmp_path = path + ".partial" + PROXY_SUFFIX
+    writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*PROXY_FOURCC), fps if fps > 1e-3 else 30, size)
+    n = 0
+    try:
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                return None
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if scale < 1:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            writer.write(frame)
+            n += 1
+            if progress_fn is not None and total > 0 and n % 100 == 0:
+                progress_fn(n / total)
+    finally:
+        writer.release()
+        cap.release()
+        if stop_event is not None and stop_event.is_set() and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    os.replace(tmp_path, path)
+    if progress_fn is not None:
+        progress_fn(1.0)
+    return path
+
+
+class ProxyTimebase:
+    """Maps positions between a proxy played by time and the original video timebase."""
+
+    def __init__(self, proxy_fps: float, index=None, fps: float = None):
+        if proxy_fps <= 0 or (fps is not None and fps <= 0):
+            raise ValueError(f"Frame rates must be positive, got {proxy_fps} and {fps}")
+        self.proxy_fps = proxy_fps
+        self.index = index # VideoIndex of the original video, if available
+        self.fps = fps if fps else proxy_fps
+
+    def _source_time(self, frame):
+        if self.index is not None:
+            return self.index.time_of(frame)
+        return int(np.ceil(frame * 1000 / self.fps))
+
+    def _source_frame(self, time_ms):
+        if self.index is not None:
+            return self.index.frame_at(time_ms)
+        return int(time_ms * self.fps / 1000)
+
+    def to_source(self, proxy_ms):
+        return self._source_time(int(proxy_ms * self.proxy_fps / 1000))
+
+    def to_proxy(self, source_ms):
+        return int(np.ceil(self._source_frame(source_ms) * 1000 / self.proxy_fps))
@@ -0,0 +1,129 @@
+import cv2
+import os
+import numpy as np
+from .video_cache import video_cache_path
+from .video_index import VideoIndex
+from .video_meta import probe_video
+
+
+THUMB_KIND = "thumbs"
+THUMB_STRIDE_MS = 1000
+THUMB_HEIGHT = 72
+FLUSH_EVERY = 50 # thumbnails between flushes, at most this many are redone after an interruption
+
+
+def _open_memmap(path, dtype, shape, reuse=True):
+    # (array, reused), created as zeros when missing, unreadable or of another shape
+    if reuse and os.path.exists(path):
+        try:
+            arr = np.lib.format.open_memmap(path, mode="r") # r+ would silently extend a truncated file
+            if arr.shape == shape and arr.dtype == dtype:
+                return np.lib.format.open_memmap(path, mode="r+"), True
+        except (ValueError, OSError):
+            pass
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape), False
+
+
+def _fill_order(num):
+    # coarse to fine (0, n/2, n/4, 3n/4, ...) so a partial run already covers the whole video
+    order, seen = [], np.zeros(num, dtype=bool)
+    step = 1 << max(num - 1, 1).bit_length()
+    while step >= 1:
+        for i in range(0, num, step):
+            if not seen[i]:
+                seen[i] = True
+                order.append(i)
+        step //= 2
+    return order
+
+
+class ThumbnailStore:
+    """Thumbnails sampled every stride_ms, stored as one memory-mapped array per video in the cache.
+
+    A separate `done` mask marks the thumbnails already generated, so generation
+    can be interrupted and resumed, and reopening a finished video costs nothing.
+    """
+
+    def __init__(self, video_path: str, stride_ms=THUMB_STRIDE_MS, height=THUMB_HEIGHT):
+        self.video_path = video_path
+        self.stride_ms = stride_ms
+
+        meta = probe_video(video_path)
+        num = max(int(np.ceil(meta.duration_ms / stride_ms)), 1)
+        self.size = (max(int(meta.width * height / max(meta.height, 1)), 1), height) # (w, h)
+
+        base = video_cache_path(video_path, THUMB_KIND, f"_{stride_ms}_{height}")
+        self.thumbs, reused = _open_memmap(base + ".npy", np.dtype(np.uint8), (num, height, self.size[0], 3))
+        # the mask only holds for the thumbnails it was written with
+        self.done, _ = _open_memmap(base + ".done.npy", np.dtype(bool), (num,), reuse=reused)
+        self.ready = np.array(self.done) # in-memory view, ahead of `done` until the next flush
+        self._pending = []
+
+    @property
+    def num(self):
+        return len(self.done)
+
+    @property
+    def complete(self):
+        return bool(self.ready.all())
+
+    def nearest(self, time_ms):
+        """(time_ms, thumbnail) of the generated thumbnail closest to time_ms, or None."""
+        done = np.flatnonzero(self.ready)
+        if len(done) == 0:
+            return None
+        i = min(max(int(round(time_ms / self.stride_ms)), 0), self.num - 1)
+        if not self.ready[i]:
+            n = np.searchsorted(done, i)
+            candidates = done[max(n - 1, 0):n + 1]
+            i = int(candidates[np.argmin(np.abs(candidates - i))])
+        return i * self.stride_ms, self.thumbs[i]
+
+    def generate(self, stop_event=None, progress_fn=None):
+        """Fill in missing thumbnails, returns True when the store is complete."""
+        missing = [i for i in _fill_order(self.num) if not self.ready[i]]
+        if not missing:
+            return True
+
+        index = VideoIndex.load(self.video_path)
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            for n, i in enumerate(missing):
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                frame = self._read_frame(cap, index, i * self.stride_ms)
+                if frame is not None:
+                    self.thumbs[i] = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+                self.ready[i] = True
+                self._pending.append(i)
+                if (n + 1) % FLUSH_EVERY == 0:
+                    self.flush()
+                    if progress_fn is not None:
+                        progress_fn((n + 1) / len(missing))
+        finally:
+            self.flush()
+            cap.release()
+        return True
+
+    def flush(self):
+        # thumbnails first, a thumbnail is only marked done on disk once its pixels are written
+        self.thumbs.flush()
+        self.done[self._pending] = True
+        self.done.flush()
+        self._pending = []
+
+    @staticmethod
+    def _read_frame(cap, index, time_ms):
+        if index is None:
+            cap.set(cv2.CAP_PROP_POS_MSEC, time_ms)
+            ret, frame = cap.read()
+            return frame if ret else None
+
+        target = index.frame_at(time_ms)
+        k = index.seek(cap, target)
+        while k < target:
+            if not cap.grab():
+                return None
+            k += 1
+        ret, frame = cap.read()
+        return frame if ret else None
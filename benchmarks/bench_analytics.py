@@ -0,0 +1,78 @@
+"""Time of the vectorized behavior analytics over many sessions, against a per-behavior loop.
+
+    python -m benchmarks.bench_analytics [--sessions 300] [--epochs 20000]
+"""
+import argparse
+import time
+import numpy as np
+from behaviorCollector.processing.behav_container import BehavInfo, EVENT, STATE
+from behaviorCollector.processing.behav_analytics import (
+    EpochTable, behavior_stats, transition_matrix, ethogram
+)
+
+
+NUM_BEHAVIORS = 10
+SESSION_MS = 3600 * 1000
+
+
+def make_sessions(num_sessions, num_epochs, seed=0):
+    rng = np.random.default_rng(seed)
+    sessions = {}
+    size = num_epochs // NUM_BEHAVIORS
+    for s in range(num_sessions):
+        behav_set = []
+        for n in range(NUM_BEHAVIORS):
+            tp = EVENT if n % 2 == 0 else STATE
+            starts = np.sort(rng.integers(0, SESSION_MS, size))
+            times = starts if tp == EVENT else np.stack([starts, starts + rng.integers(100, 5000, size)], axis=1)
+            behav_set.append(BehavInfo(name=f"behav{n}", id=n, note="", type=tp, color_code="#ff0000", time_ms=times))
+        sessions[f"session{s:03d}"] = behav_set
+    return sessions
+
+
+def loop_stats(sessions):
+    # what the analysis scripts did before: one pass per behavior in Python
+    rows = []
+    for name, behav_set in sessions.items():
+        for b in behav_set:
+            times = [[t, t] if b.type == EVENT else t for t in b.time_ms]
+            durations = [t1 - t0 for t0, t1 in times]
+            ibi = [times[k + 1][0] - times[k][1] for k in range(len(times) - 1)]
+            rows.append((name, b.name, len(times), sum(durations), sum(durations) / len(times),
+                         times[0][0], sum(ibi) / len(ibi)))
+    return rows
+
+
+def timeit(fn):
+    t0 = time.perf_counter()
+    res = fn()
+    return time.perf_counter() - t0, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--epochs", type=int, default=20000, help="epochs per session")
+    parser.add_argument("--loop-sessions", type=int, default=20, help="sessions timed with the Python loop")
+    args = parser.parse_args()
+
+    sessions = make_sessions(args.sessions, args.epochs)
+    total = args.sessions * args.epochs
+    print(f"{args.sessions} sessions, {NUM_BEHAVIORS} behaviors, {total} epochs")
+
+    t_table, table = timeit(lambda: EpochTable(sessions))
+    t_stats, stats = timeit(lambda: behavior_stats(table))
+    t_trans, _ = timeit(lambda: transition_matrix(table, per_session=True))
+    t_etho, _ = timeit(lambda: ethogram(table))
+    print(f"flatten {t_table:7.3f} s | stats {t_stats:7.3f} s | transitions {t_trans:7.3f} s | "
+          f"per-minute ethogram {t_etho:7.3f} s | total {t_table + t_stats + t_trans + t_etho:7.3f} s")
+
+    subset = dict(list(sessions.items())[:args.loop_sessions])
+    t_loop, rows = timeit(lambda: loop_stats(subset))
+    assert [r[2:4] for r in rows] == stats[["count", "total_ms"]][:len(rows)].tolist()
+    print(f"Python loop stats on {len(subset)} sessions {t_loop:7.3f} s "
+          f"(~{t_loop * args.sessions / len(subset):.1f} s for all sessions)")
+
+
+if __name__ == "__main__":
+    main()
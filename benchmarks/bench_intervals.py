@@ -0,0 +1,48 @@
+"""Time of the interval set operations on behaviors with many epochs.
+
+    python -m benchmarks.bench_intervals [--epochs 100000]
+"""
+import argparse
+import time
+import numpy as np
+from behaviorCollector.processing.behav_container import BehavInfo, EVENT, STATE
+from behaviorCollector.processing import interval_ops
+
+
+SESSION_MS = 10 * 3600 * 1000
+
+
+def make_behav(name, tp, num_epochs, seed):
+    rng = np.random.default_rng(seed)
+    starts = np.sort(rng.integers(0, SESSION_MS, num_epochs))
+    times = starts if tp == EVENT else np.stack([starts, starts + rng.integers(100, 5000, num_epochs)], axis=1)
+    return BehavInfo(name=name, id=seed, note="", type=tp, color_code="#ff0000", video_path=[], time_ms=times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--epochs", type=int, default=100000)
+    args = parser.parse_args()
+
+    a = make_behav("a", STATE, args.epochs, 0)
+    b = make_behav("b", STATE, args.epochs, 1)
+    c = make_behav("c", STATE, args.epochs, 2)
+    points = make_behav("p", EVENT, args.epochs, 3)
+    queries = {
+        "union of 3": lambda: interval_ops.union(a, b, c),
+        "intersection": lambda: interval_ops.intersection(a, b),
+        "difference": lambda: interval_ops.difference(a, b),
+        "events within": lambda: interval_ops.within(points, a),
+        "overlapping": lambda: interval_ops.overlapping(a, b),
+        "overlap durations": lambda: interval_ops.overlap_durations(a, b),
+        "total overlap": lambda: interval_ops.total_overlap(a, b)
+    }
+    print(f"{args.epochs} epochs per behavior")
+    for label, fn in queries.items():
+        t0 = time.perf_counter()
+        fn()
+        print(f"{label:>18} {(time.perf_counter() - t0) * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
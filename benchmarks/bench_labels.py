@@ -0,0 +1,69 @@
+"""Round trip of behaviors through a bit-packed frame label matrix.
+
+    python -m benchmarks.bench_labels [--minutes 120] [--fps 60] [--behaviors 18]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from behaviorCollector.processing.behav_container import BehavInfo, EVENT, STATE
+from behaviorCollector.processing.behav_labels import (
+    rasterize, save_labels, load_labels, decode_labels, import_labels
+)
+
+
+def make_behav_set(num_behaviors, duration_ms, epochs_per_behavior, seed=0):
+    rng = np.random.default_rng(seed)
+    behav_set = []
+    for n in range(num_behaviors):
+        tp = EVENT if n % 3 == 0 else STATE
+        starts = np.sort(rng.integers(0, duration_ms, epochs_per_behavior))
+        times = starts if tp == EVENT else np.stack([starts, starts + rng.integers(50, 10000, epochs_per_behavior)], axis=1)
+        behav_set.append(BehavInfo(name=f"behav{n}", id=n, note="", type=tp, color_code="#ff0000", time_ms=times))
+    return behav_set
+
+
+def timeit(fn):
+    t0 = time.perf_counter()
+    res = fn()
+    return time.perf_counter() - t0, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=120)
+    parser.add_argument("--fps", type=float, default=60)
+    parser.add_argument("--behaviors", type=int, default=18)
+    parser.add_argument("--epochs", type=int, default=2000, help="epochs per behavior")
+    args = parser.parse_args()
+
+    num_frames = int(args.minutes * 60 * args.fps)
+    pts_ms = np.arange(num_frames) * (1e3 / args.fps)
+    behav_set = make_behav_set(args.behaviors, int(pts_ms[-1]), args.epochs)
+    print(f"{num_frames} frames x {args.behaviors} behaviors, {args.behaviors * args.epochs} epochs")
+
+    root = tempfile.mkdtemp()
+    try:
+        file_name = os.path.join(root, "session.labels.npz")
+        t_raster, labels = timeit(lambda: rasterize(behav_set, pts_ms))
+        t_save, _ = timeit(lambda: save_labels(file_name, labels, pts_ms, behav_set))
+        t_load, (_, loaded, loaded_pts) = timeit(lambda: load_labels(file_name))
+        t_decode, _ = timeit(lambda: decode_labels(loaded, loaded_pts, [b.type for b in behav_set]))
+        assert np.array_equal(labels, loaded)
+
+        # epochs decoded from the matrix rasterize back to the same matrix
+        restored = import_labels(file_name)
+        assert np.array_equal(rasterize(restored, pts_ms), labels)
+
+        total = t_raster + t_save + t_load + t_decode
+        print(f"rasterize {t_raster:6.3f} s | save {t_save:6.3f} s | load {t_load:6.3f} s | "
+              f"decode {t_decode:6.3f} s | round trip {total:6.3f} s | "
+              f"{os.path.getsize(file_name) / 1e6:.2f} MB on disk")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
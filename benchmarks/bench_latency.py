@@ -0,0 +1,109 @@
+"""Time from an annotation key press to the repainted behavior timeline, against one 60 Hz frame.
+
+    python -m benchmarks.bench_latency [--epochs 100000 1000000] [--presses 200]
+
+A press is what the panel does for it: an epoch added to or deleted from the collector,
+which notifies the timeline bound to it. Timed until the timeline viewport has painted.
+
+Needs a display, or QT_QPA_PLATFORM=offscreen.
+"""
+import argparse
+import time
+import numpy as np
+from PyQt5.QtCore import QObject, QEvent
+from PyQt5.QtWidgets import QApplication
+
+FRAME_MS = 1000 / 60
+
+
+class PaintProbe(QObject):
+    """Counts the paint events of a widget."""
+    def __init__(self, widget):
+        super().__init__()
+        self.painted = 0
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            self.painted += 1
+        return False
+
+
+def make_collector(num_behaviors, duration_ms, num_epochs, rng):
+    from behaviorCollector.processing.behav_container import BehavCollector, EVENT, STATE
+    bcollector = BehavCollector()
+    bcollector.behav_set, bcollector.journal, bcollector.undo_stack = [], None, []
+    per_behavior = num_epochs // num_behaviors
+    for n in range(num_behaviors):
+        tp = EVENT if n % 2 else STATE
+        bcollector.add_behav(name=f"b{n}", note="", type=tp, color_code="#ff0000")
+        starts = np.sort(rng.integers(0, duration_ms, per_behavior))
+        bcollector.add_behav_times(n, starts if tp == EVENT else np.stack([starts, starts + 100], axis=1))
+    return bcollector
+
+
+def wait_paint(app, probe, timeout_s=5):
+    seen = probe.painted
+    t_stop = time.perf_counter() + timeout_s
+    while probe.painted == seen and time.perf_counter() < t_stop:
+        app.processEvents()
+
+
+def run(app, viewer, bcollector, span_ms, num_presses, rng):
+    viewer.set_zoom(span_ms)
+    probe = PaintProbe(viewer.viewport())
+    center = bcollector.behav_set[0].time_ms.starts[len(bcollector.behav_set[0].time_ms) // 2]
+    viewer.on_position_changed(int(center))
+    wait_paint(app, probe)
+
+    times = []
+    for n in range(num_presses):
+        # a State bout, an Event mark, then the bout deleted again, around the playhead;
+        # a press on empty time changes nothing and paints nothing
+        t0 = time.perf_counter()
+        if n % 3 == 0:
+            bout = int(center + rng.integers(-span_ms // 4, span_ms // 4))
+            bcollector.add_behav_time(0, [bout, bout + 500])
+        elif n % 3 == 1:
+            bcollector.add_behav_time(1, bout + 250)
+        else:
+            bcollector.delete_behav_time(bout + 100)
+        wait_paint(app, probe)
+        times.append((time.perf_counter() - t0) * 1e3)
+    viewer.viewport().removeEventFilter(probe)
+    return np.median(times), np.percentile(times, 99), np.max(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--epochs", type=int, nargs="+", default=[100000, 1000000], help="epochs of the 2-hour session")
+    parser.add_argument("--behaviors", type=int, default=10)
+    parser.add_argument("--presses", type=int, default=200)
+    parser.add_argument("--modes", nargs="+", default=None)
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])
+    from behaviorCollector.gui.behav_panel import BehavViewer
+    from behaviorCollector.gui.behav_viewer import RENDER_MODES
+    rng = np.random.default_rng(0)
+    duration_ms = 2 * 3600 * 1000
+    print(f"one frame: {FRAME_MS:.1f} ms")
+    for num_epochs in args.epochs:
+        bcollector = make_collector(args.behaviors, duration_ms, num_epochs, rng)
+        for mode in args.modes or RENDER_MODES:
+            viewer = BehavViewer(render_mode=mode)
+            viewer.resize(1200, 100)
+            viewer.show()
+            viewer.update_duration(duration_ms)
+            viewer.bind(bcollector)
+            for span_ms in (10e3, 10 * 60e3):
+                median, p99, worst = run(app, viewer, bcollector, span_ms, args.presses, rng)
+                print(f"{num_epochs:>8} epochs | {mode:>5} | {span_ms / 1e3:6.0f} s window | press to paint "
+                      f"{median:6.2f} ms median, {p99:6.2f} ms p99, {worst:6.2f} ms max")
+            bcollector.notifier.unsubscribe(viewer.on_behaviors_changed)
+            viewer.close()
+    app.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Save/load time of the JSON directory format against the single-file session format.
+
+    python -m benchmarks.bench_session [--sizes 1000 100000 1000000]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from behaviorCollector.processing.behav_container import BehavCollector, EVENT, STATE
+
+
+NUM_BEHAVIORS = 10
+
+
+def make_collector(num_epochs, seed=0):
+    rng = np.random.default_rng(seed)
+    bcollector = BehavCollector()
+    bcollector.behav_set = []
+    bcollector.video_path = ["cam0.mp4", "cam1.mp4"]
+    for n in range(NUM_BEHAVIORS):
+        tp = EVENT if n % 2 == 0 else STATE
+        bcollector.add_behav(name=f"behav{n}", note="", type=tp, color_code="#ff0000")
+        size = num_epochs // NUM_BEHAVIORS
+        starts = np.sort(rng.integers(0, 3600 * 1000 * 10, size))
+        if tp == EVENT:
+            bcollector.add_behav_times(n, starts)
+        else:
+            bcollector.add_behav_times(n, np.stack([starts, starts + rng.integers(100, 5000, size)], axis=1))
+    return bcollector
+
+
+def timeit(fn):
+    t0 = time.perf_counter()
+    res = fn()
+    return time.perf_counter() - t0, res
+
+
+def reload(path, touch=True):
+    bcollector = BehavCollector()
+    bcollector.behav_set = []
+    bcollector = BehavCollector.load(path)
+    if touch:
+        for b in bcollector.behav_set:
+            b.time_ms.starts
+    return bcollector
+
+
+def path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def run(num_epochs, root):
+    bcollector = make_collector(num_epochs)
+    expected = [list(b.time_ms.starts[:5]) for b in bcollector.behav_set]
+
+    path_json = os.path.join(root, f"json_{num_epochs}")
+    os.makedirs(path_json)
+    t_json_save, _ = timeit(lambda: bcollector.save(path_json))
+    path_session = os.path.join(root, f"session_{num_epochs}.bcs")
+    t_session_save, _ = timeit(lambda: bcollector.save(path_session))
+
+    t_json_load, loaded = timeit(lambda: reload(path_json))
+    assert [list(b.time_ms.starts[:5]) for b in loaded.behav_set] == expected
+    t_session_load, loaded = timeit(lambda: reload(path_session))
+    assert [list(b.time_ms.starts[:5]) for b in loaded.behav_set] == expected
+    t_session_lazy, _ = timeit(lambda: reload(path_session, touch=False))
+
+    print(f"{num_epochs:>9} epochs | "
+          f"JSON save {t_json_save:8.3f} s load {t_json_load:8.3f} s {path_size(path_json)/1e6:8.2f} MB | "
+          f"session save {t_session_save:7.3f} s load {t_session_load:7.3f} s "
+          f"(header only {t_session_lazy*1e3:6.2f} ms) {path_size(path_session)/1e6:7.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        for num_epochs in args.sizes:
+            run(num_epochs, root)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Paint time per frame of the behavior timeline, one line item per epoch against cached row paths.
+
+    python -m benchmarks.bench_timeline [--visible 10000 100000] [--frames 100] [--session-epochs 100000]
+
+Also times zooming from one frame to the whole session and panning at a few zoom levels.
+
+Needs a display, or QT_QPA_PLATFORM=offscreen.
+"""
+import argparse
+import time
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+
+def make_epochs(num_behaviors, duration_ms, num_epochs, rng):
+    # State-like epochs spread evenly over the session, split among the behaviors
+    per_behavior = num_epochs // num_behaviors
+    epochs = []
+    for _ in range(num_behaviors):
+        starts = np.sort(rng.integers(0, duration_ms, per_behavior))
+        epochs.append((starts, starts + rng.integers(5, 200, per_behavior)))
+    return epochs
+
+
+def run(viewer_cls, mode, epochs, duration_ms, num_frames, step_ms):
+    viewer = viewer_cls(render_mode=mode)
+    viewer.resize(1200, 100)
+    viewer.show()
+    viewer.update_duration(duration_ms)
+    t0 = time.perf_counter()
+    for key_id, (starts, ends) in enumerate(epochs):
+        viewer.set_items(key_id, "#ff0000", starts, ends)
+    position = viewer.max_show_ms
+    viewer.on_position_changed(position)
+    viewer.viewport().grab()
+    t_first = time.perf_counter() - t0
+
+    # every frame paints the whole viewport, as after a jump or a resize
+    times = []
+    for n in range(num_frames):
+        t0 = time.perf_counter()
+        viewer.on_position_changed(position + (n + 1) * step_ms)
+        viewer.viewport().grab()
+        times.append(time.perf_counter() - t0)
+
+    # one epoch added and removed, the paths of the row are rebuilt where it lies
+    t0 = time.perf_counter()
+    middle = int(position + num_frames * step_ms)
+    viewer.add_item(0, "#ff0000", middle, middle + 100)
+    viewer.viewport().grab()
+    viewer.delete_item(0, middle, middle + 100)
+    viewer.viewport().grab()
+    t_edit = (time.perf_counter() - t0) / 2
+    viewer.close()
+    return t_first, np.median(times), np.max(times), t_edit
+
+
+def run_zoom(viewer_cls, mode, epochs, duration_ms, num_frames, min_show_ms):
+    viewer = viewer_cls(render_mode=mode)
+    viewer.resize(1200, 100)
+    viewer.show()
+    viewer.update_duration(duration_ms)
+    for key_id, (starts, ends) in enumerate(epochs):
+        viewer.set_items(key_id, "#ff0000", starts, ends)
+    viewer.on_position_changed(duration_ms // 2)
+
+    def frame(fn):
+        t0 = time.perf_counter()
+        fn()
+        viewer.viewport().grab()
+        viewer.minimap.grab()
+        return time.perf_counter() - t0
+
+    spans = np.geomspace(min_show_ms, duration_ms, num_frames)
+    zoom = [frame(lambda: viewer.set_zoom(span)) for span in np.r_[spans, spans[::-1]]]
+    print(f"{mode:>5} | zoom one frame <-> session {np.median(zoom) * 1e3:7.2f} ms median, {np.max(zoom) * 1e3:7.2f} ms max")
+    for span in spans[::max(num_frames // 4, 1)]:
+        viewer.set_zoom(span)
+        pan = [frame(lambda: viewer.pan_to(duration_ms // 2 + n * span / 10)) for n in range(num_frames // 4)]
+        print(f"{mode:>5} | pan at {span / 1e3:9.2f} s window {np.median(pan) * 1e3:7.2f} ms median, "
+              f"{np.max(pan) * 1e3:7.2f} ms max")
+    viewer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--visible", type=int, nargs="+", default=[10000, 100000], help="epochs in the visible window")
+    parser.add_argument("--behaviors", type=int, default=10)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--modes", nargs="+", default=None)
+    parser.add_argument("--session-epochs", type=int, default=100000, help="epochs of the 2-hour session zoomed over")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])
+    from behaviorCollector.gui.behav_panel import BehavViewer
+    from behaviorCollector.gui.behav_viewer import RENDER_MODES, MIN_SHOW_MS
+    rng = np.random.default_rng(0)
+    for num_visible in args.visible:
+        window_ms = 10e3 # BehavViewer.max_show_ms
+        duration_ms = int(3 * window_ms) # the visible window and the margin rendered on each side
+        epochs = make_epochs(args.behaviors, duration_ms, 3 * num_visible, rng)
+        for mode in args.modes or RENDER_MODES:
+            t_first, t_median, t_max, t_edit = run(BehavViewer, mode, epochs, duration_ms, args.frames,
+                                                   step_ms=window_ms / args.frames)
+            print(f"{num_visible:>7} visible | {mode:>5} | first paint {t_first * 1e3:8.1f} ms | "
+                  f"frame median {t_median * 1e3:7.2f} ms, max {t_max * 1e3:7.2f} ms | "
+                  f"add/delete {t_edit * 1e3:7.2f} ms")
+
+    duration_ms = 2 * 3600 * 1000
+    epochs = make_epochs(args.behaviors, duration_ms, args.session_epochs, rng)
+    print(f"{args.session_epochs} epochs over 2 hours")
+    for mode in args.modes or RENDER_MODES:
+        run_zoom(BehavViewer, mode, epochs, duration_ms, args.frames, MIN_SHOW_MS)
+    app.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,7 @@ def setup_package():
         entry_points={
             "console_scripts": [
                 "collect_behavior = behaviorCollector.main:main",
+                "collect_behavior_batch = behaviorCollector.cli:main",
             ],
         },
     )